@@ -0,0 +1,95 @@
+"""Пропускная способность записи ответов на SQLite: профиль по умолчанию
+против WAL/pragma-профиля с единственным писателем.
+
+Каждый «колбэк» повторяет работу process_answer: читает id
+пользователя и записывает ответ через record_answer из handlers/quiz.py.
+
+Запуск из корня проекта:
+    python -m bench.answer_throughput --answers 3000 --concurrency 50
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from db import Base, User, SingleWriter, make_engine
+from handlers.quiz import record_answer
+
+
+QUESTION = {'id': 1, 'options': ['a', 'b', 'c', 'd'], 'answer': 'a'}
+TOPICS = ['movies', 'cities', 'music', 'sport']
+
+
+async def run_profile(name, tuned, args):
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = make_engine(f'sqlite+aiosqlite:///{path}', tuned=tuned)
+    session_factory = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    writer = SingleWriter(session_factory, enabled=tuned)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User), [
+            {'id': i, 'tg_id': 10_000_000 + i, 'score': 0, 'streak': 0, 'games_played': 0}
+            for i in range(1, args.users + 1)
+        ])
+
+    rng = random.Random(args.seed)
+    # Уникальные (пользователь, вопрос, тема), чтобы каждый ответ записывался
+    jobs = [
+        (rng.randint(1, args.users), dict(QUESTION, id=n), rng.choice(TOPICS))
+        for n in range(args.answers)
+    ]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    errors = 0
+    latencies = []
+
+    async def callback(tg_id, q, topic):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                async with session_factory() as session:
+                    user_id = (await session.execute(
+                        select(User.id).where(User.tg_id == tg_id)
+                    )).scalar_one()
+                await writer.run(record_answer, user_id, topic, q, rng.choice(q['options']))
+            except OperationalError:
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        callback(10_000_000 + uid, q, topic) for uid, q, topic in jobs
+    ])
+    elapsed = time.perf_counter() - started
+    await writer.close()
+    await engine.dispose()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1] * 1000
+    print(
+        f'{name:8s} {args.answers / elapsed:8.1f} answers/s  '
+        f'p50={latencies[len(latencies) // 2] * 1000:.1f} ms  p99={p99:.1f} ms  '
+        f'locked errors={errors}'
+    )
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--answers', type=int, default=3000)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    await run_profile('default', False, args)
+    await run_profile('tuned', True, args)
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""Пиковая память рассылки в зависимости от числа пользователей.
+
+Создаёт отдельную SQLite-базу, заполняет её пользователями и для
+каждого размера измеряет (tracemalloc) пик памяти:
+  * load_all — прежний способ: select(User).scalars().all() до отправки;
+  * stream  — send_topic_question целиком (чтение получателей пачками,
+    планирование, очередь рассылки, чекпоинты) с отправкой-заглушкой.
+
+Запуск из корня проекта:
+    python -m bench.broadcast_memory --users 100000 1000000
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+# Модули бота берут базу из окружения при импорте
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{PATH}'
+os.environ.setdefault('BOT_TOKEN', '0:bench')
+
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+
+import main  # noqa: E402
+from db import SessionLocal, User, init_db  # noqa: E402
+from services.broadcast import Broadcaster  # noqa: E402
+from services.questions import TOPICS  # noqa: E402
+
+
+TIMEZONES = ['Europe/Moscow', 'Europe/Moscow', 'Asia/Yekaterinburg', 'Europe/Kaliningrad']
+
+
+def seed(start, end, chunk=50_000):
+    engine = create_engine(f'sqlite:///{PATH}')
+    with engine.begin() as conn:
+        for low in range(start, end, chunk):
+            conn.execute(insert(User), [
+                {
+                    'id': i, 'tg_id': 10_000_000 + i, 'lang': 'ru' if i % 3 else 'en',
+                    'timezone': TIMEZONES[i % len(TIMEZONES)],
+                    'score': 0, 'streak': 0, 'games_played': 0,
+                }
+                for i in range(low + 1, min(low + chunk, end) + 1)
+            ])
+    engine.dispose()
+
+
+async def measure(coro_factory):
+    tracemalloc.start()
+    started = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak / 2 ** 20, elapsed
+
+
+async def load_all():
+    async with SessionLocal() as session:
+        users = (await session.execute(select(User))).scalars().all()
+    return len(users)
+
+
+async def run(sizes, skip_load_all):
+    await init_db()
+    main.question_bank.load_all()
+    sent = 0
+
+    async def fake_send(bot, chat_id, topic, lang, q):
+        nonlocal sent
+        sent += 1
+
+    main.send_question = fake_send
+    main.broadcaster = Broadcaster(rate=1e9, per_chat_interval=0, progress_every=10 ** 9)
+
+    seeded = 0
+    for index, size in enumerate(sorted(sizes)):
+        seed(seeded, size)
+        seeded = size
+        if not skip_load_all:
+            peak, elapsed = await measure(load_all)
+            print(f'{size:>9} users  load_all  peak={peak:8.1f} MB  {elapsed:6.1f} s')
+        sent = 0
+        # Каждый размер — новая рассылка по новой теме, чтобы у всех были
+        # неотправленные вопросы
+        job, topic = f'bench_{size}', TOPICS[index % len(TOPICS)]
+        peak, elapsed = await measure(
+            lambda: main.send_topic_question(None, topic, job=job)
+        )
+        print(f'{size:>9} users  stream    peak={peak:8.1f} MB  {elapsed:6.1f} s  sent={sent}')
+    await main.db_writer.close()
+
+
+def cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, nargs='+', default=[100_000, 1_000_000])
+    parser.add_argument('--skip-load-all', action='store_true')
+    args = parser.parse_args()
+    print(f'Database: {PATH}')
+    asyncio.run(run(args.users, args.skip_load_all))
+
+
+if __name__ == '__main__':
+    cli()
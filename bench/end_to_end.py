@@ -0,0 +1,339 @@
+"""Сквозной бенчмарк: настоящий Dispatcher из main.py против локального
+заменителя Bot API.
+
+Поднимает aiohttp-сервер, который отвечает на методы Bot API как
+Telegram (sendMessage, sendPhoto, answerCallbackQuery, ...), создаёт бота
+через main.make_bot с этим сервером и диспетчер через
+main.build_dispatcher, затем проигрывает синтетические потоки апдейтов:
+
+  * start         — /start от новых пользователей;
+  * lang          — выбор языка (lang_ru / lang_en);
+  * menu_play     — кнопка «Играть»;
+  * quiz_answer   — ответы qa1:... (QuizAnswer);
+  * quiz_answer_legacy — ответы в старом формате quiz_answer_<тема>_<вариант>;
+  * rating        — кнопка рейтинга (menu_rating).
+
+Для каждого потока — апдейтов в секунду, p50/p99 обработки апдейта
+(dp.feed_update целиком: middleware, хендлер, запросы к Bot API) и
+запросов к БД на апдейт. Отдельный сценарий broadcast — полная
+send_topic_question на --broadcast-users пользователей.
+
+Результат — JSON в stdout (или в --output), чтобы сравнивать прогоны.
+
+Запуск из корня проекта:
+    python -m bench.end_to_end --users 500 --broadcast-users 5000
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import tempfile
+import time
+from collections import Counter
+
+PATH = os.path.join(tempfile.mkdtemp(), 'bench.db')
+# Модули бота берут базу и токен из окружения при импорте
+os.environ['DATABASE_URL'] = f'sqlite+aiosqlite:///{PATH}'
+os.environ.setdefault('BOT_TOKEN', '42:bench')
+
+from aiogram.client.session.aiohttp import AiohttpSession  # noqa: E402
+from aiogram.client.telegram import TelegramAPIServer  # noqa: E402
+from aiogram.dispatcher.event.bases import UNHANDLED  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from aiohttp import web  # noqa: E402
+from sqlalchemy import event, func, insert, select, true  # noqa: E402
+
+import main  # noqa: E402
+from db import SessionLocal, User, engine, init_db  # noqa: E402
+from keyboards.quiz import TOPIC_CODES, QuizAnswer  # noqa: E402
+from services.broadcast import Broadcaster  # noqa: E402
+
+BASE_TG_ID = 10_000_000
+
+
+class FakeBotAPI:
+    """Локальный Bot API: /bot<token>/<метод> → {"ok": true, "result": ...}.
+
+    latency — задержка ответа в секундах; чаты из blocked отвечают
+    403, как заблокировавшие бота пользователи.
+    """
+
+    def __init__(self, latency=0.0, blocked=frozenset()):
+        self.latency = latency
+        self.blocked = blocked
+        self.calls = Counter()
+        self.rejected = 0
+        self._message_id = 0
+        self._runner = None
+        self.url = None
+
+    async def start(self, host='127.0.0.1'):
+        app = web.Application()
+        app.router.add_post('/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f'http://{host}:{port}'
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = await request.post()
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = params.get('chat_id')
+        if chat_id is not None and int(chat_id) in self.blocked:
+            self.rejected += 1
+            return web.json_response({
+                'ok': False, 'error_code': 403,
+                'description': 'Forbidden: bot was blocked by the user',
+            }, status=403)
+        return web.json_response({'ok': True, 'result': self.result(method, params)})
+
+    def result(self, method, params):
+        if method == 'getMe':
+            return {'id': 42, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+        # send*/edit* возвращают Message, остальные методы — True
+        if method.startswith(('send', 'edit')):
+            self._message_id += 1
+            message = {
+                'message_id': self._message_id,
+                'date': int(time.time()),
+                'chat': {'id': int(params['chat_id']), 'type': 'private'},
+            }
+            if method == 'sendPhoto':
+                message['photo'] = [{
+                    'file_id': f'photo{self._message_id}', 'file_unique_id': f'u{self._message_id}',
+                    'width': 1, 'height': 1,
+                }]
+                message['caption'] = params.get('caption')
+            elif 'text' in params:
+                message['text'] = params['text']
+            return message
+        return True
+
+
+class QueryCounter:
+    """Число SQL-запросов через engine из db.py (события SQLAlchemy)."""
+
+    def __init__(self, engine):
+        self.count = 0
+        event.listen(engine.sync_engine, 'before_cursor_execute', self._on_execute)
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+class UpdateFactory:
+    def __init__(self):
+        self._update_id = 0
+
+    def _next_id(self):
+        self._update_id += 1
+        return self._update_id
+
+    @staticmethod
+    def _user(tg_id):
+        return {'id': tg_id, 'is_bot': False, 'first_name': f'User {tg_id}', 'username': f'user{tg_id}'}
+
+    def _message(self, tg_id, text):
+        message = {
+            'message_id': self._next_id(),
+            'date': int(time.time()),
+            'chat': {'id': tg_id, 'type': 'private'},
+            'from': self._user(tg_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    def message(self, tg_id, text):
+        return {'update_id': self._next_id(), 'message': self._message(tg_id, text)}
+
+    def callback(self, tg_id, data):
+        return {
+            'update_id': self._next_id(),
+            'callback_query': {
+                'id': str(self._next_id()),
+                'from': self._user(tg_id),
+                'chat_instance': str(tg_id),
+                'data': data,
+                # Сообщение бота с кнопкой
+                'message': dict(self._message(tg_id, 'quiz'), **{'from': {
+                    'id': 42, 'is_bot': True, 'first_name': 'Bench',
+                }}),
+            },
+        }
+
+
+def percentile(values, share):
+    return values[max(int(len(values) * share) - 1, 0)] * 1000 if values else 0.0
+
+
+async def replay(dp, bot, queries, updates, concurrency):
+    """Проигрывает апдейты через dp.feed_update; апдейты одного пользователя — по порядку."""
+    by_user = {}
+    for tg_id, data in updates:
+        by_user.setdefault(tg_id, []).append(data)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    unhandled = 0
+    errors = Counter()
+
+    async def user_stream(items):
+        nonlocal unhandled
+        for data in items:
+            async with semaphore:
+                update = Update.model_validate(data, context={'bot': bot})
+                started = time.perf_counter()
+                try:
+                    result = await dp.feed_update(bot, update)
+                except Exception as e:
+                    # Ошибка хендлера — тоже результат замера, а не повод его прервать
+                    errors[type(e).__name__] += 1
+                    result = None
+                latencies.append(time.perf_counter() - started)
+                if result is UNHANDLED:
+                    unhandled += 1
+
+    queries_before = queries.count
+    started = time.perf_counter()
+    await asyncio.gather(*[user_stream(items) for items in by_user.values()])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'updates': len(latencies),
+        'unhandled': unhandled,
+        'errors': dict(errors),
+        'elapsed_s': round(elapsed, 3),
+        'updates_per_sec': round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        'p50_ms': round(percentile(latencies, 0.5), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'db_queries_per_update': round((queries.count - queries_before) / max(len(latencies), 1), 2),
+    }
+
+
+def scenarios(factory, tg_ids, rng):
+    """[(имя, [(tg_id, update)])] — потоки апдейтов в порядке проигрывания."""
+    bank = main.question_bank
+    langs = {tg_id: rng.choice(['ru', 'en']) for tg_id in tg_ids}
+
+    def answer(tg_id):
+        topic = rng.choice(['movies', 'cities'])
+        q = rng.choice(bank.get(topic, langs[tg_id]))
+        option = rng.randrange(len(q['options']))
+        return QuizAnswer(t=TOPIC_CODES[topic], l=langs[tg_id], q=q['id'], o=option).pack()
+
+    def legacy_answer(tg_id):
+        topic = rng.choice(['movies', 'cities'])
+        q = rng.choice(bank.get(topic, langs[tg_id]))
+        return f"quiz_answer_{topic}_{rng.choice(q['options'])}"
+
+    return [
+        ('start', [(t, factory.message(t, '/start')) for t in tg_ids]),
+        ('lang', [(t, factory.callback(t, f'lang_{langs[t]}')) for t in tg_ids]),
+        ('menu_play', [(t, factory.callback(t, 'menu_play')) for t in tg_ids]),
+        ('quiz_answer', [(t, factory.callback(t, answer(t))) for t in tg_ids for _ in range(3)]),
+        ('quiz_answer_legacy', [(t, factory.callback(t, legacy_answer(t))) for t in tg_ids]),
+        ('rating', [(t, factory.callback(t, 'menu_rating')) for t in tg_ids]),
+    ]
+
+
+async def broadcast_scenario(bot, api, queries, args):
+    first = args.users + 1
+    async with SessionLocal() as session:
+        await session.execute(insert(User), [
+            {'tg_id': BASE_TG_ID + i, 'lang': 'ru' if i % 3 else 'en', 'score': 0, 'streak': 0, 'games_played': 0}
+            for i in range(first, first + args.broadcast_users)
+        ])
+        await session.commit()
+        recipients = (await session.execute(
+            select(func.count()).select_from(User).where(User.is_reachable == true())
+        )).scalar_one()
+    main.broadcaster = Broadcaster(
+        rate=args.broadcast_rate, per_chat_interval=0, progress_every=10 ** 9
+    )
+    api.calls.clear()
+    api.rejected = 0
+    queries_before = queries.count
+    started = time.perf_counter()
+    await main.send_topic_question(bot, 'movies', job='bench_broadcast')
+    elapsed = time.perf_counter() - started
+    attempts = sum(count for method, count in api.calls.items() if method.startswith('send'))
+    return {
+        'recipients': recipients,
+        'delivered': attempts - api.rejected,
+        'blocked': api.rejected,
+        'elapsed_s': round(elapsed, 3),
+        'messages_per_sec': round(attempts / elapsed, 1) if elapsed else 0.0,
+        'api_calls': dict(api.calls),
+        'db_queries': queries.count - queries_before,
+    }
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    await init_db()
+    main.question_bank.load_all()
+    queries = QueryCounter(engine)
+    tg_ids = [BASE_TG_ID + i for i in range(1, args.users + 1)]
+    broadcast_ids = range(BASE_TG_ID + args.users + 1, BASE_TG_ID + args.users + args.broadcast_users + 1)
+    blocked = frozenset(t for t in broadcast_ids if rng.random() < args.blocked)
+    api = FakeBotAPI(latency=args.api_latency / 1000, blocked=blocked)
+    await api.start()
+    bot = main.make_bot(AiohttpSession(api=TelegramAPIServer.from_base(api.url)))
+    dp = main.build_dispatcher()
+    results = {
+        'config': {
+            'users': args.users, 'concurrency': args.concurrency, 'api_latency_ms': args.api_latency,
+            'broadcast_users': args.broadcast_users, 'blocked': args.blocked, 'seed': args.seed,
+            'database': engine.dialect.name,
+        },
+        'scenarios': {},
+    }
+    try:
+        for name, updates in scenarios(UpdateFactory(), tg_ids, rng):
+            api.calls.clear()
+            results['scenarios'][name] = await replay(dp, bot, queries, updates, args.concurrency)
+            results['scenarios'][name]['api_calls'] = dict(api.calls)
+        if args.broadcast_users:
+            results['broadcast'] = await broadcast_scenario(bot, api, queries, args)
+    finally:
+        await main.db_writer.close()
+        await bot.session.close()
+        await api.stop()
+    return results
+
+
+def cli():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='задержка ответа Bot API, мс')
+    parser.add_argument('--broadcast-users', type=int, default=5000)
+    parser.add_argument('--broadcast-rate', type=float, default=1e9, help='сообщений в секунду')
+    parser.add_argument('--blocked', type=float, default=0.0, help='доля заблокировавших бота')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='файл для JSON вместо stdout')
+    args = parser.parse_args()
+    # Логи рассылок и хендлеров в stderr только мешают замеру
+    logging.getLogger().setLevel(logging.WARNING)
+    results = asyncio.run(run(args))
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,175 @@
+"""Планы и время горячих запросов до и после составных индексов.
+
+Создаёт отдельную SQLite-базу, заполняет её синтетическими данными,
+выполняет горячие запросы без новых индексов (как в исходной схеме),
+затем создаёт индексы из db.py и повторяет замеры.
+
+Запуск из корня проекта:
+    python -m bench.query_plans --users 20000 --answers 500000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+
+from db import Base
+
+
+# Индексы, которых не было в исходной схеме
+NEW_INDEXES = {
+    'users': ['ix_users_medals_board', 'ix_users_timezone', 'ix_users_reachable_id'],
+    'answers': ['uq_answers_user_question_day', 'ix_answers_user_date', 'ix_answers_correct_date'],
+    'questions_sent': [
+        'uq_questions_sent_user_topic_question', 'ix_questions_sent_topic_user', 'ix_questions_sent_run_user',
+    ],
+    'score_aggregates': ['ix_score_aggregates_top'],
+    'broadcast_runs': ['uq_broadcast_runs_job_day_range'],
+}
+
+QUERIES = {
+    'answer_exists': (
+        'SELECT id FROM answers WHERE user_id = :uid AND question_id = :qid '
+        'AND topic = :topic AND answer_day = :day'
+    ),
+    'rating_day': (
+        'SELECT user_id, count(*) AS score FROM answers '
+        'WHERE is_correct = 1 AND date >= :start AND date <= :end '
+        'GROUP BY user_id ORDER BY score DESC LIMIT 10'
+    ),
+    'history': (
+        'SELECT * FROM answers WHERE user_id = :uid ORDER BY date DESC LIMIT 5'
+    ),
+    'sent_for_user': (
+        'SELECT question_id FROM questions_sent WHERE user_id = :uid AND topic = :topic'
+    ),
+    'sent_for_topic': (
+        'SELECT user_id, question_id FROM questions_sent WHERE topic = :topic'
+    ),
+    'served_in_run': (
+        'SELECT user_id FROM questions_sent WHERE run_id = :run AND user_id BETWEEN :uid AND :uid + 1000'
+    ),
+    'recipients_page': (
+        'SELECT id, tg_id FROM users WHERE is_reachable = 1 AND id > :uid ORDER BY id LIMIT 1000'
+    ),
+    'timezones': (
+        'SELECT DISTINCT timezone FROM users'
+    ),
+    'medals_board': (
+        'SELECT id FROM users WHERE medals_count > 0 '
+        'ORDER BY medals_count DESC, last_medal_at DESC LIMIT 10'
+    ),
+}
+
+TIMEZONES = ['Europe/Moscow', 'Europe/Samara', 'Asia/Yekaterinburg', 'Asia/Novosibirsk']
+
+TOPICS = ['movies', 'cities', 'music', 'sport']
+
+
+def seed(conn, users, answers, sent, rng):
+    now = datetime.now()
+    conn.execute(insert(Base.metadata.tables['users']), [
+        {
+            'id': i, 'tg_id': 10_000_000 + i, 'lang': 'ru',
+            'timezone': rng.choice(TIMEZONES),
+            'is_reachable': rng.random() < 0.95,
+            'medals_count': medals,
+            'last_medal_at': now - timedelta(days=rng.randint(0, 90)) if medals else None,
+        }
+        for i, medals in ((i, rng.choice([0, 0, 0, 1, 2, 3])) for i in range(1, users + 1))
+    ])
+    chunk = 50_000
+    for start in range(0, answers, chunk):
+        conn.execute(insert(Base.metadata.tables['answers']), [
+            {
+                'user_id': rng.randint(1, users),
+                'question_id': rng.randint(1, 200),
+                'topic': rng.choice(TOPICS),
+                'is_correct': rng.random() < 0.4,
+                'date': when,
+                'answer_day': when.date(),
+            }
+            for when in (
+                now - timedelta(minutes=rng.randint(0, 60 * 24 * 90))
+                for _ in range(min(chunk, answers - start))
+            )
+        ])
+    # Уникальный ключ ответа создаётся после заполнения — убираем повторы заранее
+    conn.execute(text(
+        'DELETE FROM answers WHERE id NOT IN (SELECT MIN(id) FROM answers'
+        ' GROUP BY user_id, question_id, topic, answer_day)'
+    ))
+    rows = {
+        (rng.randint(1, users), rng.choice(TOPICS), rng.randint(1, 200))
+        for _ in range(sent)
+    }
+    conn.execute(insert(Base.metadata.tables['questions_sent']), [
+        {'user_id': u, 'topic': t, 'question_id': q, 'sent_at': now, 'run_id': rng.randint(1, 60)}
+        for u, t, q in rows
+    ])
+
+
+def measure(conn, params, repeat):
+    report = {}
+    for name, sql in QUERIES.items():
+        plan = conn.execute(text('EXPLAIN QUERY PLAN ' + sql), params).fetchall()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            conn.execute(text(sql), params).fetchall()
+        elapsed = (time.perf_counter() - started) / repeat
+        report[name] = (elapsed, [row[-1] for row in plan])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--answers', type=int, default=500_000)
+    parser.add_argument('--sent', type=int, default=200_000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    engine = create_engine(f'sqlite:///{path}')
+    rng = random.Random(args.seed)
+    today = datetime.now().date()
+    params = {
+        'uid': args.users // 2,
+        'qid': 7,
+        'run': 7,
+        'topic': 'movies',
+        'day': today,
+        'start': datetime.combine(today, datetime.min.time()),
+        'end': datetime.combine(today, datetime.max.time()),
+    }
+    with engine.begin() as conn:
+        Base.metadata.create_all(conn)
+        for table, names in NEW_INDEXES.items():
+            for name in names:
+                conn.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        print(f'Seeding {path} ...')
+        seed(conn, args.users, args.answers, args.sent, rng)
+        conn.execute(text('ANALYZE'))
+    with engine.connect() as conn:
+        before = measure(conn, params, args.repeat)
+    with engine.begin() as conn:
+        for table in NEW_INDEXES:
+            for index in Base.metadata.tables[table].indexes:
+                index.create(conn, checkfirst=True)
+        conn.execute(text('ANALYZE'))
+    with engine.connect() as conn:
+        after = measure(conn, params, args.repeat)
+
+    for name in QUERIES:
+        (t0, plan0), (t1, plan1) = before[name], after[name]
+        print(f'\n{name}: {t0 * 1000:.2f} ms -> {t1 * 1000:.2f} ms')
+        print('  before: ' + ' | '.join(plan0))
+        print('  after:  ' + ' | '.join(plan1))
+
+
+if __name__ == '__main__':
+    main()
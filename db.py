@@ -1,30 +1,131 @@
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
 from sqlalchemy.orm import declarative_base, sessionmaker
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, BigInteger, String, Text, Date, DateTime, Boolean, ForeignKey, Index, event, select
+from sqlalchemy.pool import QueuePool
+import asyncio
 import os
 
 DATABASE_URL = os.getenv(
     'DATABASE_URL', 'sqlite+aiosqlite:///guessshotbot.db'
 )
 
-engine = create_async_engine(DATABASE_URL, echo=False, future=True)
+# Профиль SQLite: WAL позволяет читать параллельно с записью,
+# synchronous=NORMAL в WAL не теряет целостность при падении процесса
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # мс ожидания блокировки вместо "database is locked"
+    'cache_size': -64000,  # 64 МБ
+    'mmap_size': 268435456,  # 256 МБ
+    'temp_store': 'MEMORY',
+}
+SQLITE_TUNING = os.getenv('SQLITE_TUNING', '1') != '0'
+# Пул файловой SQLite (для :memory: — одно общее соединение)
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', '20'))
+SQLITE_MAX_OVERFLOW = int(os.getenv('SQLITE_MAX_OVERFLOW', '10'))
+
+
+def _set_sqlite_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+# Профиль PostgreSQL (asyncpg): пул соединений и кэш подготовленных запросов
+PG_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '10'))
+PG_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '20'))
+PG_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+PG_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+PG_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', '500'))
+
+
+def normalize_url(url):
+    """postgres:// и postgresql:// без драйвера — на asyncpg."""
+    for prefix in ('postgres://', 'postgresql://'):
+        if url.startswith(prefix):
+            return 'postgresql+asyncpg://' + url[len(prefix):]
+    return url
+
+
+def make_engine(url, tuned=SQLITE_TUNING):
+    url = normalize_url(url)
+    if url.startswith('postgresql'):
+        return create_async_engine(
+            url,
+            echo=False,
+            future=True,
+            pool_size=PG_POOL_SIZE,
+            max_overflow=PG_MAX_OVERFLOW,
+            pool_timeout=PG_POOL_TIMEOUT,
+            pool_recycle=PG_POOL_RECYCLE,
+            pool_pre_ping=True,
+            connect_args={'prepared_statement_cache_size': PG_STATEMENT_CACHE_SIZE},
+        )
+    if url.startswith('sqlite') and ':memory:' not in url and 'mode=memory' not in url:
+        engine = create_async_engine(
+            url,
+            echo=False,
+            future=True,
+            pool_size=SQLITE_POOL_SIZE,
+            max_overflow=SQLITE_MAX_OVERFLOW,
+        )
+    else:
+        engine = create_async_engine(url, echo=False, future=True)
+    if tuned and engine.dialect.name == 'sqlite':
+        event.listen(engine.sync_engine, 'connect', _set_sqlite_pragmas)
+    return engine
+
+
+def pool_capacity(engine):
+    """Сколько соединений пул engine выдаёт одновременно; None — без предела."""
+    pool = engine.sync_engine.pool
+    if not isinstance(pool, QueuePool) or pool._max_overflow < 0:
+        return None
+    return pool.size() + pool._max_overflow
+
+
+engine = make_engine(DATABASE_URL)
 SessionLocal = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+
+# Соединения, которые не должны занимать апдейты: db_writer, рассылки,
+# планировщик, хранилище FSM. Хендлер держит сессию апдейта и ждёт
+# db_writer — если апдейты разберут весь пул, запись не получит
+# соединения и всё встанет. Поэтому одновременных сессий апдейтов не
+# больше UPDATE_SESSIONS (см. UserContextMiddleware), а число воркеров
+# апдейтов по умолчанию выводится из него же.
+POOL_RESERVE = int(os.getenv('DB_POOL_RESERVE', '5'))
+_capacity = pool_capacity(engine)
+UPDATE_SESSIONS = None if _capacity is None else max(1, _capacity - POOL_RESERVE)
 Base = declarative_base()
 
 
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
-    tg_id = Column(Integer, unique=True, index=True, nullable=False)
+    tg_id = Column(BigInteger, unique=True, index=True, nullable=False)
     username = Column(String, nullable=True)
     lang = Column(String, default='ru')
     score = Column(Integer, default=0)
     streak = Column(Integer, default=0)
     games_played = Column(Integer, default=0)
-    medals = Column(String, default='')  # Список медалей через запятую
-    referrer_id = Column(Integer, nullable=True)  # ID пригласившего
+    medals = Column(String, default='')  # Медали через пробел — для показа, источник — user_medals
+    referrer_id = Column(BigInteger, nullable=True)  # ID пригласившего
     referrals_count = Column(Integer, default=0)  # Количество приглашённых
     timezone = Column(String, default='Europe/Moscow')  # Часовой пояс
+    medals_count = Column(Integer, default=0)  # Количество медалей (для топа ачивок)
+    last_medal_at = Column(DateTime, nullable=True)  # Когда получена последняя медаль
+    # False — бот заблокирован или чат удалён; снова True, когда пользователь напишет боту
+    is_reachable = Column(Boolean, nullable=False, default=True)
+    last_delivery_error = Column(String, nullable=True)  # 'forbidden', 'chat_not_found', ...
+
+    __table_args__ = (
+        Index('ix_users_medals_board', 'medals_count', 'last_medal_at'),
+        # Корзины часовых поясов для рассылок по местному времени
+        Index('ix_users_timezone', 'timezone'),
+        # Получатели рассылок: только доступные, keyset по id
+        Index('ix_users_reachable_id', 'is_reachable', 'id'),
+    )
 
 
 class Answer(Base):
@@ -35,6 +136,16 @@ class Answer(Base):
     topic = Column(String, nullable=False)  # 'movie' или 'city'
     is_correct = Column(Boolean, nullable=False)
     date = Column(DateTime, nullable=False)
+    answer_day = Column(Date)  # date.date(); ключ «один ответ на вопрос в день»
+
+    __table_args__ = (
+        # Повторный ответ за день отсекает сама вставка (ON CONFLICT DO NOTHING)
+        Index('uq_answers_user_question_day', 'user_id', 'question_id', 'topic', 'answer_day', unique=True),
+        # История и серии пользователя
+        Index('ix_answers_user_date', 'user_id', 'date'),
+        # Рейтинги за период: фильтр по (is_correct, date), группировка по user_id
+        Index('ix_answers_correct_date', 'is_correct', 'date', 'user_id'),
+    )
 
 
 class QuestionSent(Base):
@@ -44,8 +155,203 @@ class QuestionSent(Base):
     question_id = Column(Integer, nullable=False)
     topic = Column(String, nullable=False)
     sent_at = Column(DateTime, nullable=False)
+    run_id = Column(Integer, ForeignKey('broadcast_runs.id'))  # рассылка; None — «Играть»
+
+    __table_args__ = (
+        # Один и тот же вопрос не отправляется пользователю дважды;
+        # заодно покрывает выборку по (user_id, topic)
+        Index(
+            'uq_questions_sent_user_topic_question',
+            'user_id', 'topic', 'question_id',
+            unique=True,
+        ),
+        # Выборка отправленного по теме для всей рассылки
+        Index('ix_questions_sent_topic_user', 'topic', 'user_id', 'question_id'),
+        # Кому уже отправлено в рамках рассылки — при её продолжении
+        Index('ix_questions_sent_run_user', 'run_id', 'user_id'),
+    )
+
+
+class SchemaVersion(Base):
+    """Применённые миграции (см. migrations.py)."""
+    __tablename__ = 'schema_version'
+    version = Column(Integer, primary_key=True)
+    description = Column(String, nullable=False)
+    applied_at = Column(DateTime, nullable=False)
+
+
+class UserMedal(Base):
+    __tablename__ = 'user_medals'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    medal = Column(String, primary_key=True)  # Эмодзи медали
+    awarded_at = Column(DateTime, nullable=False)
+
+
+class ScoreAggregate(Base):
+    """Очки пользователя за период — для рейтингов дня/недели/месяца."""
+    __tablename__ = 'score_aggregates'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    period_type = Column(String, primary_key=True)  # 'day', 'week' или 'month'
+    period_key = Column(String, primary_key=True)  # '2024-05-01', '2024-W18', '2024-05'
+    score = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index('ix_score_aggregates_top', 'period_type', 'period_key', 'score'),
+    )
+
+
+class UserDayActivity(Base):
+    """Ответы пользователя за день — для серий 🐢 и 📆."""
+    __tablename__ = 'user_day_activity'
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    day = Column(Date, primary_key=True)
+    answers = Column(Integer, nullable=False, default=0)
+    correct = Column(Integer, nullable=False, default=0)
+
+
+class MediaFile(Base):
+    __tablename__ = 'media_files'
+    path = Column(String, primary_key=True)  # Локальный путь к картинке
+    sha256 = Column(String, nullable=False)  # Хэш содержимого файла
+    file_id = Column(String, nullable=False)  # file_id в Telegram
+    updated_at = Column(DateTime, nullable=False)
+
+
+class BroadcastRun(Base):
+    """Рассылка по расписанию: чекпоинт для продолжения после перезапуска."""
+    __tablename__ = 'broadcast_runs'
+    id = Column(Integer, primary_key=True)
+    job = Column(String, nullable=False)  # имя задачи в main.py
+    topic = Column(String, nullable=False)
+    run_day = Column(Date, nullable=False)
+    range_key = Column(String, nullable=False)  # 'all' или '<начало>-<конец>' по users.id
+    status = Column(String, nullable=False, default='running')  # 'running', 'done' или 'expired'
+    sent = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=False)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index('uq_broadcast_runs_job_day_range', 'job', 'run_day', 'range_key', unique=True),
+    )
+
+
+class FSMRecord(Base):
+    """Состояние FSM и его данные — см. services/fsm_storage.py."""
+    __tablename__ = 'fsm_states'
+    key = Column(String, primary_key=True)  # fsm:<bot_id>:<chat_id>:<user_id>
+    state = Column(String, nullable=True)
+    data = Column(Text, nullable=True)  # компактный JSON, None — пустой словарь
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+async def get_or_create_user(session, tg_id, username=None):
+    result = await session.execute(select(User).where(User.tg_id == tg_id))
+    user = result.scalar_one_or_none()
+    if user is None:
+        user = User(tg_id=tg_id, username=username)
+        session.add(user)
+        await session.flush()
+    return user
+
+
+def upsert_insert(table):
+    """insert() с поддержкой ON CONFLICT для текущего диалекта."""
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(table)
 
 
 async def init_db():
+    from migrations import run_migrations
     async with engine.begin() as conn:
+        # create_all создаёт только новые таблицы, изменения существующих —
+        # через миграции
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(run_migrations)
+
+
+class SingleWriter:
+    """Последовательная запись через одну задачу.
+
+    SQLite допускает одного писателя: параллельные транзакции ответов
+    упираются в блокировку. Здесь записи выстраиваются в очередь и
+    выполняются одной задачей, накопившиеся за раз — одной транзакцией
+    (один fsync на пачку). Чтение по-прежнему идёт параллельно через
+    обычные сессии.
+
+    Функция записи получает сессию и не делает commit сама. Если пачка
+    падает, она откатывается и функции повторяются по одной, поэтому
+    функция должна работать только через переданную сессию.
+    """
+
+    MAX_BATCH = 64
+
+    def __init__(self, session_factory, enabled=True):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self._queue = None
+        self._task = None
+
+    async def run(self, fn, *args):
+        if not self.enabled:
+            async with self.session_factory() as session:
+                result = await fn(session, *args)
+                await session.commit()
+                return result
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._loop())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((fn, args, future))
+        return await future
+
+    async def _loop(self):
+        batch = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.MAX_BATCH and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                try:
+                    results = await self._run_batch(batch)
+                except Exception:
+                    # Кто-то в пачке упал — повторяем по одному, чтобы не
+                    # терять записи остальных
+                    results = []
+                    for job in batch:
+                        try:
+                            results.extend(await self._run_batch([job]))
+                        except Exception as e:
+                            results.append(e)
+                for (_, _, future), result in zip(batch, results):
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+                batch = []
+        finally:
+            # Задачу отменили (close()) или она упала не на Exception —
+            # ждущие run() не должны висеть: отменяем всё, что не записано
+            while not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+
+    async def _run_batch(self, batch):
+        async with self.session_factory() as session:
+            results = [await fn(session, *args) for fn, args, _ in batch]
+            await session.commit()
+        return results
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+db_writer = SingleWriter(SessionLocal, enabled=engine.dialect.name == 'sqlite')
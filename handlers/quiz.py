@@ -1,43 +1,26 @@
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, InputFile
-from db import SessionLocal, User, Answer, QuestionSent
-from sqlalchemy import select, and_
-import json
+from aiogram.types import CallbackQuery
+from db import User, Answer, QuestionSent, db_writer, upsert_insert
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from services.questions import question_bank, LANGS
+from services.planner import pick_unsent, save_sent
+from services.media import media_cache
+from services.streaks import record_answer_day
+from services.leaderboard import record_correct_answer, invalidate_ratings
 import os
 import random
-from aiogram.utils.keyboard import InlineKeyboardBuilder
+from keyboards.quiz import QuizAnswer, CODE_TOPICS, get_quiz_keyboard
+from middlewares.user_context import forget_user
+from services.cache import TTLCache
 from datetime import datetime, date
 
 
 router = Router()
 
 
-def load_questions(topic, lang):
-    fname = f"data/{topic}_{lang}.json"
-    if not os.path.exists(fname):
-        return []
-    with open(fname, encoding="utf-8") as f:
-        return json.load(f)
-
-
-def get_quiz_keyboard(options, topic):
-    kb = InlineKeyboardBuilder()
-    for opt in options:
-        kb.button(text=opt, callback_data=f"quiz_answer_{topic}_{opt}")
-    kb.adjust(2)
-    return kb.as_markup()
-
-
 def get_question_by_option(option, topic, lang):
-    questions = load_questions(topic, lang)
-    for q in questions:
-        if option in q['options']:
-            return q
-    return None
-
-
-def filter_unsent_questions(questions, sent_ids):
-    return [q for q in questions if q['id'] not in sent_ids]
+    return question_bank.by_option(topic, lang, option)
 
 
 # Списки реакций (эмодзи и GIF-ссылки)
@@ -51,106 +34,145 @@ WRONG_REACTIONS = [
 # Путь к универсальному баннеру победителя
 WIN_BANNER_PATH = 'data/images/win_banner.jpg'
 
+# (tg_id, topic, question_id, день) уже принятых ответов — для повторных нажатий
+recent_answers = TTLCache(maxsize=10000, ttl=600)
+
+
+async def ask_to_start(callback: CallbackQuery):
+    # Пользователя ещё нет в БД (не нажимал /start) — ответ некуда записать
+    await callback.message.answer("Сначала нажмите /start.")
+    await callback.answer()
+
 
 @router.callback_query(F.data == "menu_play")
-async def start_quiz(callback: CallbackQuery):
-    user_id = callback.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-        topic = random.choice(['movies', 'cities'])
-        questions = load_questions(topic, lang)
-        # Получаем id уже отправленных вопросов
-        sent_result = await session.execute(
-            select(QuestionSent.question_id).where(
-                QuestionSent.user_id == user.id,
-                QuestionSent.topic == topic
-            )
-        )
-        sent_ids = [row[0] for row in sent_result.fetchall()]
-        available = filter_unsent_questions(questions, sent_ids)
-        if not available:
-            await callback.message.answer("Вопросы закончились! Попробуйте позже.")
-            await callback.answer()
-            return
-        q = random.choice(available)
-        # Сохраняем отправленный вопрос
-        qs = QuestionSent(
-            user_id=user.id,
-            question_id=q['id'],
-            topic=topic,
-            sent_at=datetime.now()
+async def start_quiz(callback: CallbackQuery, session: AsyncSession, user, lang):
+    if user is None:
+        await ask_to_start(callback)
+        return
+    topic = random.choice(['movies', 'cities'])
+    questions = question_bank.get(topic, lang)
+    # Получаем id уже отправленных вопросов
+    sent_result = await session.execute(
+        select(QuestionSent.question_id).where(
+            QuestionSent.user_id == user.id,
+            QuestionSent.topic == topic
         )
-        session.add(qs)
-        await session.commit()
+    )
+    sent_ids = set(sent_result.scalars())
+    q = pick_unsent(questions, sent_ids)
+    if not q:
+        await callback.message.answer("Вопросы закончились! Попробуйте позже.")
+        await callback.answer()
+        return
+    # Сохраняем отправленный вопрос
+    await db_writer.run(save_sent, topic, [(user, q)])
     text = f"<b>{q['question']}</b>"
     img_path = os.path.join('data', 'images', q['image'])
-    kb = get_quiz_keyboard(q['options'], topic)
+    kb = get_quiz_keyboard(q, topic, lang)
     if os.path.exists(img_path):
-        photo = InputFile(img_path)
-        await callback.message.answer_photo(
-            photo, caption=text, reply_markup=kb
+        await media_cache.send_photo(
+            callback.message.answer_photo, img_path, caption=text, reply_markup=kb
         )
     else:
         await callback.message.answer(text, reply_markup=kb)
     await callback.answer()
 
 
+@router.callback_query(QuizAnswer.filter())
+async def answer_quiz(callback: CallbackQuery, callback_data: QuizAnswer, user):
+    topic = CODE_TOPICS.get(callback_data.t)
+    q = question_bank.by_id(topic, callback_data.l, callback_data.q) if topic else None
+    if not q or not 0 <= callback_data.o < len(q['options']):
+        await callback.message.answer("Вопрос не найден.")
+        await callback.answer()
+        return
+    await process_answer(callback, user, topic, q, q['options'][callback_data.o])
+
+
+# Кнопки, разосланные до перехода на QuizAnswer: quiz_answer_{topic}_{вариант}
 @router.callback_query(F.data.startswith("quiz_answer_"))
-async def answer_quiz(callback: CallbackQuery):
-    user_id = callback.from_user.id
+async def answer_quiz_legacy(callback: CallbackQuery, user):
     data = callback.data.replace("quiz_answer_", "")
     if "_" not in data:
         await callback.message.answer("Ошибка данных ответа.")
         await callback.answer()
         return
     topic, chosen = data.split("_", 1)
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
+    # Язык в старом формате не передавался — ищем вариант во всех языках
+    q = None
+    for lang in LANGS:
         q = get_question_by_option(chosen, topic, lang)
-        if not q:
-            await callback.message.answer("Вопрос не найден.")
-            await callback.answer()
-            return
-        today = date.today()
-        answer_exists = await session.execute(
-            select(Answer).where(
-                and_(
-                    Answer.user_id == user.id,
-                    Answer.question_id == q['id'],
-                    Answer.topic == topic,
-                    Answer.date >= datetime.combine(today, datetime.min.time()),
-                    Answer.date <= datetime.combine(today, datetime.max.time()),
-                )
-            )
-        )
-        if answer_exists.scalar_one_or_none():
-            await callback.message.answer("Вы уже отвечали на этот вопрос сегодня!")
-            await callback.answer()
-            return
-        is_correct = (chosen == q['answer'])
-        answer = Answer(
-            user_id=user.id,
+        if q:
+            break
+    if not q:
+        await callback.message.answer("Вопрос не найден.")
+        await callback.answer()
+        return
+    await process_answer(callback, user, topic, q, chosen)
+
+
+async def record_answer(session, user_id, topic, q, chosen):
+    """Записывает ответ пользователя (выполняется через db_writer).
+
+    Возвращает (is_correct, score_changes) или None, если пользователь
+    уже отвечал на этот вопрос сегодня. Повтор отсекает уникальный ключ
+    (user_id, question_id, topic, answer_day), поэтому двойное нажатие
+    не засчитывается дважды даже при параллельной записи.
+    """
+    is_correct = (chosen == q['answer'])
+    now = datetime.now()
+    inserted = await session.execute(
+        upsert_insert(Answer).values(
+            user_id=user_id,
             question_id=q['id'],
             topic=topic,
             is_correct=is_correct,
-            date=datetime.now()
-        )
-        session.add(answer)
-        if is_correct:
-            user.score += 1
-            user.streak += 1
-        else:
-            user.streak = 0
-        user.games_played += 1
-        await session.commit()
+            date=now,
+            answer_day=now.date(),
+        ).on_conflict_do_nothing(
+            index_elements=['user_id', 'question_id', 'topic', 'answer_day']
+        ).returning(Answer.id)
+    )
+    if inserted.first() is None:
+        return None
+    await record_answer_day(session, user_id, now, is_correct)
+    score_changes = []
+    if is_correct:
+        score_changes = await record_correct_answer(session, user_id, now)
+    # Счётчики меняет сама БД, без чтения пользователя
+    counters = {'games_played': User.games_played + 1, 'streak': 0}
+    if is_correct:
+        counters.update(score=User.score + 1, streak=User.streak + 1)
+    await session.execute(
+        update(User).where(User.id == user_id).values(**counters)
+        .execution_options(synchronize_session=False)
+    )
+    return is_correct, score_changes
+
+
+async def process_answer(callback: CallbackQuery, user, topic, q, chosen):
+    if user is None:
+        await ask_to_start(callback)
+        return
+    key = (callback.from_user.id, topic, q['id'], date.today())
+    # Двойное нажатие отсекаем до очереди записи; гарантию даёт уникальный ключ в БД
+    if recent_answers.get(key):
+        recorded = None
+    else:
+        recent_answers.set(key, True)
+        try:
+            recorded = await db_writer.run(record_answer, user.id, topic, q, chosen)
+        except Exception:
+            recent_answers.pop(key)
+            raise
+    if recorded is None:
+        await callback.message.answer("Вы уже отвечали на этот вопрос сегодня!")
+        await callback.answer()
+        return
+    is_correct, score_changes = recorded
+    # Счёт и серии поменялись в сессии писателя — снимок в кэше устарел
+    forget_user(callback.from_user.id)
+    invalidate_ratings(score_changes)
     if is_correct:
         msg = "✅ Верно!\n"
         reaction = random.choice(CORRECT_REACTIONS)
@@ -170,5 +192,7 @@ async def answer_quiz(callback: CallbackQuery):
         await callback.message.answer(msg)
     # Отправляем баннер победителя, если ответ верный
     if is_correct and os.path.exists(WIN_BANNER_PATH):
-        await callback.message.answer_photo(InputFile(WIN_BANNER_PATH), caption="🏆 Поздравляем с победой!")
+        await media_cache.send_photo(
+            callback.message.answer_photo, WIN_BANNER_PATH, caption="🏆 Поздравляем с победой!"
+        )
     await callback.answer()
@@ -1,16 +1,22 @@
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InputFile, ReplyKeyboardMarkup, KeyboardButton
+from aiogram.types import Message, CallbackQuery, ReplyKeyboardMarkup, KeyboardButton
 from aiogram.filters import CommandStart, Command
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from db import SessionLocal, User, Answer
-from main import LOCALES
-from sqlalchemy import select, func, desc, and_, update
-from keyboards.menu import get_reply_menu_keyboard
-from datetime import datetime, date, timedelta
+from db import User, Answer, db_writer, upsert_insert
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from keyboards.menu import get_reply_menu_keyboard, MenuButton
+from datetime import date
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from db import get_or_create_user
-from urllib.parse import unquote
+from services.questions import question_bank, TOPICS, LANGS as QUESTION_LANGS
+from services.media import media_cache
+from services.achievements import RATING_MEDALS, award_medals, top_medal_holders, user_medals
+from services.streaks import get_streaks
+from services.leaderboard import top_scores, get_cached_rating, cache_rating, rating_cache
+from handlers.quiz import WIN_BANNER_PATH
+from middlewares.user_context import forget_user
 import os
 
 router = Router()
@@ -28,8 +34,35 @@ def get_lang_keyboard():
     return kb.as_markup()
 
 
+async def register_user(session, tg_id, username, referrer_id):
+    """Создаёт пользователя (через db_writer) и засчитывает приглашение.
+
+    Возвращает True, если пользователь новый. Повторный /start, в том
+    числе параллельный, пригласившему второй раз не засчитывается.
+    """
+    inserted = await session.execute(
+        upsert_insert(User).values(
+            tg_id=tg_id, username=username, referrer_id=referrer_id
+        ).on_conflict_do_nothing(index_elements=['tg_id']).returning(User.id)
+    )
+    if inserted.first() is None:
+        return False
+    if referrer_id:
+        await session.execute(
+            update(User).where(User.tg_id == referrer_id).values(
+                referrals_count=func.coalesce(User.referrals_count, 0) + 1
+            )
+        )
+    return True
+
+
+async def set_lang(session, tg_id, username, lang):
+    user = await get_or_create_user(session, tg_id, username)
+    user.lang = lang
+
+
 @router.message(CommandStart())
-async def cmd_start(message: Message):
+async def cmd_start(message: Message, session: AsyncSession, user):
     # Обработка реферального параметра
     referrer_id = None
     if message.text and ' ' in message.text:
@@ -39,39 +72,29 @@ async def cmd_start(message: Message):
                 referrer_id = int(param.replace('ref_', ''))
             except Exception:
                 referrer_id = None
-    async with SessionLocal() as session:
-        result = await session.execute(select(User).where(User.tg_id == message.from_user.id))
-        user = result.scalar_one_or_none()
-        if not user:
-            # Новый пользователь — сохраняем пригласившего
-            user = User(tg_id=message.from_user.id, username=message.from_user.username, referrer_id=referrer_id)
-            session.add(user)
-            await session.commit()
-            if referrer_id:
-                ref_result = await session.execute(select(User).where(User.tg_id == referrer_id))
-                ref_user = ref_result.scalar_one_or_none()
-                if ref_user:
-                    ref_user.referrals_count = (ref_user.referrals_count or 0) + 1
-                    await session.commit()
+    if not user:
+        # Новый пользователь — сохраняем пригласившего
+        created = await db_writer.run(
+            register_user, message.from_user.id, message.from_user.username, referrer_id
+        )
+        if created and referrer_id:
+            forget_user(referrer_id)
     welcome_img = 'data/images/welcome.jpg'
     text = "👋 Добро пожаловать в GuessShotBot!\n\nВыберите язык / Choose your language:"
     if os.path.exists(welcome_img):
-        await message.answer_photo(InputFile(welcome_img), caption=text)
+        await media_cache.send_photo(message.answer_photo, welcome_img, caption=text)
     else:
         await message.answer(text)
     await message.answer(text, reply_markup=get_lang_keyboard())
 
 
 @router.callback_query(F.data.startswith("lang_"))
-async def lang_chosen(callback: CallbackQuery, state: FSMContext, data: dict):
+async def lang_chosen(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user, locales: dict):
     lang = callback.data.split("_")[1]
 
-    async with SessionLocal() as session:
-        user = await get_or_create_user(session, callback.from_user.id)
-        user.lang = lang
-        await session.commit()
+    await db_writer.run(set_lang, callback.from_user.id, callback.from_user.username, lang)
+    forget_user(callback.from_user.id)
 
-    locales = data["locales"]
     locale = locales.get(lang, locales.get("ru", {}))
 
     # Отправляем обычную клавиатуру меню
@@ -83,108 +106,80 @@ async def lang_chosen(callback: CallbackQuery, state: FSMContext, data: dict):
     await state.clear()
 
 
-# Обработка текстовых кнопок главного меню (ReplyKeyboard)
-@router.message()
-async def handle_menu_buttons(message: Message):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-    locale = LOCALES.get(lang, LOCALES['ru'])
-    text = message.text.strip()
-    if text == locale.get('play_btn', '🎬 Играть'):
-        # Имитация нажатия на inline-кнопку "Играть"
-        await message.answer(locale.get('play_soon', 'Игра скоро будет!'))
-    elif text == locale.get('stats_btn', '📊 Моя статистика'):
-        # Имитация нажатия на inline-кнопку "Статистика"
-        await menu_stats_message(message, user, lang)
-    elif text == locale.get('rating_btn', '🏆 Ежедневный рейтинг'):
-        # Имитация нажатия на inline-кнопку "Рейтинг дня"
-        await menu_rating_message(message, user, lang)
+# Обработка текстовых кнопок главного меню (ReplyKeyboard): фильтр
+# MenuButton сопоставляет текст с кнопкой по таблице, прочий текст сюда не попадает
+@router.message(MenuButton())
+async def handle_menu_button(message: Message, menu_action: str, state: FSMContext,
+                             session: AsyncSession, user, lang, locale):
+    await MENU_ACTIONS[menu_action](message, state, session, user, lang, locale)
 
 
 # Вспомогательные функции для вывода статистики и рейтинга по текстовой команде
-async def menu_stats_message(message: Message, user, lang):
-    locale = LOCALES.get(lang, LOCALES['ru'])
-    async with SessionLocal() as session:
-        user.no_win_streak = get_no_win_streak(user, session)
-        user.answer_streak = get_answer_streak(user, session)
-    medals = user.medals if user and user.medals else ''
+async def menu_stats_message(message: Message, session: AsyncSession, user, locale):
+    user.no_win_streak, user.answer_streak = await get_streaks(session, user.id)
+    medals = await user_medals(session, user.id)
+    # Проверяем ачивки
     new_achievements = []
     ach_texts = []
     for ach in ACHIEVEMENTS:
         if ach["emoji"] not in medals and ach["check"](user):
-            medals += ach["emoji"] + ' '
+            medals.add(ach["emoji"])
             new_achievements.append(ach["emoji"])
         if ach["emoji"] in medals:
             key = 'ach_brain' if ach["emoji"] == '🧠' else 'ach_explorer'
             ach_texts.append(locale.get(key, ach["name"]))
+    # Медалька победителя дня
     if '🥇' in medals:
         ach_texts.append(locale.get('winner_medal', '🥇 Winner of the Day'))
-    if new_achievements:
-        async with SessionLocal() as session:
-            await session.execute(
-                update(User).where(User.id == user.id).values(medals=medals)
-            )
-            await session.commit()
     stats = (
         f"{locale.get('your_score', 'Ваш счёт')}: <b>{user.score if user else 0}</b>\n"
         f"{locale.get('your_streak', 'Серия побед')}: <b>{user.streak if user else 0}</b>\n"
         f"{locale.get('games_played', 'Игр сыграно')}: <b>{user.games_played if user else 0}</b>\n"
         f"{locale.get('achievements', 'Ачивки')}: {'; '.join(ach_texts) if ach_texts else '-'}"
     )
+    if new_achievements:
+        await db_writer.run(award_medals, user.id, new_achievements)
+        forget_user(user.tg_id)
     await message.answer(stats, parse_mode='HTML')
 
 
-async def menu_rating_message(message: Message, user, lang):
-    locale = LOCALES.get(lang, LOCALES['ru'])
+async def menu_rating_message(message: Message, session: AsyncSession, lang, locale):
+    text = await render_rating(session, 'day', lang, locale, limit=5)
+    await message.answer(text, parse_mode='HTML')
+
+
+async def render_rating(session, period, lang, locale, limit=10):
+    """Текст рейтинга за период; готовый текст берётся из кэша.
+
+    Только чтение: медали призёрам выдаёт задача main.award_rating_medals.
+    """
     today = date.today()
-    async with SessionLocal() as session:
-        scores_result = await session.execute(
-            select(
-                Answer.user_id,
-                func.count().label('score')
-            ).where(
-                and_(
-                    Answer.is_correct,
-                    Answer.date >= datetime.combine(
-                        today, datetime.min.time()
-                    ),
-                    Answer.date <= datetime.combine(
-                        today, datetime.max.time()
-                    ),
-                )
-            ).group_by(Answer.user_id).order_by(desc('score')).limit(5)
-        )
-        scores = scores_result.fetchall()
-        if not scores:
-            await message.answer(locale.get('no_rating_today', 'Сегодня ещё нет победителей!'))
-            return
-        user_ids = [row[0] for row in scores]
-        users_result = await session.execute(select(User).where(User.id.in_(user_ids)))
-        users_dict = {u.id: u for u in users_result.scalars()}
-        top1_id = scores[0][0]
-        top1_user = users_dict[top1_id]
-        if '🥇' not in (top1_user.medals or ''):
-            new_medals = (top1_user.medals or '') + '🥇 '
-            await session.execute(
-                update(User).where(User.id == top1_id).values(medals=new_medals)
-            )
-            await session.commit()
-        lines = []
-        for idx, (uid, score) in enumerate(scores, 1):
-            medal = '🥇 ' if idx == 1 else ''
-            uname = users_dict[uid].username or f"id{users_dict[uid].tg_id}"
-            lines.append(
-                f"{medal}{idx}. {uname}: <b>{score}</b>"
-            )
-        text = (
-            f"{locale.get('rating_today', 'Рейтинг дня')}\n\n" + "\n".join(lines)
-        )
-        await message.answer(text, parse_mode='HTML')
+    cached = get_cached_rating(period, today, lang, limit)
+    if cached is not None:
+        return cached[1]
+    scores = await top_scores(session, period, today, limit=limit)
+    if not scores:
+        text = locale.get('no_rating_today', 'Сегодня ещё нет победителей!')
+        cache_rating(period, today, lang, limit, scores, text)
+        return text
+    user_ids = [row[0] for row in scores]
+    users_result = await session.execute(select(User).where(User.id.in_(user_ids)))
+    users_dict = {u.id: u for u in users_result.scalars()}
+    medals = RATING_MEDALS[period]
+    lines = []
+    for idx, (uid, score) in enumerate(scores, 1):
+        uname = users_dict[uid].username or f"id{users_dict[uid].tg_id}"
+        prefix = f"{medals[idx]} " if idx in medals else ''
+        lines.append(f"{prefix}{idx}. {uname}: <b>{score}</b>")
+    if period == 'week':
+        title = locale.get('weekly_rating', '🏆 Рейтинг недели')
+    elif period == 'month':
+        title = locale.get('monthly_rating', '🏆 Рейтинг месяца')
+    else:
+        title = locale.get('rating_today', 'Рейтинг дня')
+    text = f"{title}\n\n" + "\n".join(lines)
+    cache_rating(period, today, lang, limit, scores, text)
+    return text
 
 
 ACHIEVEMENTS = [
@@ -200,162 +195,37 @@ ACHIEVEMENTS = [
 
 
 @router.callback_query(F.data == "menu_stats")
-async def menu_stats(callback: CallbackQuery):
-    user_id = callback.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-    locale = LOCALES.get(lang, LOCALES['ru'])
-    async with SessionLocal() as session:
-        user.no_win_streak = get_no_win_streak(user, session)
-        user.answer_streak = get_answer_streak(user, session)
-    medals = user.medals if user and user.medals else ''
-    # Проверяем ачивки
-    new_achievements = []
-    ach_texts = []
-    for ach in ACHIEVEMENTS:
-        if ach["emoji"] not in medals and ach["check"](user):
-            medals += ach["emoji"] + ' '
-            new_achievements.append(ach["emoji"])
-        if ach["emoji"] in medals:
-            key = 'ach_brain' if ach["emoji"] == '🧠' else 'ach_explorer'
-            ach_texts.append(locale.get(key, ach["name"]))
-    # Медалька победителя дня
-    if '🥇' in medals:
-        ach_texts.append(locale.get('winner_medal', '🥇 Winner of the Day'))
-    if new_achievements:
-        async with SessionLocal() as session:
-            await session.execute(
-                update(User).where(User.id == user.id).values(medals=medals)
-            )
-            await session.commit()
-    stats = (
-        f"{locale.get('your_score', 'Ваш счёт')}: <b>{user.score if user else 0}</b>\n"
-        f"{locale.get('your_streak', 'Серия побед')}: <b>{user.streak if user else 0}</b>\n"
-        f"{locale.get('games_played', 'Игр сыграно')}: <b>{user.games_played if user else 0}</b>\n"
-        f"{locale.get('achievements', 'Ачивки')}: {'; '.join(ach_texts) if ach_texts else '-'}"
-    )
-    await callback.message.answer(stats)
+async def menu_stats(callback: CallbackQuery, session: AsyncSession, user, locale):
+    await menu_stats_message(callback.message, session, user, locale)
     await callback.answer()
 
 
 @router.callback_query(F.data == "menu_rating")
-async def menu_rating(callback: CallbackQuery):
-    user_id = callback.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-        locale = LOCALES.get(lang, LOCALES['ru'])
-        today = date.today()
-        # Считаем очки за сегодня
-        scores_result = await session.execute(
-            select(
-                Answer.user_id,
-                func.count().label('score')
-            ).where(
-                and_(
-                    Answer.is_correct,
-                    Answer.date >= datetime.combine(
-                        today, datetime.min.time()
-                    ),
-                    Answer.date <= datetime.combine(
-                        today, datetime.max.time()
-                    ),
-                )
-            ).group_by(Answer.user_id).order_by(desc('score')).limit(10)
-        )
-        scores = scores_result.fetchall()
-        if not scores:
-            await callback.message.answer(locale.get('no_rating_today', 'Сегодня ещё нет победителей!'))
-            await callback.answer()
-            return
-        # Получаем пользователей
-        user_ids = [row[0] for row in scores]
-        users_result = await session.execute(select(User).where(User.id.in_(user_ids)))
-        users_dict = {u.id: u for u in users_result.scalars()}
-        # Присваиваем медальку топ-1
-        top1_id = scores[0][0]
-        top1_user = users_dict[top1_id]
-        if '🥇' not in (top1_user.medals or ''):
-            new_medals = (top1_user.medals or '') + '🥇 '
-            await session.execute(
-                update(User).where(User.id == top1_id).values(medals=new_medals)
-            )
-            await session.commit()
-        lines = []
-        for idx, (uid, score) in enumerate(scores, 1):
-            medal = '🥇 ' if idx == 1 else ''
-            uname = users_dict[uid].username or f"id{users_dict[uid].tg_id}"
-            lines.append(f"{medal}{idx}. {uname}: <b>{score}</b>")
-        text = f"{locale.get('rating_today', 'Рейтинг дня')}\n\n" + "\n".join(lines)
-        await callback.message.answer(text)
+async def menu_rating(callback: CallbackQuery, session: AsyncSession, lang, locale):
+    text = await render_rating(session, 'day', lang, locale, limit=10)
+    await callback.message.answer(text)
     await callback.answer()
 
 
 @router.message(Command("stats"))
-async def stats_command(message: Message):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-    await menu_stats_message(message, user, lang)
+async def stats_command(message: Message, session: AsyncSession, user, locale):
+    await menu_stats_message(message, session, user, locale)
 
 
 @router.message(Command("rating"))
-async def rating_command(message: Message):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-    await menu_rating_message(message, user, lang)
+async def rating_command(message: Message, session: AsyncSession, lang, locale):
+    await menu_rating_message(message, session, lang, locale)
 
 
 @router.message(Command("profile"))
-async def profile_command(message: Message):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-    await send_profile(message, user, lang)
-
-# Обработка текстовой кнопки "👤 Профиль"
-@router.message()
-async def handle_profile_button(message: Message):
-    user_id = message.from_user.id
-    text = message.text.strip()
-    locale = LOCALES.get('ru', LOCALES['ru'])
-    if text == locale.get('profile_btn', '👤 Профиль'):
-        async with SessionLocal() as session:
-            result = await session.execute(
-                select(User).where(User.tg_id == user_id)
-            )
-            user = result.scalar_one_or_none()
-            lang = user.lang if user else 'ru'
-        await send_profile(message, user, lang)
+async def profile_command(message: Message, session: AsyncSession, user, lang, locale):
+    await send_profile(message, session, user, lang, locale)
 
-async def send_profile(message: Message, user, lang):
-    locale = LOCALES.get(lang, LOCALES['ru'])
+async def send_profile(message: Message, session: AsyncSession, user, lang, locale):
     if not user:
         await message.answer("Профиль не найден.")
         return
-    async with SessionLocal() as session:
-        user.no_win_streak = get_no_win_streak(user, session)
-        user.answer_streak = get_answer_streak(user, session)
+    user.no_win_streak, user.answer_streak = await get_streaks(session, user.id)
     # Формируем профиль
     username = user.username or f"id{user.tg_id}"
     first_seen = user.created_at.strftime('%d.%m.%Y') if hasattr(user, 'created_at') and user.created_at else '-'
@@ -365,7 +235,7 @@ async def send_profile(message: Message, user, lang):
     streak = user.streak or 0
     lang_display = 'Русский' if lang == 'ru' else 'English'
     # Ачивки с описанием
-    medals = user.medals if user and user.medals else ''
+    medals = await user_medals(session, user.id)
     ach_texts = []
     for ach in ACHIEVEMENTS:
         if ach["emoji"] in medals or ach["check"](user):
@@ -414,20 +284,14 @@ async def help_command(message: Message):
 
 
 @router.message(Command("history"))
-async def history_command(message: Message):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(
-            select(User).where(User.tg_id == user_id)
-        )
-        user = result.scalar_one_or_none()
-        if not user:
-            await message.answer("Пользователь не найден.")
-            return
-        answers_result = await session.execute(
-            select(Answer).where(Answer.user_id == user.id).order_by(Answer.date.desc()).limit(5)
-        )
-        answers = answers_result.scalars().all()
+async def history_command(message: Message, session: AsyncSession, user):
+    if not user:
+        await message.answer("Пользователь не найден.")
+        return
+    answers_result = await session.execute(
+        select(Answer).where(Answer.user_id == user.id).order_by(Answer.date.desc()).limit(5)
+    )
+    answers = answers_result.scalars().all()
     if not answers:
         await message.answer("Нет истории ответов.")
         return
@@ -439,50 +303,6 @@ async def history_command(message: Message):
     text = "<b>Последние 5 ответов:</b>\n" + "\n".join(lines)
     await message.answer(text, parse_mode='HTML')
 
-# Для новых ачивок потребуется вычислять no_win_streak и answer_streak для пользователя
-# Добавляю функции для подсчёта этих параметров
-
-def get_no_win_streak(user, session):
-    # Считает дни подряд без побед (последние дни)
-    from sqlalchemy import func
-    today = date.today()
-    streak = 0
-    for i in range(3):
-        day = today - timedelta(days=i)
-        res = session.execute(
-            select(Answer).where(
-                Answer.user_id == user.id,
-                func.date(Answer.date) == day,
-            )
-        )
-        answers = res.scalars().all()
-        if not answers:
-            break
-        if any(a.is_correct for a in answers):
-            break
-        streak += 1
-    return streak
-
-def get_answer_streak(user, session):
-    # Считает дни подряд с ответами (последние дни)
-    from sqlalchemy import func
-    today = date.today()
-    streak = 0
-    for i in range(7):
-        day = today - timedelta(days=i)
-        res = session.execute(
-            select(Answer).where(
-                Answer.user_id == user.id,
-                func.date(Answer.date) == day,
-            )
-        )
-        answers = res.scalars().all()
-        if answers:
-            streak += 1
-        else:
-            break
-    return streak
-
 ADMIN_CHAT_ID = 5900895276
 
 class AdminStates(StatesGroup):
@@ -516,6 +336,31 @@ async def admin_panel(message: Message, state: FSMContext):
     await message.answer("🛠 <b>Админ-панель</b>\nВыберите действие:", reply_markup=admin_kb, parse_mode='HTML')
     await state.set_state(AdminStates.menu)
 
+@router.message(Command("warmup_media"))
+async def admin_warmup_media(message: Message):
+    # Загружает все картинки в Telegram заранее, чтобы рассылка шла по file_id
+    if message.from_user.id != ADMIN_CHAT_ID:
+        await message.answer("Нет доступа.")
+        return
+    paths = {WIN_BANNER_PATH, 'data/images/welcome.jpg'}
+    for topic in TOPICS:
+        for lang in QUESTION_LANGS:
+            for q in question_bank.get(topic, lang):
+                paths.add(os.path.join('data', 'images', q['image']))
+    uploaded = await media_cache.warmup(message.bot, message.chat.id, sorted(paths))
+    await message.answer(f"Загружено картинок: {uploaded}")
+
+@router.message(Command("cache_stats"))
+async def admin_cache_stats(message: Message):
+    if message.from_user.id != ADMIN_CHAT_ID:
+        await message.answer("Нет доступа.")
+        return
+    st = rating_cache.stats()
+    await message.answer(
+        f"Кэш рейтингов: {st['size']} записей, "
+        f"hits={st['hits']}, misses={st['misses']}, hit rate={st['hit_rate']:.0%}"
+    )
+
 @router.message(AdminStates.menu)
 async def admin_menu_handler(message: Message, state: FSMContext):
     text = message.text.strip()
@@ -539,13 +384,11 @@ async def admin_stats_topic(message: Message, state: FSMContext):
     topic = message.text.strip()
     lang = 'ru'  # Можно добавить выбор языка
     file_path = f"data/{topic}_{lang}.json"
-    import os, json
     if not os.path.exists(file_path):
         await message.answer(f"Файл {file_path} не найден.")
         await state.set_state(AdminStates.menu)
         return
-    with open(file_path, encoding='utf-8') as f:
-        questions = json.load(f)
+    questions = question_bank.get(topic, lang)
     if not questions:
         await message.answer("Вопросов нет.")
         await state.set_state(AdminStates.menu)
@@ -626,6 +469,7 @@ async def admin_input_photo(message: Message, state: FSMContext):
     questions.append(question)
     with open(file_path, 'w', encoding='utf-8') as f:
         json.dump(questions, f, ensure_ascii=False, indent=2)
+    question_bank.forget(topic, lang)
     await message.answer(f"Вопрос успешно добавлен в {file_path}!", reply_markup=admin_kb)
     await state.set_state(AdminStates.menu)
 
@@ -633,15 +477,11 @@ async def admin_input_photo(message: Message, state: FSMContext):
 class FeedbackStates(StatesGroup):
     waiting_feedback = State()
 
-@router.message()
-async def handle_feedback_button(message: Message, state: FSMContext):
-    text = message.text.strip()
-    locale = LOCALES.get('ru', LOCALES['ru'])
-    if text == locale.get('feedback_btn', '💬 Отзывы и предложения'):
-        await message.answer(
-            "Напишите ваш отзыв или идею — мы учтём! Сообщение будет передано администратору."
-        )
-        await state.set_state(FeedbackStates.waiting_feedback)
+async def start_feedback(message: Message, state: FSMContext):
+    await message.answer(
+        "Напишите ваш отзыв или идею — мы учтём! Сообщение будет передано администратору."
+    )
+    await state.set_state(FeedbackStates.waiting_feedback)
 
 @router.message(FeedbackStates.waiting_feedback)
 async def process_feedback(message: Message, state: FSMContext):
@@ -651,110 +491,49 @@ async def process_feedback(message: Message, state: FSMContext):
     await state.clear()
 
 @router.message(Command("achievements"))
-async def achievements_command(message: Message):
-    await show_achievements_leaders(message)
-
-@router.message()
-async def handle_achievements_button(message: Message):
-    text = message.text.strip()
-    locale = LOCALES.get('ru', LOCALES['ru'])
-    if text == locale.get('achievements_btn', '🏅 Ачивки-лидеры'):
-        await show_achievements_leaders(message)
-
-async def show_achievements_leaders(message: Message):
-    async with SessionLocal() as session:
-        users_result = await session.execute(select(User))
-        users = users_result.scalars().all()
-        # Считаем количество ачивок у каждого
-        leaderboard = []
-        for user in users:
-            medals = (user.medals or '').strip().split()
-            if not medals:
-                continue
-            # Для сортировки по дате последней ачивки ищем последнюю дату победы
-            last_ach_date = user.created_at or datetime.min
-            answers_result = await session.execute(
-                select(Answer).where(Answer.user_id == user.id).order_by(Answer.date.desc())
-            )
-            answers = answers_result.scalars().all()
-            if answers:
-                last_ach_date = answers[0].date
-            leaderboard.append({
-                'user': user,
-                'medals': medals,
-                'count': len(medals),
-                'last_ach_date': last_ach_date
-            })
-        # Сортировка: по количеству ачивок, затем по дате последней ачивки (убыв.)
-        leaderboard.sort(key=lambda x: (-x['count'], -x['last_ach_date'].timestamp()))
-        top = leaderboard[:10]
-        if not top:
-            await message.answer('Пока нет лидеров по ачивкам.')
-            return
-        lines = []
-        for idx, entry in enumerate(top, 1):
-            user = entry['user']
-            medals = ' '.join(entry['medals'])
-            uname = user.username or f"id{user.tg_id}"
-            lines.append(f"{idx}. <b>{uname}</b> — {medals} ({entry['count']})")
-        text = '<b>🏅 Топ-10 по ачивкам:</b>\n' + '\n'.join(lines)
-        await message.answer(text, parse_mode='HTML')
+async def achievements_command(message: Message, session: AsyncSession):
+    await show_achievements_leaders(message, session)
+
+async def show_achievements_leaders(message: Message, session: AsyncSession):
+    # Сортировка: по количеству ачивок, затем по дате последней ачивки (убыв.)
+    top = await top_medal_holders(session, limit=10)
+    if not top:
+        await message.answer('Пока нет лидеров по ачивкам.')
+        return
+    lines = []
+    for idx, user in enumerate(top, 1):
+        medals = ' '.join((user.medals or '').split())
+        uname = user.username or f"id{user.tg_id}"
+        lines.append(f"{idx}. <b>{uname}</b> — {medals} ({user.medals_count})")
+    text = '<b>🏅 Топ-10 по ачивкам:</b>\n' + '\n'.join(lines)
+    await message.answer(text, parse_mode='HTML')
 
 @router.message(Command("weekly"))
-async def weekly_rating(message: Message):
-    await show_season_rating(message, period='week')
+async def weekly_rating(message: Message, session: AsyncSession, lang, locale):
+    await show_season_rating(message, session, lang, locale, period='week')
 
 @router.message(Command("monthly"))
-async def monthly_rating(message: Message):
-    await show_season_rating(message, period='month')
-
-async def show_season_rating(message: Message, period='week'):
-    user_id = message.from_user.id
-    async with SessionLocal() as session:
-        result = await session.execute(select(User).where(User.tg_id == user_id))
-        user = result.scalar_one_or_none()
-        lang = user.lang if user else 'ru'
-        locale = LOCALES.get(lang, LOCALES['ru'])
-        today = date.today()
-        if period == 'week':
-            start = today - timedelta(days=today.weekday())
-            end = start + timedelta(days=6)
-            title = locale.get('weekly_rating', '🏆 Рейтинг недели')
-        else:
-            start = today.replace(day=1)
-            end = (today.replace(day=1) + timedelta(days=32)).replace(day=1) - timedelta(days=1)
-            title = locale.get('monthly_rating', '🏆 Рейтинг месяца')
-        scores_result = await session.execute(
-            select(
-                Answer.user_id,
-                func.count().label('score')
-            ).where(
-                and_(
-                    Answer.is_correct,
-                    Answer.date >= datetime.combine(start, datetime.min.time()),
-                    Answer.date <= datetime.combine(end, datetime.max.time()),
-                )
-            ).group_by(Answer.user_id).order_by(desc('score')).limit(10)
-        )
-        scores = scores_result.fetchall()
-        if not scores:
-            await message.answer(locale.get('no_rating_today', 'Сегодня ещё нет победителей!'))
-            return
-        user_ids = [row[0] for row in scores]
-        users_result = await session.execute(select(User).where(User.id.in_(user_ids)))
-        users_dict = {u.id: u for u in users_result.scalars()}
-        # Ачивки за топ-3
-        for idx, (uid, score) in enumerate(scores[:3], 1):
-            top_user = users_dict[uid]
-            medal = {1: '🥇', 2: '🥈', 3: '🥉'}.get(idx)
-            if medal and (not top_user.medals or medal not in top_user.medals):
-                new_medals = (top_user.medals or '') + f'{medal} '
-                await session.execute(update(User).where(User.id == top_user.id).values(medals=new_medals))
-                await session.commit()
-        lines = []
-        for idx, (uid, score) in enumerate(scores, 1):
-            medal = {1: '🥇', 2: '🥈', 3: '🥉'}.get(idx, '')
-            uname = users_dict[uid].username or f"id{users_dict[uid].tg_id}"
-            lines.append(f"{medal}{idx}. {uname}: <b>{score}</b>")
-        text = f"{title}\n\n" + "\n".join(lines)
-        await message.answer(text, parse_mode='HTML')
+async def monthly_rating(message: Message, session: AsyncSession, lang, locale):
+    await show_season_rating(message, session, lang, locale, period='month')
+
+async def show_season_rating(message: Message, session: AsyncSession, lang, locale, period='week'):
+    text = await render_rating(session, period, lang, locale, limit=10)
+    await message.answer(text, parse_mode='HTML')
+
+
+# Действия кнопок главного меню: ключ кнопки из локали -> обработчик
+MENU_ACTIONS = {
+    # Имитация нажатия на inline-кнопку "Играть"
+    'play_btn': lambda message, state, session, user, lang, locale:
+        message.answer(locale.get('play_soon', 'Игра скоро будет!')),
+    'stats_btn': lambda message, state, session, user, lang, locale:
+        menu_stats_message(message, session, user, locale),
+    'rating_btn': lambda message, state, session, user, lang, locale:
+        menu_rating_message(message, session, lang, locale),
+    'achievements_btn': lambda message, state, session, user, lang, locale:
+        show_achievements_leaders(message, session),
+    'profile_btn': lambda message, state, session, user, lang, locale:
+        send_profile(message, session, user, lang, locale),
+    'feedback_btn': lambda message, state, session, user, lang, locale:
+        start_feedback(message, state),
+}
@@ -1,6 +1,7 @@
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from main import LOCALES
-from aiogram.types import ReplyKeyboardMarkup, KeyboardButton
+from aiogram.filters import Filter
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton
 
 
 def get_menu_keyboard(lang: str):
@@ -59,3 +60,40 @@ def get_reply_menu_keyboard(lang: str):
         ],
         resize_keyboard=True
     )
+
+
+# Кнопки главного меню: ключ локали -> текст по умолчанию
+MENU_BUTTONS = {
+    'play_btn': '🎬 Играть',
+    'stats_btn': '📊 Моя статистика',
+    'rating_btn': '🏆 Ежедневный рейтинг',
+    'achievements_btn': '🏅 Ачивки-лидеры',
+    'profile_btn': '👤 Профиль',
+    'feedback_btn': '💬 Отзывы и предложения',
+}
+
+
+def build_menu_actions(locales):
+    """Таблица «текст кнопки -> ключ кнопки» по всем языкам."""
+    actions = {}
+    for locale in locales.values():
+        for key, default in MENU_BUTTONS.items():
+            actions[locale.get(key, default)] = key
+    return actions
+
+
+class MenuButton(Filter):
+    """Пропускает только тексты кнопок меню и передаёт хендлеру menu_action.
+
+    Таблица строится один раз, поэтому проверка — один поиск в словаре,
+    а обычный текст отсекается до middleware с запросами к БД.
+    """
+
+    def __init__(self, locales=None):
+        self.actions = build_menu_actions(LOCALES if locales is None else locales)
+
+    async def __call__(self, message: Message):
+        action = self.actions.get((message.text or '').strip())
+        if action is None:
+            return False
+        return {'menu_action': action}
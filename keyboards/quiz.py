@@ -0,0 +1,37 @@
+from aiogram.filters.callback_data import CallbackData
+from aiogram.utils.keyboard import InlineKeyboardBuilder
+
+
+# Короткие коды тем для callback_data (лимит Telegram — 64 байта)
+TOPIC_CODES = {
+    'movies': 'm',
+    'cities': 'c',
+    'music': 'u',
+    'sport': 's',
+}
+CODE_TOPICS = {code: topic for topic, code in TOPIC_CODES.items()}
+
+
+class QuizAnswer(CallbackData, prefix='qa1'):
+    """Ответ на вопрос: qa1:<тема>:<язык>:<id вопроса>:<номер варианта>.
+
+    Версия формата зашита в префикс — при смене полей заводим qa2,
+    а старые кнопки продолжают обрабатываться по qa1.
+    """
+
+    t: str
+    l: str
+    q: int
+    o: int
+
+
+def get_quiz_keyboard(q, topic, lang):
+    kb = InlineKeyboardBuilder()
+    code = TOPIC_CODES[topic]
+    for idx, opt in enumerate(q['options']):
+        kb.button(
+            text=opt,
+            callback_data=QuizAnswer(t=code, l=lang, q=q['id'], o=idx),
+        )
+    kb.adjust(2)
+    return kb.as_markup()
@@ -4,14 +4,24 @@ import os
 import json
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
-from db import init_db, SessionLocal, User, QuestionSent
-from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.cron import CronTrigger
-import pytz
-from sqlalchemy import select
-from datetime import datetime
-from aiogram.types import InputFile
-import random
+from db import init_db, SessionLocal, db_writer, engine
+from services.questions import question_bank
+from services.broadcast import broadcaster
+from services.media import media_cache
+from keyboards.quiz import get_quiz_keyboard
+from middlewares.user_context import UserContextMiddleware, forget_user
+from middlewares.metrics import HandlerMetricsMiddleware, BotAPIMetricsMiddleware
+from services.metrics import instrument_engine, start_metrics_server
+from services.fsm_storage import DatabaseStorage
+from services.planner import plan_topic_broadcast
+from services.broadcast_runs import Checkpoint, open_run, served_user_ids, interrupted_jobs
+from services.scheduler import setup_scheduler as start_scheduler, run_now, job_key, split_job_key
+from services.delivery import timezone_buckets, bucket_filter, local_today
+from services.recipients import iter_recipient_chunks
+from services.reachability import UnreachableTracker
+from services.achievements import award_top_medals
+from datetime import date, timedelta
+from functools import partial
 
 # Загрузка токена из переменных окружения или config.py
 BOT_TOKEN = os.getenv('BOT_TOKEN')
@@ -19,14 +29,13 @@ if not BOT_TOKEN:
     from config import BOT_TOKEN as CONFIG_TOKEN
     BOT_TOKEN = CONFIG_TOKEN
 
+# polling (по умолчанию), webhook (см. webhook.py) или sharded (см. sharded.py)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 
 
-# Глобальный объект локалей
-LOCALES = {}
-
-
 def get_locales():
     locales = {}
     for lang in ['ru', 'en']:
@@ -40,6 +49,11 @@ def get_locales():
     return locales
 
 
+# Глобальный объект локалей; грузится при импорте, чтобы handlers
+# получали заполненный словарь и при запуске через python main.py
+LOCALES = get_locales()
+
+
 # Регистрация роутеров (handlers)
 def register_routers(dp: Dispatcher):
     from handlers import start, quiz
@@ -49,113 +63,222 @@ def register_routers(dp: Dispatcher):
     # dp.include_router(stats.router)
 
 
-def load_questions(topic, lang):
-    fname = f"data/{topic}_{lang}.json"
-    if not os.path.exists(fname):
-        return []
-    with open(fname, encoding="utf-8") as f:
-        return json.load(f)
-
-def filter_unsent_questions(questions, sent_ids):
-    return [q for q in questions if q['id'] not in sent_ids]
+async def send_question(bot: Bot, chat_id: int, topic: str, lang: str, q: dict):
+    text = f"<b>{q['question']}</b>"
+    img_path = os.path.join('data', 'images', q['image'])
+    kb = get_quiz_keyboard(q, topic, lang)
+    if os.path.exists(img_path):
+        await media_cache.send_photo(
+            partial(bot.send_photo, chat_id), img_path, caption=text, reply_markup=kb
+        )
+    else:
+        await bot.send_message(chat_id, text, reply_markup=kb)
 
-async def send_topic_question(bot: Bot, topic: str):
+async def bucket_where(bucket):
+    """Условие на пользователей корзины bucket или None — все пользователи."""
+    if bucket is None:
+        return None
     async with SessionLocal() as session:
-        users_result = await session.execute(select(User))
-        users = users_result.scalars().all()
-        for user in users:
-            lang = user.lang or 'ru'
-            questions = load_questions(topic, lang)
-            sent_result = await session.execute(
-                select(QuestionSent.question_id).where(
-                    QuestionSent.user_id == user.id,
-                    QuestionSent.topic == topic
-                )
-            )
-            sent_ids = [row[0] for row in sent_result.fetchall()]
-            available = filter_unsent_questions(questions, sent_ids)
-            if not available:
-                continue
-            q = random.choice(available)
-            # Сохраняем отправленный вопрос
-            qs = QuestionSent(
-                user_id=user.id,
-                question_id=q['id'],
-                topic=topic,
-                sent_at=datetime.now()
+        return await bucket_filter(session, bucket)
+
+
+async def deliver_question(bot: Bot, checkpoint, user, topic: str, q: dict):
+    await send_question(bot, user.tg_id, topic, user.lang or 'ru', q)
+    await checkpoint.add(user, q)
+
+
+async def question_jobs(bot: Bot, topic, id_range, bucket, key, day, checkpoint):
+    """Задания рассылки вопроса: получатели читаются и планируются пачками."""
+    served_total = 0
+    async for chunk in iter_recipient_chunks(id_range, await bucket_where(bucket)):
+        async with SessionLocal() as session:
+            served = await served_user_ids(session, key, day, [r.id for r in chunk])
+            plan = await plan_topic_broadcast(
+                session, topic, [r for r in chunk if r.id not in served]
             )
-            session.add(qs)
-            await session.commit()
-            text = f"<b>{q['question']}</b>"
-            img_path = os.path.join('data', 'images', q['image'])
-            kb = None
-            from aiogram.utils.keyboard import InlineKeyboardBuilder
-            kb_builder = InlineKeyboardBuilder()
-            for opt in q['options']:
-                kb_builder.button(text=opt, callback_data=f"quiz_answer_{topic}_{opt}")
-            kb_builder.adjust(2)
-            kb = kb_builder.as_markup()
-            try:
-                if os.path.exists(img_path):
-                    photo = InputFile(img_path)
-                    await bot.send_photo(user.tg_id, photo, caption=text, reply_markup=kb)
-                else:
-                    await bot.send_message(user.tg_id, text, reply_markup=kb)
-            except Exception as e:
-                logging.warning(f"Не удалось отправить вопрос пользователю {user.tg_id}: {e}")
-
-async def send_movie_question(bot: Bot):
-    logging.info('Рассылка вопроса по фильму (12:00 МСК)')
-    await send_topic_question(bot, 'movies')
-
-async def send_city_question(bot: Bot):
-    logging.info('Рассылка вопроса по городу (18:00 МСК)')
-    await send_topic_question(bot, 'cities')
-
-async def send_quiz_reminder(bot: Bot):
-    async with SessionLocal() as session:
-        users_result = await session.execute(select(User))
-        users = users_result.scalars().all()
-        for user in users:
+        served_total += len(served)
+        for user, q in plan:
+            yield user.tg_id, partial(deliver_question, bot, checkpoint, user, topic, q)
+    if served_total:
+        logging.info(f'Продолжили рассылку {key}: {served_total} уже получили вопрос')
+
+
+def job_today(key):
+    """День рассылки задачи: местный для корзины, без корзины — по серверу."""
+    _, bucket = split_job_key(key)
+    return date.today() if bucket is None else local_today(bucket)
+
+
+async def send_topic_question(bot: Bot, topic: str, id_range=None, bucket=None, *, job):
+    """Рассылка вопроса по теме; job — имя задачи расписания.
+
+    Рассылка за день ведётся в broadcast_runs: повторный запуск
+    (после падения или пропущенный по расписанию) пропускает тех, кому
+    вопрос уже доставлен, а завершённую рассылку не повторяет. День —
+    местный для корзины bucket.
+    """
+    key = job_key(job, bucket)
+    today = job_today(key)
+    run_id = await db_writer.run(open_run, key, topic, today, id_range)
+    if run_id is None:
+        logging.info(f'Рассылка {key} за {today} уже выполнена')
+        return
+    # Отправленные вопросы записываются пачками по мере доставки
+    checkpoint = Checkpoint(run_id, topic)
+    unreachable = UnreachableTracker()
+    jobs = question_jobs(bot, topic, id_range, bucket, key, today, checkpoint)
+    await broadcaster.run(jobs, name=f'question:{topic}', on_unreachable=unreachable.add)
+    await unreachable.flush()
+    await checkpoint.finish()
+
+async def send_movie_question(bot: Bot, id_range=None, bucket=None):
+    logging.info(f'Рассылка вопроса по фильму (12:00, {bucket or "МСК"})')
+    await send_topic_question(bot, 'movies', id_range, bucket, job='send_movie_question')
+
+async def send_city_question(bot: Bot, id_range=None, bucket=None):
+    logging.info(f'Рассылка вопроса по городу (18:00, {bucket or "МСК"})')
+    await send_topic_question(bot, 'cities', id_range, bucket, job='send_city_question')
+
+async def reminder_jobs(bot: Bot, id_range, bucket):
+    async for chunk in iter_recipient_chunks(id_range, await bucket_where(bucket)):
+        for user in chunk:
             lang = user.lang or 'ru'
             locale = LOCALES.get(lang, LOCALES['ru'])
-            try:
-                await bot.send_message(
-                    user.tg_id,
-                    locale.get('reminder_msg', '🎯 Через 10 минут — новая викторина! Не пропусти!')
-                )
-            except Exception as e:
-                logging.warning(f"Не удалось отправить напоминание пользователю {user.tg_id}: {e}")
-
-
-def setup_scheduler(bot: Bot):
-    scheduler = AsyncIOScheduler(timezone=pytz.timezone('Europe/Moscow'))
-    scheduler.add_job(send_movie_question, CronTrigger(hour=12, minute=0), args=[bot])
-    scheduler.add_job(send_city_question, CronTrigger(hour=18, minute=0), args=[bot])
+            text = locale.get('reminder_msg', '🎯 Через 10 минут — новая викторина! Не пропусти!')
+            yield user.tg_id, partial(bot.send_message, user.tg_id, text)
+
+async def send_quiz_reminder(bot: Bot, id_range=None, bucket=None):
+    unreachable = UnreachableTracker()
+    await broadcaster.run(
+        reminder_jobs(bot, id_range, bucket), name='reminder', on_unreachable=unreachable.add
+    )
+    await unreachable.flush()
+
+
+async def award_rating_medals(bot: Bot, id_range=None, bucket=None):
+    """Медали призёрам последних завершённых дня, недели и месяца.
+
+    Выдача идемпотентна (user_medals), поэтому неделя и месяц
+    проверяются каждый день — пропущенный запуск догоняется следующим.
+    """
+    today = date.today()
+    last_days = {
+        'day': today - timedelta(days=1),
+        'week': today - timedelta(days=today.weekday() + 1),
+        'month': today.replace(day=1) - timedelta(days=1),
+    }
+    for period, day in last_days.items():
+        tg_ids = await db_writer.run(award_top_medals, period, day, id_range)
+        for tg_id in tg_ids:
+            forget_user(tg_id)
+        if tg_ids:
+            logging.info(f'Медали за рейтинг ({period}, {day}): {len(tg_ids)}')
+
+
+# Расписание рассылок по местному времени пользователя: имя задачи в этом модуле и время
+SCHEDULE = [
+    ('send_movie_question', dict(hour=12, minute=0)),
+    ('send_city_question', dict(hour=18, minute=0)),
     # Новое: напоминания за 10 минут до вопросов
-    scheduler.add_job(send_quiz_reminder, CronTrigger(hour=11, minute=50), args=[bot])
-    scheduler.add_job(send_quiz_reminder, CronTrigger(hour=17, minute=50), args=[bot])
-    scheduler.start()
+    ('send_quiz_reminder', dict(hour=11, minute=50)),
+    ('send_quiz_reminder', dict(hour=17, minute=50)),
+]
 
+# Задачи без корзины: время по SCHEDULER_TIMEZONE
+GLOBAL_SCHEDULE = [
+    ('award_rating_medals', dict(hour=0, minute=5)),
+]
 
-async def main():
-    global LOCALES
-    LOCALES = get_locales()
-    await init_db()
 
+async def build_schedule():
+    """SCHEDULE для каждой корзины часовых поясов, где есть пользователи, и GLOBAL_SCHEDULE."""
+    async with SessionLocal() as session:
+        buckets = await timezone_buckets(session)
+    schedule = [(name, when, bucket) for bucket in sorted(buckets) for name, when in SCHEDULE]
+    return schedule + [(name, when, None) for name, when in GLOBAL_SCHEDULE]
+
+
+def local_runner(bot: Bot):
+    async def run(name, bucket=None):
+        await globals()[name](bot, bucket=bucket)
+    return run
+
+
+async def setup_scheduler(bot: Bot, runner=None):
+    """Запускает расписание; runner(имя, корзина) выполняет задачу (см. sharded.py).
+
+    Прерванные сегодня рассылки запускаются заново и продолжаются с
+    чекпоинта; прерванные в прошлые дни не продолжаются.
+    """
+    scheduler = await start_scheduler(build_schedule, runner or local_runner(bot))
+    interrupted = await db_writer.run(interrupted_jobs, job_today)
+    if interrupted:
+        run_now(scheduler, interrupted)
+    return scheduler
+
+
+def build_dispatcher(storage=None):
+    dp = Dispatcher(storage=storage)
+    dp["locales"] = LOCALES  # 👈 ПЕРЕДАЕМ локали в диспетчер
+    # Пользователь, язык и сессия БД — один раз на апдейт и только когда
+    # нашёлся хендлер: обычный текст вне меню не обращается к БД
+    # Метрики — первыми: в замер попадает и загрузка пользователя
+    handler_metrics = HandlerMetricsMiddleware()
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    user_context = UserContextMiddleware()
+    dp.message.middleware(user_context)
+    dp.callback_query.middleware(user_context)
+    register_routers(dp)
+    return dp
+
+
+def make_bot(session=None):
+    """Бот; session — своя AiohttpSession (например, с другим Bot API сервером)."""
     from aiogram.client.default import DefaultBotProperties
     bot = Bot(
         token=BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    bot.session.middleware(BotAPIMetricsMiddleware())
+    return bot
 
-    dp = Dispatcher()
-    dp["locales"] = LOCALES  # 👈 ПЕРЕДАЕМ локали в диспетчер
 
-    register_routers(dp)
-    setup_scheduler(bot)
-    logging.info('Bot started')
-    await dp.start_polling(bot)
+async def main():
+    question_bank.load_all()
+    instrument_engine(engine)
+    await init_db()
+    await media_cache.load()
+    # В режиме sharded воркеры отдают свои метрики на следующих портах (см. sharded.py)
+    metrics_server = await start_metrics_server()
+
+    bot = make_bot()
+    if BOT_MODE == 'sharded':
+        # Апдейты и рассылки — в процессах-воркерах, здесь только приём и расписание
+        from sharded import run_coordinator
+        try:
+            await run_coordinator(bot)
+        finally:
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+        return
+
+    # FSM в БД: состояния админки и отзывов переживают перезапуск
+    storage = DatabaseStorage()
+    dp = build_dispatcher(storage)
+    await setup_scheduler(bot)
+    logging.info(f'Bot started ({BOT_MODE})')
+    try:
+        if BOT_MODE == 'webhook':
+            from webhook import run_webhook
+            await run_webhook(dp, bot)
+        else:
+            await dp.start_polling(bot)
+    finally:
+        await storage.close()
+        if metrics_server is not None:
+            await metrics_server.cleanup()
 
 
 
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+
+from services import metrics
+from services.reachability import classify_error
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время хендлера и запросы к БД за апдейт — в services.metrics.
+
+    Регистрируется inner middleware сообщений и колбэков раньше
+    UserContextMiddleware: в замер попадают и загрузка пользователя, и
+    сессия. Хендлер известен только после фильтров, поэтому апдейты без
+    хендлера не учитываются.
+    """
+
+    async def __call__(self, handler, event, data):
+        callback = data['handler'].callback
+        name = f'{callback.__module__}.{callback.__name__}'
+        task = asyncio.current_task()
+        stats = metrics.update_db_stats[task] = metrics.UpdateDBStats()
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(name)
+            raise
+        finally:
+            metrics.handler_seconds.observe(time.perf_counter() - started, name)
+            metrics.update_db_queries.observe(stats.queries, name)
+            metrics.update_db_seconds.observe(stats.seconds, name)
+            metrics.update_db_stats.pop(task, None)
+
+
+class BotAPIMetricsMiddleware(BaseRequestMiddleware):
+    """Время запросов к Bot API по методу и ошибки по классу (services.reachability)."""
+
+    async def __call__(self, make_request, bot, method):
+        name = method.__api_method__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.api_errors.inc(name, classify_error(e))
+            raise
+        finally:
+            metrics.api_request_seconds.observe(time.perf_counter() - started, name)
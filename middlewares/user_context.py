@@ -0,0 +1,99 @@
+import asyncio
+import os
+from contextlib import nullcontext
+
+from aiogram import BaseMiddleware
+from sqlalchemy import inspect, select, update
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from db import UPDATE_SESSIONS, SessionLocal, User, db_writer
+from services.cache import TTLCache
+
+
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', '10000'))
+USER_CACHE_TTL = float(os.getenv('USER_CACHE_TTL', '30'))
+
+# tg_id -> снимок колонок User; сам ORM-объект живёт только в своей сессии
+user_cache = TTLCache(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+USER_COLUMNS = [c.key for c in User.__table__.columns]
+
+# Сессии апдейтов не должны занять весь пул — см. db.UPDATE_SESSIONS
+update_sessions = nullcontext() if UPDATE_SESSIONS is None else asyncio.Semaphore(UPDATE_SESSIONS)
+
+
+def forget_user(tg_id):
+    """Сбрасывает кэш; вызывается после любого изменения пользователя в БД."""
+    user_cache.pop(tg_id)
+
+
+async def mark_reachable(session, user_id):
+    await session.execute(
+        update(User).where(User.id == user_id).values(is_reachable=True, last_delivery_error=None)
+    )
+
+
+def _snapshot(user):
+    return {key: getattr(user, key) for key in USER_COLUMNS}
+
+
+def _changed(user, snapshot):
+    state = inspect(user)
+    # unloaded — поля сброшены UPDATE-запросом (например, award_medals)
+    if snapshot is None or state.modified or state.unloaded:
+        return True
+    return _snapshot(user) != snapshot
+
+
+class UserContextMiddleware(BaseMiddleware):
+    """Находит пользователя один раз на апдейт.
+
+    Регистрируется как inner middleware сообщений и колбэков, то есть
+    срабатывает уже после фильтров — только для апдейтов, у которых есть
+    хендлер.
+
+    Кладёт в данные хендлера session (одна на апдейт), user (или None),
+    lang и locale. Пользователь берётся из короткоживущего кэша по
+    tg_id и присоединяется к сессии без запроса к БД; помеченный
+    недоступным для рассылок снова становится доступным. Изменения user в
+    этой сессии сбрасывают кэш сами; если пользователь меняется в другой
+    сессии (например, через db_writer), нужно вызвать forget_user(tg_id).
+
+    Одновременно открыто не больше db.UPDATE_SESSIONS сессий апдейтов:
+    остальные апдейты ждут здесь, а соединения для db_writer остаются.
+    """
+
+    async def __call__(self, handler, event, data):
+        from_user = data.get('event_from_user')
+        locales = data.get('locales', {})
+        async with update_sessions, SessionLocal() as session:
+            user = await self._resolve(session, from_user.id) if from_user else None
+            if user is not None and not user.is_reachable:
+                # Написал боту — значит, снова доступен для рассылок
+                await db_writer.run(mark_reachable, user.id)
+                set_committed_value(user, 'is_reachable', True)
+                set_committed_value(user, 'last_delivery_error', None)
+                forget_user(from_user.id)
+            lang = user.lang if user and user.lang else 'ru'
+            data['session'] = session
+            data['user'] = user
+            data['lang'] = lang
+            data['locale'] = locales.get(lang, locales.get('ru', {}))
+            try:
+                return await handler(event, data)
+            finally:
+                # Пользователя поменяли в этой сессии — снимок в кэше устарел
+                if user is not None and _changed(user, user_cache.get(from_user.id)):
+                    forget_user(from_user.id)
+
+    async def _resolve(self, session, tg_id):
+        cached = user_cache.get(tg_id)
+        if cached is not None:
+            user = User(**cached)
+            make_transient_to_detached(user)
+            return await session.merge(user, load=False)
+        result = await session.execute(select(User).where(User.tg_id == tg_id))
+        user = result.scalar_one_or_none()
+        if user is not None:
+            user_cache.set(tg_id, _snapshot(user))
+        return user
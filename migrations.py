@@ -0,0 +1,144 @@
+"""Версионные миграции схемы.
+
+init_db() сначала создаёт недостающие таблицы через create_all, затем
+применяет по порядку миграции, которых ещё нет в schema_version. Каждая
+миграция должна быть идемпотентной: на свежей базе create_all уже создал
+всё нужное, и миграция только проверяет это.
+
+Новая миграция — функция с декоратором @migration(<следующий номер>, ...),
+получающая синхронное соединение SQLAlchemy.
+"""
+import logging
+from datetime import datetime
+
+from sqlalchemy import inspect, select, text
+
+from db import Base, SchemaVersion
+
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return decorator
+
+
+def add_column_if_missing(conn, table, column):
+    """ALTER TABLE ADD COLUMN для колонки модели, если её ещё нет."""
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    if column.name in existing:
+        return
+    col_type = column.type.compile(dialect=conn.dialect)
+    ddl = f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'
+    default = getattr(column.default, 'arg', None)
+    if isinstance(default, (int, str)):
+        ddl += f' DEFAULT {default!r}'
+    conn.execute(text(ddl))
+
+
+def create_indexes(conn, table):
+    # Индексы по колонкам, которые добавит более поздняя миграция, создаст она же
+    existing = {c['name'] for c in inspect(conn).get_columns(table.name)}
+    for index in table.indexes:
+        if all(column.name in existing for column in index.columns):
+            index.create(conn, checkfirst=True)
+
+
+@migration(1, 'users: medals_count, last_medal_at')
+def _users_medal_columns(conn):
+    users = Base.metadata.tables['users']
+    add_column_if_missing(conn, users, users.c.medals_count)
+    add_column_if_missing(conn, users, users.c.last_medal_at)
+    # Медали из строки users.medals — в user_medals и счётчики, иначе
+    # после обновления доска ачивок пуста до ручного backfill
+    from services.achievements import backfill_medals_sync
+    backfill_medals_sync(conn)
+
+
+@migration(2, 'questions_sent: remove duplicate (user_id, topic, question_id)')
+def _dedupe_questions_sent(conn):
+    conn.execute(text(
+        'DELETE FROM questions_sent WHERE id NOT IN ('
+        ' SELECT MIN(id) FROM questions_sent'
+        ' GROUP BY user_id, topic, question_id)'
+    ))
+
+
+@migration(3, 'composite indexes for answers, questions_sent, users')
+def _composite_indexes(conn):
+    for name in ('users', 'answers', 'questions_sent'):
+        create_indexes(conn, Base.metadata.tables[name])
+
+
+@migration(4, 'users: BIGINT tg_id/referrer_id on PostgreSQL')
+def _users_bigint_ids(conn):
+    # id пользователей Telegram не помещаются в int4; в SQLite INTEGER и так 64-битный
+    if conn.dialect.name != 'postgresql':
+        return
+    conn.execute(text('ALTER TABLE users ALTER COLUMN tg_id TYPE BIGINT'))
+    conn.execute(text('ALTER TABLE users ALTER COLUMN referrer_id TYPE BIGINT'))
+
+
+@migration(5, 'answers: answer_day with unique (user_id, question_id, topic, answer_day)')
+def _answers_unique_day(conn):
+    answers = Base.metadata.tables['answers']
+    add_column_if_missing(conn, answers, answers.c.answer_day)
+    conn.execute(text('UPDATE answers SET answer_day = date(date) WHERE answer_day IS NULL'))
+    # Ответы, проскочившие проверку «уже отвечал сегодня», оставляем первыми
+    conn.execute(text(
+        'DELETE FROM answers WHERE id NOT IN ('
+        ' SELECT MIN(id) FROM answers'
+        ' GROUP BY user_id, question_id, topic, answer_day)'
+    ))
+    conn.execute(text('DROP INDEX IF EXISTS ix_answers_user_question'))
+    create_indexes(conn, answers)
+
+
+@migration(6, 'questions_sent: run_id for broadcast checkpoints')
+def _questions_sent_run_id(conn):
+    questions_sent = Base.metadata.tables['questions_sent']
+    add_column_if_missing(conn, questions_sent, questions_sent.c.run_id)
+    create_indexes(conn, questions_sent)
+
+
+@migration(7, 'users: timezone index for delivery buckets')
+def _users_timezone_index(conn):
+    create_indexes(conn, Base.metadata.tables['users'])
+
+
+@migration(8, 'users: is_reachable, last_delivery_error')
+def _users_reachability(conn):
+    users = Base.metadata.tables['users']
+    add_column_if_missing(conn, users, users.c.is_reachable)
+    add_column_if_missing(conn, users, users.c.last_delivery_error)
+    create_indexes(conn, users)
+
+
+@migration(9, 'score_aggregates: fill from answers')
+def _fill_score_aggregates(conn):
+    # Таблицу создал create_all; без заполнения рейтинги после обновления
+    # пусты, пока не набегут новые ответы
+    from services.leaderboard import backfill_sync
+    backfill_sync(conn)
+
+
+@migration(10, 'user_day_activity: fill from answers')
+def _fill_user_day_activity(conn):
+    # Без истории серии 🐢 и 📆 после обновления начинаются с нуля
+    from services.streaks import backfill_activity_sync
+    backfill_activity_sync(conn)
+
+
+def run_migrations(conn):
+    applied = set(conn.execute(select(SchemaVersion.version)).scalars())
+    for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in applied:
+            continue
+        logging.info(f'Applying migration {version}: {description}')
+        fn(conn)
+        conn.execute(SchemaVersion.__table__.insert().values(
+            version=version, description=description, applied_at=datetime.now()
+        ))
@@ -0,0 +1,123 @@
+import logging
+from datetime import datetime
+
+from sqlalchemy import delete, func, insert, select, update
+
+from db import Answer, User, UserMedal, upsert_insert
+from services.leaderboard import top_scores
+
+
+# Медали за места в рейтинге: за день — только первое место
+RATING_MEDALS = {
+    'day': {1: '🥇'},
+    'week': {1: '🥇', 2: '🥈', 3: '🥉'},
+    'month': {1: '🥇', 2: '🥈', 3: '🥉'},
+}
+
+
+async def award_medals(session, user_id, medals, when=None):
+    """Выдаёт медали пользователю; уже полученные пропускаются.
+
+    Обновляет user_medals, счётчик medals_count, last_medal_at и строку
+    User.medals для показа. Возвращает список новых медалей.
+    """
+    when = when or datetime.now()
+    new = []
+    for medal in medals:
+        result = await session.execute(
+            upsert_insert(UserMedal)
+            .values(user_id=user_id, medal=medal, awarded_at=when)
+            .on_conflict_do_nothing()
+        )
+        if result.rowcount:
+            new.append(medal)
+    if new:
+        await session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(
+                medals_count=func.coalesce(User.medals_count, 0) + len(new),
+                last_medal_at=when,
+                medals=func.coalesce(User.medals, '') + ''.join(f'{m} ' for m in new),
+            )
+        )
+    return new
+
+
+async def award_top_medals(session, period, day, id_range=None):
+    """Медали призёрам рейтинга за период, в который входит day (через db_writer).
+
+    id_range — награждать только пользователей из диапазона users.id: в
+    режиме sharded каждый воркер считает общий топ и награждает своих.
+    Возвращает tg_id получивших новые медали — их кэш нужно сбросить.
+    """
+    medals = RATING_MEDALS[period]
+    scores = await top_scores(session, period, day, limit=len(medals))
+    awarded = []
+    for place, (user_id, _) in enumerate(scores, 1):
+        if id_range is not None and not id_range[0] <= user_id < id_range[1]:
+            continue
+        if await award_medals(session, user_id, [medals[place]]):
+            awarded.append(user_id)
+    if not awarded:
+        return []
+    result = await session.execute(select(User.tg_id).where(User.id.in_(awarded)))
+    return list(result.scalars())
+
+
+async def user_medals(session, user_id):
+    """Медали пользователя из user_medals — основной источник; строка
+    User.medals только для показа."""
+    result = await session.execute(select(UserMedal.medal).where(UserMedal.user_id == user_id))
+    return set(result.scalars())
+
+
+async def top_medal_holders(session, limit=10):
+    """Топ по количеству медалей, при равенстве — у кого последняя свежее."""
+    result = await session.execute(
+        select(User)
+        .where(User.medals_count > 0)
+        .order_by(User.medals_count.desc(), User.last_medal_at.desc())
+        .limit(limit)
+    )
+    return result.scalars().all()
+
+
+def backfill_medals_sync(session):
+    """Переносит медали из строки User.medals в user_medals.
+
+    Дата выдачи старых медалей неизвестна — берём дату последнего ответа.
+    session — синхронные Session или Connection: вызывается из миграции 1
+    и из backfill_medals().
+    """
+    last_answers = dict(
+        session.execute(
+            select(Answer.user_id, func.max(Answer.date)).group_by(Answer.user_id)
+        ).all()
+    )
+    result = session.execute(
+        select(User.id, User.medals).where(User.medals.is_not(None), User.medals != '')
+    )
+    rows = []
+    counts = []
+    for user_id, medals in result.all():
+        unique = list(dict.fromkeys(medals.split()))
+        when = last_answers.get(user_id) or datetime.now()
+        rows.extend(
+            {'user_id': user_id, 'medal': m, 'awarded_at': when} for m in unique
+        )
+        counts.append((user_id, len(unique), when, ''.join(f'{m} ' for m in unique)))
+    session.execute(delete(UserMedal))
+    if rows:
+        session.execute(insert(UserMedal), rows)
+    for user_id, count, when, medals in counts:
+        session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(medals_count=count, last_medal_at=when, medals=medals)
+        )
+    logging.info(f'Medals backfill: {len(rows)} medals for {len(counts)} users')
+
+
+async def backfill_medals(session):
+    await session.run_sync(backfill_medals_sync)
@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter
+
+from aiogram.exceptions import TelegramRetryAfter
+
+from services.metrics import REGISTRY, Gauge
+from services.reachability import PERMANENT_ERRORS, RATE_LIMITED, classify_error
+
+
+# Лимиты Telegram: ~30 сообщений в секунду на бота и ~1 в секунду на чат.
+# Берём с запасом, чтобы не ловить 429.
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+PER_CHAT_INTERVAL = float(os.getenv('BROADCAST_PER_CHAT_INTERVAL', '1.0'))
+MAX_RETRIES = 3
+CHAT_NEXT_PRUNE = 1000
+PROGRESS_EVERY = 500
+
+
+class TokenBucket:
+    """Глобальный ограничитель скорости: rate токенов в секунду."""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        # RetryAfter действует на весь бот — останавливаем всех воркеров
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Пауза — не простой: токены начинают копиться только после неё
+        self._tokens = 0
+        self._updated = self._paused_until
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(
+                    self.capacity, self._tokens + (now - self._updated) * self.rate
+                )
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BroadcastStats:
+    def __init__(self, name):
+        self.name = name
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.errors = Counter()  # исход -> число, см. services.reachability
+        self.started_at = time.monotonic()
+        self.finished_at = None
+
+    @property
+    def processed(self):
+        return self.sent + self.failed
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def rate(self):
+        return self.processed / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        errors = ''.join(f", {reason}={count}" for reason, count in sorted(self.errors.items()))
+        return (
+            f"{self.name}: {self.processed}/{self.total} "
+            f"(sent={self.sent}, failed={self.failed}, retried={self.retried}{errors}) "
+            f"за {self.elapsed:.1f}с, {self.rate:.1f} msg/s"
+        )
+
+
+# Последний запуск каждой рассылки по имени — для метрик
+recent_broadcasts = {}
+
+BROADCAST_GAUGES = [
+    ('bot_broadcast_total', 'Заданий рассылки (пока она идёт — прочитанных)', lambda s: s.total),
+    ('bot_broadcast_sent', 'Доставлено сообщений', lambda s: s.sent),
+    ('bot_broadcast_failed', 'Не доставлено сообщений', lambda s: s.failed),
+    ('bot_broadcast_retried', 'Повторов после RetryAfter', lambda s: s.retried),
+    ('bot_broadcast_rate', 'Сообщений в секунду', lambda s: s.rate),
+    ('bot_broadcast_running', '1, пока рассылка идёт', lambda s: int(s.finished_at is None)),
+]
+
+
+@REGISTRY.collector
+def broadcast_metrics():
+    lines = []
+    for metric, help, value in BROADCAST_GAUGES:
+        gauge = Gauge(metric, help, ['name'])
+        for name, stats in recent_broadcasts.items():
+            gauge.set(value(stats), name)
+        lines.extend(gauge.render())
+    errors = Gauge('bot_broadcast_errors', 'Неудачные отправки по исходу', ['name', 'reason'])
+    for name, stats in recent_broadcasts.items():
+        for reason, count in stats.errors.items():
+            errors.set(count, name, reason)
+    lines.extend(errors.render())
+    return lines
+
+
+class Broadcaster:
+    """Рассылка через пул воркеров с ограничением скорости.
+
+    Задание — пара (chat_id, send), где send() возвращает корутину
+    отправки. RetryAfter повторяется после паузы, прочие ошибки
+    классифицируются (services.reachability.classify_error) и
+    учитываются в статистике; о чатах, которым доставить нельзя
+    совсем, сообщается в on_unreachable(chat_id, reason).
+    """
+
+    def __init__(
+        self,
+        workers=BROADCAST_WORKERS,
+        rate=BROADCAST_RATE,
+        per_chat_interval=PER_CHAT_INTERVAL,
+        max_retries=MAX_RETRIES,
+        progress_every=PROGRESS_EVERY,
+    ):
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+        self._chat_next = {}
+
+    async def _wait_chat(self, chat_id):
+        now = time.monotonic()
+        if len(self._chat_next) > CHAT_NEXT_PRUNE:
+            # Чаты, интервал которых уже прошёл, больше не нужны — иначе
+            # словарь растёт на каждого получателя рассылки
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        ready_at = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, ready_at) + self.per_chat_interval
+        if ready_at > now:
+            await asyncio.sleep(ready_at - now)
+
+    async def _deliver(self, chat_id, send, stats, on_unreachable):
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire()
+            await self._wait_chat(chat_id)
+            try:
+                await send()
+                stats.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    logging.warning(f"Рассылка {stats.name}: {chat_id} не доставлено после {attempt} повторов: {e}")
+                    stats.errors[RATE_LIMITED] += 1
+                    break
+                stats.retried += 1
+                self.bucket.pause(e.retry_after)
+            except Exception as e:
+                reason = classify_error(e)
+                stats.errors[reason] += 1
+                if reason in PERMANENT_ERRORS:
+                    # Заблокировавших бота бывает много — это не повод для warning
+                    logging.debug(f"Рассылка {stats.name}: {chat_id} недоступен ({reason}): {e}")
+                    if on_unreachable is not None:
+                        await self._report_unreachable(on_unreachable, chat_id, reason, stats)
+                else:
+                    logging.warning(f"Рассылка {stats.name}: не удалось отправить {chat_id}: {e}")
+                break
+        stats.failed += 1
+
+    async def _report_unreachable(self, on_unreachable, chat_id, reason, stats):
+        # Упавший колбэк не должен останавливать воркера — иначе очередь
+        # перестанет разбираться и рассылка встанет
+        try:
+            await on_unreachable(chat_id, reason)
+        except Exception:
+            logging.exception(f"Рассылка {stats.name}: ошибка on_unreachable для {chat_id}")
+
+    async def _worker(self, queue, stats, on_unreachable):
+        while True:
+            job = await queue.get()
+            try:
+                if job is None:
+                    return
+                await self._deliver(*job, stats, on_unreachable)
+                if stats.processed % self.progress_every == 0:
+                    logging.info(str(stats))
+            finally:
+                queue.task_done()
+
+    async def run(self, jobs, name='broadcast', on_unreachable=None):
+        """jobs — итерируемое или асинхронно итерируемое заданий.
+
+        Очередь ограничена, поэтому генератор заданий читается по мере
+        отправки и вся рассылка не держится в памяти.
+        """
+        stats = recent_broadcasts[name] = BroadcastStats(name)
+        queue = asyncio.Queue(maxsize=self.workers * 2)
+        workers = [
+            asyncio.create_task(self._worker(queue, stats, on_unreachable))
+            for _ in range(self.workers)
+        ]
+        try:
+            if hasattr(jobs, '__aiter__'):
+                async for job in jobs:
+                    stats.total += 1
+                    await queue.put(job)
+            else:
+                for job in jobs:
+                    stats.total += 1
+                    await queue.put(job)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for w in workers:
+                w.cancel()
+            # Только истёкшие интервалы: параллельная рассылка могла ещё не
+            # дойти до своих чатов
+            now = time.monotonic()
+            self._chat_next = {c: t for c, t in self._chat_next.items() if t > now}
+        stats.finished_at = time.monotonic()
+        logging.info(f"Рассылка завершена — {stats}")
+        return stats
+
+
+broadcaster = Broadcaster()
@@ -0,0 +1,143 @@
+import logging
+import os
+from datetime import datetime
+
+from sqlalchemy import select, tuple_, update
+
+from db import BroadcastRun, QuestionSent, db_writer, upsert_insert
+from services.planner import save_sent
+
+
+# Как часто (в доставленных сообщениях) сохраняем, кому рассылка уже ушла
+CHECKPOINT_EVERY = int(os.getenv('BROADCAST_CHECKPOINT_EVERY', '200'))
+
+
+def range_key(id_range):
+    return 'all' if id_range is None else f'{id_range[0]}-{id_range[1]}'
+
+
+async def open_run(session, job, topic, day, id_range=None):
+    """id рассылки job за день day или None, если она уже завершена.
+
+    Повторный запуск (догоняющий после простоя или после падения)
+    получает ту же запись и продолжает её.
+    """
+    key = range_key(id_range)
+    await session.execute(
+        upsert_insert(BroadcastRun).values(
+            job=job, topic=topic, run_day=day, range_key=key,
+            status='running', sent=0, started_at=datetime.now(),
+        ).on_conflict_do_nothing(index_elements=['job', 'run_day', 'range_key'])
+    )
+    run = (await session.execute(
+        select(BroadcastRun).where(
+            BroadcastRun.job == job,
+            BroadcastRun.run_day == day,
+            BroadcastRun.range_key == key,
+        )
+    )).scalar_one()
+    return None if run.status == 'done' else run.id
+
+
+async def served_user_ids(session, job, day, user_ids):
+    """Кому из user_ids рассылка job за день уже доставлена.
+
+    Смотрим все диапазоны: после перезапуска воркеры могут поделить
+    пользователей иначе.
+    """
+    runs = select(BroadcastRun.id).where(BroadcastRun.job == job, BroadcastRun.run_day == day)
+    result = await session.execute(
+        select(QuestionSent.user_id).where(
+            QuestionSent.run_id.in_(runs), QuestionSent.user_id.in_(user_ids)
+        )
+    )
+    return set(result.scalars())
+
+
+async def finish_run(session, run_id):
+    await session.execute(
+        update(BroadcastRun).where(BroadcastRun.id == run_id).values(
+            status='done', finished_at=datetime.now()
+        )
+    )
+
+
+async def interrupted_jobs(session, today):
+    """Задачи, сегодняшние рассылки которых начались, но не завершились.
+
+    today(job) — сегодняшний день задачи (у корзин свой). Незавершённые
+    рассылки прошлых дней помечаются 'expired': повторный запуск задачи
+    разослал бы уже вопрос нового дня, а не продолжил бы старую рассылку.
+    """
+    result = await session.execute(
+        select(BroadcastRun.job, BroadcastRun.run_day).distinct().where(
+            BroadcastRun.status == 'running'
+        )
+    )
+    jobs = set()
+    for job, run_day in result.all():
+        day = today(job)
+        if run_day >= day:
+            jobs.add(job)
+            continue
+        logging.info(f'Рассылка {job} за {run_day} не завершена и устарела')
+        await session.execute(
+            update(BroadcastRun).where(
+                BroadcastRun.job == job,
+                BroadcastRun.run_day == run_day,
+                BroadcastRun.status == 'running',
+            ).values(status='expired', finished_at=datetime.now())
+        )
+    return jobs
+
+
+async def _save_checkpoint(session, run_id, topic, batch):
+    inserted = await save_sent(session, topic, batch, run_id)
+    skipped = [(user.id, q['id']) for user, q in batch if (user.id, q['id']) not in inserted]
+    if skipped:
+        # Вопрос уже записан через «Играть»: помечаем строку этой рассылкой,
+        # иначе после перезапуска served_user_ids не увидит пользователя и
+        # рассылка выдаст ему ещё один вопрос
+        await session.execute(
+            update(QuestionSent).where(
+                QuestionSent.topic == topic,
+                QuestionSent.run_id.is_(None),
+                tuple_(QuestionSent.user_id, QuestionSent.question_id).in_(skipped),
+            ).values(run_id=run_id)
+        )
+    if inserted:
+        await session.execute(
+            update(BroadcastRun).where(BroadcastRun.id == run_id).values(
+                sent=BroadcastRun.sent + len(inserted)
+            )
+        )
+
+
+class Checkpoint:
+    """Копит доставленные (user, question) и пачками пишет их в questions_sent.
+
+    После падения повторно могут уйти только сообщения последней
+    несохранённой пачки (до CHECKPOINT_EVERY).
+    """
+
+    def __init__(self, run_id, topic, every=CHECKPOINT_EVERY, writer=db_writer):
+        self.run_id = run_id
+        self.topic = topic
+        self.every = every
+        self.writer = writer
+        self._batch = []
+
+    async def add(self, user, q):
+        self._batch.append((user, q))
+        if len(self._batch) >= self.every:
+            await self.flush()
+
+    async def flush(self):
+        batch, self._batch = self._batch, []
+        if batch:
+            await self.writer.run(_save_checkpoint, self.run_id, self.topic, batch)
+
+    async def finish(self):
+        await self.flush()
+        await self.writer.run(finish_run, self.run_id)
+        logging.info(f'Broadcast run {self.run_id} ({self.topic}) finished')
@@ -0,0 +1,56 @@
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Небольшой LRU-кэш в памяти процесса с временем жизни записей."""
+
+    def __init__(self, maxsize=256, ttl=30.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or item[0] < time.monotonic():
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[1]
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key):
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def invalidate_if(self, predicate):
+        """Удаляет записи, для которых predicate(key, value) истинно."""
+        stale = [k for k, (_, v) in self._data.items() if predicate(k, v)]
+        for key in stale:
+            del self._data[key]
+        return len(stale)
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
@@ -0,0 +1,68 @@
+"""Доставка по местному времени пользователей.
+
+Пользователи группируются в «корзины» по текущему смещению их
+часового пояса от UTC (User.timezone). Для каждой корзины задачи
+расписания ставятся на местное время — 12:00 и 18:00 у пользователя,
+а не у всех сразу по Москве, — и вместо двух больших рассылок в день
+получается несколько небольших. Смещения пересчитываются каждый час,
+поэтому переход на летнее время и новые часовые пояса подхватываются сами.
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytz
+from sqlalchemy import or_, select
+
+from db import User
+
+
+DEFAULT_TIMEZONE = 'Europe/Moscow'
+
+
+def utc_offset(tz_name, now=None):
+    """Смещение пояса от UTC в минутах; неизвестный пояс — как DEFAULT_TIMEZONE."""
+    now = now or datetime.now(timezone.utc)
+    try:
+        tz = pytz.timezone(tz_name or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        tz = pytz.timezone(DEFAULT_TIMEZONE)
+    return int(now.astimezone(tz).utcoffset().total_seconds() // 60)
+
+
+def bucket_name(offset):
+    sign = '+' if offset >= 0 else '-'
+    hours, minutes = divmod(abs(offset), 60)
+    return f'UTC{sign}{hours:02d}:{minutes:02d}'
+
+
+def bucket_offset(bucket):
+    sign = -1 if bucket[3] == '-' else 1
+    hours, minutes = bucket[4:].split(':')
+    return sign * (int(hours) * 60 + int(minutes))
+
+
+def bucket_tz(bucket):
+    return timezone(timedelta(minutes=bucket_offset(bucket)))
+
+
+def local_today(bucket):
+    """Сегодняшняя дата у пользователей корзины."""
+    return datetime.now(bucket_tz(bucket)).date()
+
+
+async def timezone_buckets(session, now=None):
+    """{корзина: [названия поясов]} по поясам, которые есть у пользователей."""
+    result = await session.execute(select(User.timezone).distinct())
+    buckets = {}
+    for tz_name in result.scalars():
+        buckets.setdefault(bucket_name(utc_offset(tz_name, now)), []).append(tz_name)
+    return buckets
+
+
+async def bucket_filter(session, bucket):
+    """Условие на User для пользователей корзины."""
+    tz_names = (await timezone_buckets(session)).get(bucket, [])
+    named = [name for name in tz_names if name is not None]
+    condition = User.timezone.in_(named)
+    if None in tz_names:
+        condition = or_(condition, User.timezone.is_(None))
+    return condition
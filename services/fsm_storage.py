@@ -0,0 +1,170 @@
+import asyncio
+import copy
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder
+from sqlalchemy import delete, select
+
+from db import SessionLocal, FSMRecord, db_writer, upsert_insert
+from services.cache import TTLCache
+
+
+# Брошенное состояние (например, админ не дописал вопрос) живёт столько секунд
+FSM_STATE_TTL = int(os.getenv('FSM_STATE_TTL', str(7 * 24 * 3600)))
+# Как часто сбрасываем накопленные изменения в БД
+FSM_FLUSH_INTERVAL = float(os.getenv('FSM_FLUSH_INTERVAL', '0.5'))
+# Сколько держим прочитанное состояние в памяти; при нескольких воркерах без
+# привязки пользователя к воркеру ставьте 0
+FSM_CACHE_TTL = float(os.getenv('FSM_CACHE_TTL', '30'))
+FSM_CACHE_SIZE = int(os.getenv('FSM_CACHE_SIZE', '10000'))
+# Раз в сколько секунд удаляем просроченные записи
+FSM_PURGE_INTERVAL = 3600
+
+EMPTY = (None, {})
+
+
+def dump_data(data):
+    # Компактный JSON: без пробелов и \u-экранирования кириллицы
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False) if data else None
+
+
+def load_data(raw):
+    return json.loads(raw) if raw else {}
+
+
+class DatabaseStorage(BaseStorage):
+    """FSM-хранилище в нашей БД (таблица fsm_states).
+
+    Состояние и данные ключа лежат в одной строке. Запись отложенная:
+    изменения копятся в памяти и раз в FSM_FLUSH_INTERVAL уходят в БД
+    одной транзакцией через db_writer; чтение сначала смотрит в
+    несохранённые изменения и кэш. Пустое состояние удаляет строку,
+    строки без изменений дольше FSM_STATE_TTL считаются брошенными и
+    периодически удаляются.
+    """
+
+    def __init__(self, session_factory=SessionLocal, writer=db_writer,
+                 state_ttl=FSM_STATE_TTL, flush_interval=FSM_FLUSH_INTERVAL,
+                 cache_ttl=FSM_CACHE_TTL):
+        self.session_factory = session_factory
+        self.writer = writer
+        self.state_ttl = timedelta(seconds=state_ttl)
+        self.flush_interval = flush_interval
+        self.key_builder = DefaultKeyBuilder(with_bot_id=True)
+        self._cache = TTLCache(maxsize=FSM_CACHE_SIZE, ttl=cache_ttl)
+        self._pending = {}  # key -> (state, data), ещё не записано в БД
+        self._puts = 0  # число вызовов _put: по нему _load видит записи во время чтения
+        self._flush_task = None
+        self._flush_lock = asyncio.Lock()
+        self._last_purge = 0.0
+
+    async def _load(self, key):
+        if key in self._pending:
+            return self._pending[key]
+        value = self._cache.get(key)
+        if value is not None:
+            return value
+        puts = self._puts
+        async with self.session_factory() as session:
+            row = (await session.execute(
+                select(FSMRecord.state, FSMRecord.data).where(
+                    FSMRecord.key == key, FSMRecord.expires_at > datetime.now()
+                )
+            )).first()
+        value = (row.state, load_data(row.data)) if row else EMPTY
+        if key in self._pending:
+            # Пока читали, ключ изменили — прочитанное уже устарело
+            return self._pending[key]
+        if puts != self._puts:
+            # Во время чтения были записи, возможно, этого ключа и уже
+            # сброшенные в БД: прочитанное в кэш не кладём, иначе оно
+            # затрёт свежее значение
+            fresh = self._cache.get(key)
+            return value if fresh is None else fresh
+        self._cache.set(key, value)
+        return value
+
+    def _put(self, key, state, data):
+        value = (state, data) if state is not None or data else EMPTY
+        self._puts += 1
+        self._cache.set(key, value)
+        self._pending[key] = value
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        while self._pending:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        """Записывает накопленные изменения одной транзакцией."""
+        async with self._flush_lock:
+            if not self._pending and time.monotonic() - self._last_purge < FSM_PURGE_INTERVAL:
+                return
+            batch, self._pending = self._pending, {}
+            try:
+                await self.writer.run(self._write, batch)
+            except Exception as e:
+                logging.error(f'FSM flush failed ({len(batch)} keys): {e}')
+                # Возвращаем в очередь, не затирая более свежие изменения
+                for key, value in batch.items():
+                    self._pending.setdefault(key, value)
+
+    async def _write(self, session, batch):
+        now = datetime.now()
+        rows = [
+            {'key': key, 'state': state, 'data': dump_data(data), 'expires_at': now + self.state_ttl}
+            for key, (state, data) in batch.items()
+            if state is not None or data
+        ]
+        if rows:
+            stmt = upsert_insert(FSMRecord)
+            await session.execute(
+                stmt.on_conflict_do_update(
+                    index_elements=['key'],
+                    set_={
+                        'state': stmt.excluded.state,
+                        'data': stmt.excluded.data,
+                        'expires_at': stmt.excluded.expires_at,
+                    },
+                ),
+                rows,
+            )
+        empty = [key for key, value in batch.items() if value is EMPTY]
+        if empty:
+            await session.execute(delete(FSMRecord).where(FSMRecord.key.in_(empty)))
+        if time.monotonic() - self._last_purge >= FSM_PURGE_INTERVAL:
+            await session.execute(delete(FSMRecord).where(FSMRecord.expires_at <= now))
+            self._last_purge = time.monotonic()
+
+    async def set_state(self, key, state=None):
+        storage_key = self.key_builder.build(key)
+        _, data = await self._load(storage_key)
+        self._put(storage_key, state.state if isinstance(state, State) else state, data)
+
+    async def get_state(self, key):
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key, data):
+        storage_key = self.key_builder.build(key)
+        state, _ = await self._load(storage_key)
+        self._put(storage_key, state, copy.deepcopy(dict(data)))
+
+    async def get_data(self, key):
+        _, data = await self._load(self.key_builder.build(key))
+        return copy.deepcopy(data)
+
+    async def close(self):
+        # Дожидаемся идущей записи, чтобы не оборвать её отменой задачи
+        async with self._flush_lock:
+            if self._flush_task is not None:
+                self._flush_task.cancel()
+                self._flush_task = None
+        await self.flush()
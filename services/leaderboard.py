@@ -0,0 +1,117 @@
+import logging
+import os
+
+from sqlalchemy import delete, desc, insert, select
+
+from db import Answer, ScoreAggregate, upsert_insert
+from services.cache import TTLCache
+
+
+PERIODS = ('day', 'week', 'month')
+BACKFILL_CHUNK = 5000
+
+# Готовые тексты рейтингов: (period_type, period_key, lang, limit) -> (порог, текст)
+rating_cache = TTLCache(
+    maxsize=64, ttl=float(os.getenv('RATING_CACHE_TTL', '30'))
+)
+
+
+def period_key(period_type, day):
+    if period_type == 'day':
+        return day.isoformat()
+    if period_type == 'week':
+        year, week, _ = day.isocalendar()
+        return f"{year}-W{week:02d}"
+    return day.strftime('%Y-%m')
+
+
+async def record_correct_answer(session, user_id, when):
+    """+1 очко пользователю во всех периодах; вызывается в транзакции ответа.
+
+    Возвращает список (period_type, period_key, новый счёт) — после
+    коммита его нужно передать в invalidate_ratings().
+    """
+    day = when.date()
+    changes = []
+    for period_type in PERIODS:
+        key = period_key(period_type, day)
+        stmt = upsert_insert(ScoreAggregate).values(
+            user_id=user_id,
+            period_type=period_type,
+            period_key=key,
+            score=1,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id', 'period_type', 'period_key'],
+            set_={'score': ScoreAggregate.score + 1},
+        ).returning(ScoreAggregate.score)
+        score = (await session.execute(stmt)).scalar_one()
+        changes.append((period_type, key, score))
+    return changes
+
+
+def get_cached_rating(period_type, day, lang, limit):
+    return rating_cache.get((period_type, period_key(period_type, day), lang, limit))
+
+
+def cache_rating(period_type, day, lang, limit, scores, text):
+    # Порог попадания в топ: пока мест меньше limit, в него попадает любой
+    threshold = scores[-1][1] if len(scores) >= limit else 0
+    rating_cache.set(
+        (period_type, period_key(period_type, day), lang, limit), (threshold, text)
+    )
+
+
+def invalidate_ratings(changes):
+    """Сбрасывает закэшированные рейтинги, в топ которых вошёл новый счёт."""
+    for period_type, key, score in changes:
+        rating_cache.invalidate_if(
+            lambda k, v: k[0] == period_type and k[1] == key and score >= v[0]
+        )
+
+
+async def top_scores(session, period_type, day, limit=10):
+    """Топ-N за период: список пар (user_id, score); при равном счёте — по user_id."""
+    result = await session.execute(
+        select(ScoreAggregate.user_id, ScoreAggregate.score)
+        .where(
+            ScoreAggregate.period_type == period_type,
+            ScoreAggregate.period_key == period_key(period_type, day),
+            ScoreAggregate.score > 0,
+        )
+        .order_by(desc(ScoreAggregate.score), ScoreAggregate.user_id)
+        .limit(limit)
+    )
+    return result.fetchall()
+
+
+def backfill_sync(session):
+    """Пересобирает score_aggregates из всех верных ответов.
+
+    session — синхронные Session или Connection: вызывается из миграции 9
+    и из backfill().
+    """
+    counts = {}
+    result = session.execute(
+        select(Answer.user_id, Answer.date).where(Answer.is_correct)
+        .execution_options(yield_per=BACKFILL_CHUNK)
+    )
+    for user_id, when in result:
+        day = when.date()
+        for period_type in PERIODS:
+            key = (user_id, period_type, period_key(period_type, day))
+            counts[key] = counts.get(key, 0) + 1
+    session.execute(delete(ScoreAggregate))
+    rating_cache.clear()
+    rows = [
+        {'user_id': u, 'period_type': t, 'period_key': k, 'score': score}
+        for (u, t, k), score in counts.items()
+    ]
+    for i in range(0, len(rows), BACKFILL_CHUNK):
+        session.execute(insert(ScoreAggregate), rows[i:i + BACKFILL_CHUNK])
+    logging.info(f'Leaderboard backfill: {len(rows)} aggregates')
+    return len(rows)
+
+
+async def backfill(session):
+    return await session.run_sync(backfill_sync)
@@ -0,0 +1,122 @@
+import asyncio
+import hashlib
+import logging
+import os
+from datetime import datetime
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+from sqlalchemy import select
+
+from db import SessionLocal, MediaFile, db_writer
+
+
+# Ошибки, после которых закэшированный file_id больше не годится; прочие
+# BadRequest (например, «chat not found») к картинке отношения не имеют
+FILE_ID_ERRORS = ('file identifier', 'file reference', 'file_reference')
+
+
+def is_file_id_error(error):
+    message = error.message.lower()
+    return any(marker in message for marker in FILE_ID_ERRORS)
+
+
+def file_sha256(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+async def _save_media_file(session, path, sha, file_id):
+    await session.merge(
+        MediaFile(path=path, sha256=sha, file_id=file_id, updated_at=datetime.now())
+    )
+
+
+class MediaCache:
+    """Кэш Telegram file_id для локальных картинок.
+
+    Каждый файл загружается в Telegram один раз, дальше отправляется по
+    file_id. Запись привязана к sha256 содержимого: если картинку
+    заменили, file_id считается устаревшим и файл загружается заново.
+    """
+
+    def __init__(self):
+        self._file_ids = {}  # path -> (sha256, file_id)
+        self._digests = {}  # path -> (mtime_ns, size, sha256)
+        self._locks = {}
+
+    async def load(self):
+        async with SessionLocal() as session:
+            result = await session.execute(select(MediaFile))
+            for media in result.scalars():
+                self._file_ids[media.path] = (media.sha256, media.file_id)
+        logging.info(f'Media cache loaded: {len(self._file_ids)} file_id')
+
+    def _digest(self, path):
+        st = os.stat(path)
+        cached = self._digests.get(path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        sha = file_sha256(path)
+        self._digests[path] = (st.st_mtime_ns, st.st_size, sha)
+        return sha
+
+    def get_file_id(self, path):
+        cached = self._file_ids.get(path)
+        if cached and cached[0] == self._digest(path):
+            return cached[1]
+        return None
+
+    async def _remember(self, path, file_id):
+        sha = self._digest(path)
+        self._file_ids[path] = (sha, file_id)
+        await db_writer.run(_save_media_file, path, sha, file_id)
+
+    def invalidate(self, path):
+        self._file_ids.pop(path, None)
+
+    async def send_photo(self, send, path, **kwargs):
+        """Отправляет картинку через send(photo, **kwargs).
+
+        send — например, message.answer_photo или
+        partial(bot.send_photo, chat_id).
+        """
+        file_id = self.get_file_id(path)
+        if file_id:
+            try:
+                return await send(file_id, **kwargs)
+            except TelegramBadRequest as e:
+                if not is_file_id_error(e):
+                    raise
+                # file_id стал недействительным (например, сменился бот)
+                logging.warning(f'Cached file_id for {path} rejected: {e}')
+                self.invalidate(path)
+        # Загружаем файл один раз, остальные отправки ждут file_id
+        lock = self._locks.setdefault(path, asyncio.Lock())
+        async with lock:
+            file_id = self.get_file_id(path)
+            if file_id:
+                return await send(file_id, **kwargs)
+            message = await send(FSInputFile(path), **kwargs)
+            await self._remember(path, message.photo[-1].file_id)
+            return message
+
+    async def warmup(self, bot, chat_id, paths):
+        """Загружает ещё не закэшированные файлы, не оставляя сообщений в чате."""
+        uploaded = 0
+        for path in paths:
+            if not os.path.exists(path) or self.get_file_id(path):
+                continue
+            message = await bot.send_photo(
+                chat_id, FSInputFile(path), disable_notification=True
+            )
+            await self._remember(path, message.photo[-1].file_id)
+            await bot.delete_message(chat_id, message.message_id)
+            uploaded += 1
+        return uploaded
+
+
+media_cache = MediaCache()
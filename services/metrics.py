@@ -0,0 +1,224 @@
+"""Метрики процесса в текстовом формате Prometheus.
+
+Без внешних зависимостей: счётчики, гистограммы и функции-сборщики
+живут в REGISTRY, а start_metrics_server() отдаёт их по
+http://METRICS_HOST:METRICS_PORT/metrics. Запись — несколько операций
+со словарём на событие, поэтому метрики включены и в проде.
+
+Что собирается (см. middlewares/metrics.py и instrument_engine):
+  * bot_handler_seconds{handler} — время хендлера вместе с middleware;
+  * bot_update_db_queries / bot_update_db_seconds{handler} — запросы к
+    БД за апдейт (записи через db_writer идут в своей задаче и сюда не
+    попадают — только в bot_db_query_seconds);
+  * bot_db_query_seconds{statement} — все запросы через engine из db.py;
+  * bot_api_request_seconds{method}, bot_api_errors_total{method,reason};
+  * bot_broadcast_*{name} — ход рассылок (services/broadcast.py).
+"""
+import asyncio
+import logging
+import os
+import time
+from bisect import bisect_left
+
+from aiohttp import web
+from sqlalchemy import event
+
+
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+# 0 — не поднимать endpoint
+METRICS_PORT = int(os.getenv('METRICS_PORT', '9108'))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}  # значения меток -> значение
+
+    def header(self):
+        return [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+
+    def render(self):
+        lines = self.header()
+        for key, value in sorted(self._values.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, key)} {_number(value)}')
+        return lines
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        # [счётчики по корзинам..., +Inf, сумма]; накопление — при выводе
+        state = self._values.get(labels)
+        if state is None:
+            state = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        state[bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    def render(self):
+        lines = self.header()
+        for key, state in sorted(self._values.items()):
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state):
+                total += count
+                le = f'le="{_number(bound)}"'
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, key, le)} {total}')
+            labels = format_labels(self.labels, key)
+            lines.append(f'{self.name}_sum{labels} {state[-1]!r}')
+            lines.append(f'{self.name}_count{labels} {total}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """fn() -> список строк; вызывается при каждом запросе /metrics."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for fn in self._collectors:
+            try:
+                lines.extend(fn())
+            except Exception:
+                logging.exception(f'Metrics collector {fn.__name__} failed')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+handler_seconds = REGISTRY.register(Histogram(
+    'bot_handler_seconds', 'Время обработки апдейта хендлером', ['handler'],
+))
+handler_errors = REGISTRY.register(Counter(
+    'bot_handler_errors_total', 'Исключения в хендлерах', ['handler'],
+))
+update_db_queries = REGISTRY.register(Histogram(
+    'bot_update_db_queries', 'Запросов к БД за апдейт', ['handler'], buckets=COUNT_BUCKETS,
+))
+update_db_seconds = REGISTRY.register(Histogram(
+    'bot_update_db_seconds', 'Время запросов к БД за апдейт', ['handler'],
+))
+db_query_seconds = REGISTRY.register(Histogram(
+    'bot_db_query_seconds', 'Время одного запроса к БД', ['statement'],
+))
+api_request_seconds = REGISTRY.register(Histogram(
+    'bot_api_request_seconds', 'Время запроса к Bot API', ['method'],
+))
+api_errors = REGISTRY.register(Counter(
+    'bot_api_errors_total', 'Ошибки запросов к Bot API', ['method', 'reason'],
+))
+
+
+class UpdateDBStats:
+    __slots__ = ('queries', 'seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+# asyncio.Task апдейта -> UpdateDBStats; задаёт HandlerMetricsMiddleware.
+# Ключ — задача, а не contextvar: фоновые задачи (db_writer) копируют
+# контекст создавшего их апдейта и приписывали бы ему свои запросы.
+update_db_stats = {}
+
+
+def _statement_kind(statement):
+    head = statement.lstrip()[:8].split(None, 1)
+    return head[0].upper() if head else 'OTHER'
+
+
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - context._metrics_started
+    db_query_seconds.observe(elapsed, _statement_kind(statement))
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:  # синхронный код вне цикла событий (миграции, APScheduler)
+        return
+    stats = update_db_stats.get(task)
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+
+
+def instrument_engine(engine):
+    """Подписывает метрики на события запросов engine (AsyncEngine или Engine)."""
+    sync_engine = getattr(engine, 'sync_engine', engine)
+    if event.contains(sync_engine, 'before_cursor_execute', _before_execute):
+        return
+    event.listen(sync_engine, 'before_cursor_execute', _before_execute)
+    event.listen(sync_engine, 'after_cursor_execute', _after_execute)
+
+
+async def handle_metrics(request):
+    return web.Response(text=REGISTRY.render(), content_type='text/plain', charset='utf-8')
+
+
+async def start_metrics_server(port=METRICS_PORT, host=METRICS_HOST):
+    """Поднимает /metrics; возвращает AppRunner (остановить — cleanup()) или None."""
+    if not port:
+        return None
+    app = web.Application()
+    app.router.add_get('/metrics', handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logging.info(f'Metrics on http://{host}:{port}/metrics')
+    return runner
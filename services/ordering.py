@@ -0,0 +1,46 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+
+def update_key(update):
+    """tg_id автора апдейта, иначе id чата, иначе update_id."""
+    try:
+        event = update.event
+    except Exception:
+        return update.update_id
+    from_user = getattr(event, 'from_user', None)
+    if from_user is not None:
+        return from_user.id
+    chat = getattr(event, 'chat', None)
+    return chat.id if chat is not None else update.update_id
+
+
+class KeyLocks:
+    """Замки по ключу: задачи с одним ключом идут по одной.
+
+    asyncio.Lock отдаётся ожидающим по очереди, поэтому задачи одного
+    ключа выполняются в порядке вызова hold(). Свободный замок берётся
+    без переключения задач — порядок сохраняется, если hold() вызван
+    сразу после получения апдейта из очереди. Замок удаляется, когда
+    его никто не держит и не ждёт.
+    """
+
+    def __init__(self):
+        self._locks = {}  # ключ -> (Lock, число задач с этим ключом)
+
+    def __len__(self):
+        return len(self._locks)
+
+    @asynccontextmanager
+    async def hold(self, key):
+        lock, waiting = self._locks.get(key) or (asyncio.Lock(), 0)
+        self._locks[key] = (lock, waiting + 1)
+        try:
+            async with lock:
+                yield
+        finally:
+            lock, waiting = self._locks[key]
+            if waiting == 1:
+                del self._locks[key]
+            else:
+                self._locks[key] = (lock, waiting - 1)
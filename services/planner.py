@@ -0,0 +1,89 @@
+import random
+from datetime import datetime
+
+from sqlalchemy import select
+
+from db import QuestionSent, upsert_insert
+from services.questions import question_bank
+
+
+# Сколько случайных попыток делаем до полного перебора доступных вопросов
+PICK_ATTEMPTS = 8
+
+
+def pick_unsent(questions, sent_ids, rng=random):
+    """Случайный вопрос, id которого нет в множестве sent_ids."""
+    if not questions:
+        return None
+    # Пока отправлено мало, почти любая случайная попытка удачна
+    for _ in range(PICK_ATTEMPTS):
+        q = rng.choice(questions)
+        if q['id'] not in sent_ids:
+            return q
+    available = [q for q in questions if q['id'] not in sent_ids]
+    return rng.choice(available) if available else None
+
+
+async def load_sent_sets(session, topic, user_ids):
+    """Множества уже отправленных id по пользователям user_ids одним запросом."""
+    sent = {}
+    result = await session.stream(
+        select(QuestionSent.user_id, QuestionSent.question_id).where(
+            QuestionSent.topic == topic,
+            QuestionSent.user_id.in_(user_ids),
+        )
+    )
+    async for user_id, question_id in result:
+        sent.setdefault(user_id, set()).add(question_id)
+    return sent
+
+
+async def plan_topic_broadcast(session, topic, users, rng=random):
+    """Выбирает каждому пользователю пачки users неотправленный вопрос.
+
+    Возвращает список пар (user, question) — пользователи, для которых
+    вопросы закончились, пропускаются. Пачку берём из
+    services.recipients.iter_recipient_chunks.
+    """
+    sent = await load_sent_sets(session, topic, [user.id for user in users])
+    empty = frozenset()
+    by_lang = {}  # язык -> вопросы: банк спрашиваем раз на язык, а не на получателя
+    plan = []
+    for user in users:
+        lang = user.lang or 'ru'
+        questions = by_lang.get(lang)
+        if questions is None:
+            questions = by_lang[lang] = question_bank.get(topic, lang)
+        q = pick_unsent(questions, sent.get(user.id, empty), rng)
+        if q is not None:
+            plan.append((user, q))
+    return plan
+
+
+async def save_sent(session, topic, plan, run_id=None):
+    """Записывает все отправки плана одним bulk insert.
+
+    Уже записанные (user_id, topic, question_id) пропускаются — например,
+    если вопрос успели выдать через «Играть» во время рассылки. run_id —
+    рассылка, к которой относятся отправки (см. services/broadcast_runs.py).
+
+    Возвращает множество (user_id, question_id) действительно добавленных строк.
+    """
+    if not plan:
+        return set()
+    now = datetime.now()
+    result = await session.execute(
+        upsert_insert(QuestionSent).on_conflict_do_nothing()
+        .returning(QuestionSent.user_id, QuestionSent.question_id),
+        [
+            {
+                'user_id': user.id,
+                'question_id': q['id'],
+                'topic': topic,
+                'sent_at': now,
+                'run_id': run_id,
+            }
+            for user, q in plan
+        ],
+    )
+    return {(user_id, question_id) for user_id, question_id in result}
@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import time
+
+
+DATA_DIR = 'data'
+# Не чаще раза в столько секунд проверяем mtime файла: get() зовут на
+# каждого получателя рассылки, stat на каждый вызов заметен
+RELOAD_CHECK_INTERVAL = float(os.getenv('QUESTIONS_RELOAD_CHECK_INTERVAL', '1'))
+TOPICS = ['movies', 'cities', 'music', 'sport']
+LANGS = ['ru', 'en']
+
+
+class TopicQuestions:
+    """Вопросы одной темы на одном языке с индексами по id и по варианту ответа."""
+
+    __slots__ = ('path', 'mtime', 'checked', 'questions', 'by_id', 'by_option')
+
+    def __init__(self, path, mtime, questions):
+        self.path = path
+        self.mtime = mtime
+        self.checked = time.monotonic()  # когда последний раз сверяли mtime
+        self.questions = questions
+        self.by_id = {q['id']: q for q in questions}
+        # Первый вопрос с таким вариантом — как и в старом линейном поиске
+        self.by_option = {}
+        for q in questions:
+            for opt in q.get('options', []):
+                self.by_option.setdefault(opt, q)
+
+
+class QuestionBank:
+    """Банк вопросов в памяти.
+
+    Файлы data/{topic}_{lang}.json читаются один раз и перечитываются
+    только при изменении mtime (например, после добавления вопроса через
+    админ-панель). mtime сверяется не чаще раза в check_interval секунд.
+    """
+
+    def __init__(self, data_dir=DATA_DIR, check_interval=RELOAD_CHECK_INTERVAL):
+        self.data_dir = data_dir
+        self.check_interval = check_interval
+        self._entries = {}
+
+    def _path(self, topic, lang):
+        return os.path.join(self.data_dir, f"{topic}_{lang}.json")
+
+    def _entry(self, topic, lang):
+        entry = self._entries.get((topic, lang))
+        now = time.monotonic()
+        if entry is not None and now - entry.checked < self.check_interval:
+            return entry
+        path = self._path(topic, lang)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            self._entries.pop((topic, lang), None)
+            return None
+        if entry is not None and entry.mtime == mtime:
+            entry.checked = now
+            return entry
+        try:
+            with open(path, encoding='utf-8') as f:
+                questions = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.error(f'Failed to load questions {path}: {e}')
+            # Оставляем прежнюю версию, если файл сейчас битый
+            if entry is not None:
+                entry.checked = now
+            return entry
+        entry = TopicQuestions(path, mtime, questions)
+        self._entries[(topic, lang)] = entry
+        return entry
+
+    def forget(self, topic, lang):
+        """Перечитать файл при следующем обращении, не дожидаясь check_interval."""
+        self._entries.pop((topic, lang), None)
+
+    def load_all(self, topics=TOPICS, langs=LANGS):
+        for topic in topics:
+            for lang in langs:
+                self._entry(topic, lang)
+        total = sum(len(e.questions) for e in self._entries.values())
+        logging.info(f'Question bank loaded: {len(self._entries)} files, {total} questions')
+
+    def get(self, topic, lang):
+        entry = self._entry(topic, lang)
+        return entry.questions if entry else []
+
+    def by_id(self, topic, lang, question_id):
+        entry = self._entry(topic, lang)
+        return entry.by_id.get(question_id) if entry else None
+
+    def by_option(self, topic, lang, option):
+        entry = self._entry(topic, lang)
+        return entry.by_option.get(option) if entry else None
+
+
+question_bank = QuestionBank()
@@ -0,0 +1,67 @@
+import logging
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
+from sqlalchemy import update
+
+from db import User, db_writer
+from middlewares.user_context import forget_user
+
+
+FORBIDDEN = 'forbidden'  # бот заблокирован, пользователь удалён или деактивирован
+CHAT_NOT_FOUND = 'chat_not_found'
+RATE_LIMITED = 'rate_limited'
+TRANSIENT = 'transient'  # сеть, 5xx и прочее — в следующий раз может получиться
+
+# После этих ошибок пользователь исключается из рассылок
+PERMANENT_ERRORS = frozenset({FORBIDDEN, CHAT_NOT_FOUND})
+
+# Сколько недоступных чатов копим перед записью в БД
+UNREACHABLE_BATCH = 100
+
+
+def classify_error(error):
+    """Исход неудачной отправки: одна из констант выше."""
+    if isinstance(error, TelegramRetryAfter):
+        return RATE_LIMITED
+    if isinstance(error, TelegramForbiddenError):
+        return FORBIDDEN
+    if isinstance(error, TelegramBadRequest) and 'chat not found' in error.message.lower():
+        return CHAT_NOT_FOUND
+    return TRANSIENT
+
+
+async def mark_unreachable(session, tg_ids, reason):
+    await session.execute(
+        update(User).where(User.tg_id.in_(tg_ids)).values(
+            is_reachable=False, last_delivery_error=reason
+        )
+    )
+
+
+class UnreachableTracker:
+    """Копит чаты, которым рассылка не может доставить сообщение, и
+    пачками помечает пользователей недоступными (User.is_reachable).
+
+    Передаётся в Broadcaster.run(on_unreachable=tracker.add); после
+    рассылки нужно вызвать flush().
+    """
+
+    def __init__(self, every=UNREACHABLE_BATCH, writer=db_writer):
+        self.every = every
+        self.writer = writer
+        self.marked = 0
+        self._batch = {}  # reason -> [tg_id]
+
+    async def add(self, chat_id, reason):
+        self._batch.setdefault(reason, []).append(chat_id)
+        if sum(len(ids) for ids in self._batch.values()) >= self.every:
+            await self.flush()
+
+    async def flush(self):
+        batch, self._batch = self._batch, {}
+        for reason, tg_ids in batch.items():
+            await self.writer.run(mark_unreachable, tg_ids, reason)
+            for tg_id in tg_ids:
+                forget_user(tg_id)
+            self.marked += len(tg_ids)
+            logging.info(f'Недоступны для рассылок ({reason}): {len(tg_ids)}')
@@ -0,0 +1,53 @@
+import os
+
+from sqlalchemy import select, true
+
+from db import SessionLocal, User
+
+
+# Сколько получателей читаем за один запрос
+RECIPIENT_CHUNK = int(os.getenv('RECIPIENT_CHUNK', '1000'))
+
+
+class Recipient:
+    """Получатель рассылки: только нужные поля, без ORM и identity map."""
+
+    __slots__ = ('id', 'tg_id', 'lang', 'timezone')
+
+    def __init__(self, id, tg_id, lang, timezone):
+        self.id = id
+        self.tg_id = tg_id
+        self.lang = lang
+        self.timezone = timezone
+
+
+async def iter_recipient_chunks(id_range=None, where=None, chunk=RECIPIENT_CHUNK, session_factory=SessionLocal):
+    """Списки Recipient по chunk штук в порядке users.id.
+
+    Keyset-пагинация (id > последнего прочитанного) в короткой сессии на
+    каждую пачку: память не зависит от числа пользователей, а длинная
+    транзакция не держит базу, пока идёт рассылка. Недоступные
+    пользователи (is_reachable = false) пропускаются по индексу
+    ix_users_reachable_id.
+    """
+    query = (
+        select(User.id, User.tg_id, User.lang, User.timezone)
+        .where(User.is_reachable == true())
+        .order_by(User.id)
+        .limit(chunk)
+    )
+    if id_range is not None:
+        query = query.where(User.id < id_range[1])
+    if where is not None:
+        query = query.where(where)
+    last_id = id_range[0] - 1 if id_range is not None else None
+    while True:
+        page = query if last_id is None else query.where(User.id > last_id)
+        async with session_factory() as session:
+            rows = (await session.execute(page)).all()
+        if not rows:
+            return
+        yield [Recipient(*row) for row in rows]
+        if len(rows) < chunk:
+            return
+        last_id = rows[-1].id
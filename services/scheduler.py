@@ -0,0 +1,128 @@
+import logging
+import os
+from datetime import datetime
+
+import pytz
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from sqlalchemy.engine import make_url
+
+from db import DATABASE_URL, normalize_url
+from services.delivery import bucket_tz
+
+
+SCHEDULER_TIMEZONE = pytz.timezone('Europe/Moscow')
+# Пропущенный запуск (бот был выключен) выполняется, если опоздали не больше чем на столько секунд
+MISFIRE_GRACE = int(os.getenv('SCHEDULER_MISFIRE_GRACE', '3600'))
+
+
+# Синхронные драйверы для jobstore APScheduler
+SYNC_DRIVERS = {'sqlite': 'sqlite', 'postgresql': 'postgresql+psycopg2'}
+
+
+def sync_url(url):
+    """Синхронный URL той же БД: APScheduler 3 работает без asyncio.
+
+    postgres:// и asyncpg переводятся на psycopg2 (есть в requirements.txt);
+    для других СУБД нужен свой SCHEDULER_DB_URL.
+    """
+    url = make_url(normalize_url(url))
+    backend = url.get_backend_name()
+    if backend not in SYNC_DRIVERS:
+        raise ValueError(f'Задайте SCHEDULER_DB_URL: нет синхронного драйвера для {backend}')
+    return url.set(drivername=SYNC_DRIVERS[backend]).render_as_string(hide_password=False)
+
+
+SCHEDULER_DB_URL = os.getenv('SCHEDULER_DB_URL') or sync_url(DATABASE_URL)
+
+# Кто выполняет задачу по имени и откуда берётся расписание; задаются в
+# setup_scheduler. В jobstore хранится только ссылка на run_scheduled,
+# имя задачи и корзина — бот и способ запуска (в этом процессе или на
+# воркерах) подставляются при старте.
+_runner = None
+_schedule = None
+_scheduler = None
+
+REFRESH_JOB_ID = 'refresh_schedule'
+
+
+async def run_scheduled(name, bucket=None):
+    await _runner(name, bucket)
+
+
+async def refresh_schedule():
+    sync_jobs(_scheduler, await _schedule())
+
+
+def job_key(name, bucket=None):
+    """Имя рассылки с корзиной — так она записывается в broadcast_runs."""
+    return name if bucket is None else f'{name}/{bucket}'
+
+
+def split_job_key(key):
+    """job_key -> (имя, корзина или None)."""
+    name, _, bucket = key.partition('/')
+    return name, bucket or None
+
+
+def job_id(name, when, bucket=None):
+    return f"{job_key(name, bucket)}@{when['hour']:02d}:{when['minute']:02d}"
+
+
+def sync_jobs(scheduler, schedule):
+    """Приводит задачи в jobstore к расписанию [(имя, dict(hour=, minute=), корзина)]."""
+    wanted = {job_id(name, when, bucket): (name, when, bucket) for name, when, bucket in schedule}
+    for job in scheduler.get_jobs():
+        if job.id not in wanted and job.id != REFRESH_JOB_ID:
+            logging.info(f'Removing stale scheduler job {job.id}')
+            job.remove()
+    for jid, (name, when, bucket) in wanted.items():
+        tz = SCHEDULER_TIMEZONE if bucket is None else bucket_tz(bucket)
+        trigger = CronTrigger(timezone=tz, **when)
+        existing = scheduler.get_job(jid)
+        # Задачу с тем же расписанием не пересоздаём: replace_existing
+        # пересчитал бы next_run_time и потерял пропущенный запуск
+        if existing is not None and str(existing.trigger) == str(trigger):
+            continue
+        scheduler.add_job(
+            'services.scheduler:run_scheduled', trigger, args=[name, bucket], id=jid,
+            name=job_key(name, bucket), replace_existing=True,
+        )
+
+
+async def setup_scheduler(schedule, runner, url=SCHEDULER_DB_URL):
+    """Запускает расписание; schedule() возвращает [(имя, dict(hour=, minute=), корзина)].
+
+    Задачи хранятся в таблице apscheduler_jobs: запуск, пропущенный во
+    время простоя, выполняется после старта (не позже MISFIRE_GRACE),
+    несколько пропущенных подряд — один раз (coalesce), а новый запуск не
+    начинается, пока не закончился предыдущий (max_instances=1).
+    Расписание пересчитывается каждый час.
+    """
+    global _runner, _schedule, _scheduler
+    _runner = runner
+    _schedule = schedule
+    _scheduler = scheduler = AsyncIOScheduler(
+        jobstores={'default': SQLAlchemyJobStore(url=url)},
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': MISFIRE_GRACE},
+        timezone=SCHEDULER_TIMEZONE,
+    )
+    # На паузе: сначала сверяем задачи в БД с расписанием, потом выполняем пропущенные
+    scheduler.start(paused=True)
+    sync_jobs(scheduler, await schedule())
+    scheduler.add_job(
+        'services.scheduler:refresh_schedule', CronTrigger(minute=5),
+        id=REFRESH_JOB_ID, replace_existing=True,
+    )
+    scheduler.resume()
+    return scheduler
+
+
+def run_now(scheduler, keys):
+    """Запускает задачи с этими job_key сейчас — продолжить прерванные рассылки."""
+    now = datetime.now(SCHEDULER_TIMEZONE)
+    for job in scheduler.get_jobs():
+        if job.args and job_key(*job.args) in keys:
+            logging.info(f'Resuming interrupted job {job.id}')
+            job.modify(next_run_time=now)
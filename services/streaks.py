@@ -0,0 +1,92 @@
+import logging
+from datetime import date, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from db import Answer, UserDayActivity, upsert_insert
+
+
+# Сколько последних дней смотрим: 🐢 — 3 дня без побед, 📆/💪 — 7 дней подряд
+NO_WIN_DAYS = 3
+ANSWER_DAYS = 7
+BACKFILL_CHUNK = 5000
+
+
+async def record_answer_day(session, user_id, when, is_correct):
+    """Учитывает ответ в дневной активности; вызывается в транзакции ответа."""
+    stmt = upsert_insert(UserDayActivity).values(
+        user_id=user_id,
+        day=when.date(),
+        answers=1,
+        correct=1 if is_correct else 0,
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['user_id', 'day'],
+        set_={
+            'answers': UserDayActivity.answers + 1,
+            'correct': UserDayActivity.correct + stmt.excluded.correct,
+        },
+    )
+    await session.execute(stmt)
+
+
+def compute_streaks(days, today):
+    """(no_win_streak, answer_streak) по словарю day -> число верных ответов.
+
+    Обе серии считаются от сегодняшнего дня назад, пока есть ответы.
+    """
+    no_win = 0
+    answered = 0
+    no_win_open = True
+    for i in range(ANSWER_DAYS):
+        correct = days.get(today - timedelta(days=i))
+        if correct is None:
+            break
+        answered += 1
+        if no_win_open and i < NO_WIN_DAYS and correct == 0:
+            no_win += 1
+        else:
+            no_win_open = False
+    return no_win, answered
+
+
+async def get_streaks(session, user_id, today=None):
+    today = today or date.today()
+    result = await session.execute(
+        select(UserDayActivity.day, UserDayActivity.correct).where(
+            UserDayActivity.user_id == user_id,
+            UserDayActivity.day > today - timedelta(days=ANSWER_DAYS),
+            UserDayActivity.day <= today,
+        )
+    )
+    return compute_streaks(dict(result.all()), today)
+
+
+def backfill_activity_sync(session):
+    """Пересобирает user_day_activity из таблицы answers.
+
+    session — синхронные Session или Connection: вызывается из миграции 10
+    и из backfill_activity().
+    """
+    counts = {}
+    result = session.execute(
+        select(Answer.user_id, Answer.date, Answer.is_correct)
+        .execution_options(yield_per=BACKFILL_CHUNK)
+    )
+    for user_id, when, is_correct in result:
+        key = (user_id, when.date())
+        answers, correct = counts.get(key, (0, 0))
+        counts[key] = (answers + 1, correct + (1 if is_correct else 0))
+    session.execute(delete(UserDayActivity))
+    rows = [
+        {'user_id': u, 'day': d, 'answers': a, 'correct': c}
+        for (u, d), (a, c) in counts.items()
+    ]
+    for i in range(0, len(rows), BACKFILL_CHUNK):
+        session.execute(insert(UserDayActivity), rows[i:i + BACKFILL_CHUNK])
+    logging.info(f'Activity backfill: {len(rows)} user-days')
+    return len(rows)
+
+
+async def backfill_activity(session):
+    return await session.run_sync(backfill_activity_sync)
@@ -0,0 +1,251 @@
+"""Многопроцессный режим (BOT_MODE=sharded).
+
+Координатор (основной процесс) получает апдейты long polling'ом и
+держит расписание. Каждый апдейт уходит воркеру tg_id % SHARD_WORKERS,
+поэтому апдейты одного пользователя обрабатываются одним процессом по
+порядку, а кэши пользователей и FSM в воркере остаются согласованными.
+Задачи расписания координатор делит по диапазонам users.id: каждый
+воркер рассылает своей доле пользователей с BROADCAST_RATE / SHARD_WORKERS,
+чтобы вместе не превысить лимит бота.
+
+Несколько процессов пишут в БД одновременно, поэтому для этого режима
+лучше PostgreSQL; на SQLite записи разных процессов ждут друг друга
+через busy_timeout.
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+from concurrent.futures import ThreadPoolExecutor
+
+from aiogram.types import Update
+from sqlalchemy import func, select
+
+from db import UPDATE_SESSIONS, SessionLocal, User
+from services.ordering import KeyLocks, update_key
+
+
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', str(os.cpu_count() or 2)))
+# Сколько апдейтов воркер обрабатывает одновременно (разных пользователей).
+# У каждого воркера свой пул соединений, а апдейт держит сессию — поэтому
+# не больше db.UPDATE_SESSIONS
+SHARD_CONCURRENCY = int(os.getenv('SHARD_CONCURRENCY', str(min(64, UPDATE_SESSIONS or 64))))
+if UPDATE_SESSIONS is not None and SHARD_CONCURRENCY > UPDATE_SESSIONS:
+    logging.warning(f'SHARD_CONCURRENCY={SHARD_CONCURRENCY} exceeds DB update sessions, using {UPDATE_SESSIONS}')
+    SHARD_CONCURRENCY = UPDATE_SESSIONS
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', '1000'))
+POLL_TIMEOUT = 30
+STOP_TIMEOUT = 30
+
+
+async def id_ranges(count):
+    """Делит users.id на count непрерывных диапазонов [начало, конец).
+
+    Вызывается на каждую задачу расписания: MIN/MAX по первичному ключу —
+    два чтения краёв индекса, а свежие границы нужны, чтобы в диапазоны
+    попали и пользователи, пришедшие после прошлой рассылки.
+    """
+    async with SessionLocal() as session:
+        low, high = (await session.execute(select(func.min(User.id), func.max(User.id)))).one()
+    if low is None:
+        return [None] * count
+    step = (high - low) // count + 1
+    return [(low + i * step, low + (i + 1) * step) for i in range(count)]
+
+
+async def _queue_put(q, item):
+    try:
+        q.put_nowait(item)
+    except queue.Full:
+        # Воркер не успевает — ждём место, не блокируя цикл событий
+        await asyncio.get_running_loop().run_in_executor(None, q.put, item)
+
+
+class Coordinator:
+    def __init__(self, bot, workers=SHARD_WORKERS):
+        self.bot = bot
+        self.count = workers
+        self.ctx = multiprocessing.get_context('spawn')
+        self.queues = [self.ctx.Queue(maxsize=SHARD_QUEUE_SIZE) for _ in range(workers)]
+        self.processes = []
+        self.offset = None
+
+    def start(self):
+        for index, q in enumerate(self.queues):
+            process = self.ctx.Process(
+                target=worker_main, args=(index, self.count, q), name=f'bot-shard-{index}'
+            )
+            process.start()
+            self.processes.append(process)
+
+    async def route(self, update):
+        q = self.queues[update_key(update) % self.count]
+        await _queue_put(q, ('update', update.model_dump_json(exclude_unset=True)))
+
+    async def run_job(self, name, bucket=None):
+        """Выполнение задачи расписания: раздаёт её воркерам по диапазонам id."""
+        ranges = await id_ranges(self.count)
+        logging.info(f'Shard job {name} {bucket}: {ranges}')
+        for q, id_range in zip(self.queues, ranges):
+            if id_range is not None:
+                await _queue_put(q, ('job', name, id_range, bucket))
+
+    async def poll(self, stop, allowed_updates):
+        while not stop.is_set():
+            try:
+                updates = await self.bot.get_updates(
+                    offset=self.offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates
+                )
+            except Exception as e:
+                logging.error(f'get_updates failed: {e}')
+                await asyncio.sleep(1)
+                continue
+            for update in updates:
+                await self.route(update)
+                self.offset = update.update_id + 1
+
+    async def stop(self):
+        for q in self.queues:
+            await _queue_put(q, None)
+        loop = asyncio.get_running_loop()
+        for process in self.processes:
+            await loop.run_in_executor(None, process.join, STOP_TIMEOUT)
+            if process.is_alive():
+                logging.warning(f'{process.name} did not stop in time, terminating')
+                process.terminate()
+
+
+async def run_coordinator(bot):
+    from main import build_dispatcher, setup_scheduler
+
+    coordinator = Coordinator(bot)
+    coordinator.start()
+    scheduler = await setup_scheduler(bot, runner=coordinator.run_job)
+    allowed_updates = build_dispatcher().resolve_used_update_types()
+    await bot.delete_webhook()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+    logging.info(f'Coordinator started with {coordinator.count} workers')
+    poller = asyncio.create_task(coordinator.poll(stop, allowed_updates))
+    try:
+        await stop.wait()
+    finally:
+        poller.cancel()
+        scheduler.shutdown(wait=False)
+        if coordinator.offset is not None:
+            # Подтверждаем Telegram уже розданные апдейты, иначе придут повторно
+            await bot.get_updates(offset=coordinator.offset, timeout=0, limit=1)
+        await coordinator.stop()
+        await bot.session.close()
+
+
+class ShardWorker:
+    """Обработка апдейтов и задач рассылки в процессе-воркере."""
+
+    def __init__(self, index, count, q, concurrency=SHARD_CONCURRENCY):
+        self.index = index
+        self.count = count
+        self.queue = q
+        # Слот берётся до чтения из очереди: занятый воркер не забирает
+        # новые апдейты, очередь заполняется и притормаживает координатор
+        self.slots = asyncio.Semaphore(concurrency)
+        self.locks = KeyLocks()  # по tg_id
+        self.tasks = set()
+
+    def spawn(self, coro, slot=False):
+        """Задача в фоне; slot — по завершении освободить слот."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        if slot:
+            task.add_done_callback(lambda _: self.slots.release())
+
+    async def handle_update(self, dp, bot, raw):
+        update = Update.model_validate_json(raw, context={'bot': bot})
+        try:
+            # Lock отдаётся по очереди — апдейты пользователя идут в порядке прихода
+            async with self.locks.hold(update_key(update)):
+                await dp.feed_update(bot, update)
+        except Exception:
+            logging.exception(f'Shard {self.index}: update {update.update_id} failed')
+
+    async def run_job(self, bot, name, id_range, bucket):
+        import main
+        try:
+            await getattr(main, name)(bot, id_range=tuple(id_range), bucket=bucket)
+        except Exception:
+            logging.exception(f'Shard {self.index}: job {name} {bucket} {id_range} failed')
+
+    async def serve(self, dp, bot):
+        """Разбирает очередь до None и дорабатывает принятое.
+
+        Апдейтов в работе — не больше concurrency; задачи рассылки слот
+        не держат: их мало, и они идут долго.
+        """
+        loop = asyncio.get_running_loop()
+        # Отдельный поток на блокирующий queue.get
+        reader = ThreadPoolExecutor(max_workers=1)
+        try:
+            while True:
+                await self.slots.acquire()
+                message = await loop.run_in_executor(reader, self.queue.get)
+                if message is None:
+                    self.slots.release()
+                    break
+                if message[0] == 'update':
+                    self.spawn(self.handle_update(dp, bot, message[1]), slot=True)
+                else:
+                    self.slots.release()
+                    self.spawn(self.run_job(bot, *message[1:]))
+            # Дорабатываем принятое
+            if self.tasks:
+                await asyncio.wait(set(self.tasks))
+        finally:
+            reader.shutdown(wait=False)
+
+    async def run(self):
+        import main
+        from db import db_writer, engine
+        from services.broadcast import broadcaster
+        from services.fsm_storage import DatabaseStorage
+        from services.media import media_cache
+        from services.metrics import METRICS_PORT, instrument_engine, start_metrics_server
+        from services.questions import question_bank
+
+        question_bank.load_all()
+        await media_cache.load()
+        instrument_engine(engine)
+        # Каждый воркер — свой /metrics: координатор на METRICS_PORT, воркеры дальше
+        metrics_server = await start_metrics_server(METRICS_PORT + 1 + self.index if METRICS_PORT else 0)
+        # Общий лимит бота делится между воркерами
+        broadcaster.bucket.rate = broadcaster.bucket.capacity = broadcaster.bucket.rate / self.count
+        bot = main.make_bot()
+        storage = DatabaseStorage()
+        dp = main.build_dispatcher(storage)
+        await dp.emit_startup(bot=bot, dispatcher=dp)
+        logging.info(f'Shard {self.index}/{self.count} started')
+        try:
+            await self.serve(dp, bot)
+        finally:
+            await dp.emit_shutdown(bot=bot, dispatcher=dp)
+            await storage.close()
+            await db_writer.close()
+            await bot.session.close()
+            if metrics_server is not None:
+                await metrics_server.cleanup()
+        logging.info(f'Shard {self.index} stopped')
+
+
+def worker_main(index, count, q):
+    # Ctrl+C получает вся группа процессов — останавливает координатор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(ShardWorker(index, count, q).run())
@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# db.py создаёт engine при импорте — база тестов задаётся до него
+os.environ.setdefault('DATABASE_URL', f'sqlite+aiosqlite:///{tempfile.mkdtemp()}/test.db')
+os.environ.setdefault('BOT_TOKEN', '42:TEST')
+os.environ.setdefault('METRICS_PORT', '0')
@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramForbiddenError
+
+from services.broadcast import Broadcaster, TokenBucket
+
+
+def test_bucket_does_not_refill_during_pause():
+    async def scenario():
+        bucket = TokenBucket(rate=10)
+        bucket.pause(0.1)
+        started = time.monotonic()
+        for _ in range(3):
+            await bucket.acquire()
+        return time.monotonic() - started
+
+    # 0.1 с паузы и по 0.1 с на каждый токен после неё
+    assert asyncio.run(scenario()) >= 0.38
+
+
+def test_overlapping_runs_keep_chat_interval():
+    sent = []
+
+    async def send(chat_id):
+        sent.append((chat_id, time.monotonic()))
+
+    async def slow_jobs():
+        yield 1, lambda: send(1)
+        # Тем временем вторая рассылка успевает закончиться
+        await asyncio.sleep(0.05)
+        yield 1, lambda: send(1)
+
+    async def scenario():
+        broadcaster = Broadcaster(workers=2, rate=1000, per_chat_interval=0.2)
+        await asyncio.gather(
+            broadcaster.run(slow_jobs(), name='slow'),
+            broadcaster.run([(2, lambda: send(2))], name='quick'),
+        )
+
+    asyncio.run(scenario())
+    first, second = [t for chat_id, t in sent if chat_id == 1]
+    assert second - first >= 0.19
+
+
+def test_failing_on_unreachable_does_not_stop_run():
+    async def blocked():
+        raise TelegramForbiddenError(method=None, message='Forbidden: bot was blocked by the user')
+
+    async def on_unreachable(chat_id, reason):
+        raise RuntimeError('db is down')
+
+    async def scenario():
+        broadcaster = Broadcaster(workers=2, rate=1000, per_chat_interval=0)
+        jobs = [(chat_id, blocked) for chat_id in range(10)]
+        return await asyncio.wait_for(
+            broadcaster.run(jobs, name='blocked', on_unreachable=on_unreachable), 5
+        )
+
+    stats = asyncio.run(scenario())
+    assert stats.failed == 10
+    assert stats.errors == {'forbidden': 10}
@@ -0,0 +1,65 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from db import BroadcastRun, QuestionSent, SessionLocal, User, init_db
+from services.broadcast_runs import _save_checkpoint, interrupted_jobs, open_run, served_user_ids
+
+
+def test_interrupted_jobs_resume_only_today():
+    today = date(2026, 10, 18)
+    days = {'quiz': today, 'quiz/UTC+10:00': today + timedelta(days=1)}
+
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(BroadcastRun))
+            await open_run(session, 'quiz', 'movies', today - timedelta(days=1))
+            await open_run(session, 'quiz', 'movies', today)
+            # У корзины уже завтра — её вчерашняя (серверное «сегодня») рассылка устарела
+            await open_run(session, 'quiz/UTC+10:00', 'movies', today)
+            await session.commit()
+            jobs = await interrupted_jobs(session, days.get)
+            await session.commit()
+            statuses = (await session.execute(
+                select(BroadcastRun.job, BroadcastRun.run_day, BroadcastRun.status)
+            )).all()
+        return jobs, statuses
+
+    jobs, statuses = asyncio.run(scenario())
+    assert jobs == {'quiz'}
+    assert sorted(statuses) == [
+        ('quiz', today - timedelta(days=1), 'expired'),
+        ('quiz', today, 'running'),
+        ('quiz/UTC+10:00', today, 'expired'),
+    ]
+
+
+def test_checkpoint_counts_inserted_and_marks_played():
+    today = date(2026, 10, 18)
+    users = [User(id=900 + i, tg_id=9900 + i) for i in range(3)]
+    batch = [(user, {'id': 1}) for user in users]
+
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(QuestionSent))
+            await session.execute(delete(BroadcastRun))
+            await session.execute(delete(User).where(User.id.in_([u.id for u in users])))
+            await session.execute(insert(User), [{'id': u.id, 'tg_id': u.tg_id} for u in users])
+            # Второй пользователь успел получить этот вопрос через «Играть»
+            await session.execute(insert(QuestionSent).values(
+                user_id=901, question_id=1, topic='movies', sent_at=datetime.now()
+            ))
+            run_id = await open_run(session, 'quiz', 'movies', today)
+            await _save_checkpoint(session, run_id, 'movies', batch[:2])
+            await _save_checkpoint(session, run_id, 'movies', batch[:2])
+            await session.commit()
+            run = await session.get(BroadcastRun, run_id)
+            served = await served_user_ids(session, 'quiz', today, [u.id for u in users])
+        return run.sent, served
+
+    sent, served = asyncio.run(scenario())
+    assert sent == 1
+    assert served == {900, 901}
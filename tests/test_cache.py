@@ -0,0 +1,43 @@
+from services import cache
+from services.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_lru_eviction():
+    c = TTLCache(maxsize=2, ttl=60)
+    c.set('a', 1)
+    c.set('b', 2)
+    assert c.get('a') == 1  # 'a' теперь свежее 'b'
+    c.set('c', 3)
+    assert c.get('b') is None
+    assert (c.get('a'), c.get('c'), len(c)) == (1, 3, 2)
+
+
+def test_expiry_and_stats(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, 'monotonic', clock)
+    c = TTLCache(maxsize=10, ttl=30)
+    c.set('a', 1)
+    clock.now += 29
+    assert c.get('a') == 1
+    clock.now += 2
+    assert c.get('a', 'gone') == 'gone'
+    assert len(c) == 0  # просроченная запись удаляется при чтении
+    assert c.stats() == {'size': 0, 'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+
+
+def test_pop_and_invalidate_if():
+    c = TTLCache(maxsize=10, ttl=60)
+    for i in range(5):
+        c.set(i, i * i)
+    assert c.pop(2) == 4
+    assert c.pop(2) is None
+    assert c.invalidate_if(lambda key, value: value > 4) == 2
+    assert [c.get(i) for i in range(5)] == [0, 1, None, None, None]
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, insert, select, update
+
+from db import SessionLocal, User, init_db
+from services.delivery import bucket_filter, bucket_name, bucket_offset, timezone_buckets, utc_offset
+
+
+WINTER = datetime(2026, 1, 15, 12, 0, tzinfo=timezone.utc)
+SUMMER = datetime(2026, 7, 15, 12, 0, tzinfo=timezone.utc)
+
+
+def test_offsets_follow_dst():
+    assert utc_offset('Europe/Berlin', WINTER) == 60
+    assert utc_offset('Europe/Berlin', SUMMER) == 120
+    assert utc_offset('Asia/Kolkata', WINTER) == 330
+    # Неизвестный или пустой пояс — московский
+    assert utc_offset('Mars/Olympus', WINTER) == 180
+    assert utc_offset(None, WINTER) == 180
+
+
+def test_bucket_names_round_trip():
+    for offset in (0, 180, 330, -210, -600):
+        assert bucket_offset(bucket_name(offset)) == offset
+    assert bucket_name(-210) == 'UTC-03:30'
+    assert bucket_name(330) == 'UTC+05:30'
+
+
+def test_users_grouped_by_offset():
+    zones = [None, 'Europe/Moscow', 'Europe/Istanbul', 'Europe/Berlin', 'Europe/Paris', 'America/New_York']
+    users = [{'id': 700 + i, 'tg_id': 7700 + i, 'timezone': tz} for i, tz in enumerate(zones)]
+
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(User))
+            await session.execute(insert(User), users)
+            # Явный None в insert заменяется значением по умолчанию
+            await session.execute(update(User).where(User.id == 700).values(timezone=None))
+            await session.commit()
+            buckets = await timezone_buckets(session, WINTER)
+            moscow = (await session.execute(
+                select(User.id).where(await bucket_filter(session, 'UTC+03:00'))
+            )).scalars().all()
+        return buckets, moscow
+
+    buckets, moscow = asyncio.run(scenario())
+    assert {b: sorted(z, key=str) for b, z in buckets.items()} == {
+        'UTC+03:00': sorted([None, 'Europe/Moscow', 'Europe/Istanbul'], key=str),
+        'UTC+01:00': ['Europe/Berlin', 'Europe/Paris'],
+        'UTC-05:00': ['America/New_York'],
+    }
+    # Пользователи без пояса попадают в московскую корзину
+    assert sorted(moscow) == [700, 701, 702]
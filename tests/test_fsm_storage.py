@@ -0,0 +1,107 @@
+import asyncio
+from contextlib import asynccontextmanager
+
+from aiogram.fsm.storage.base import StorageKey
+from sqlalchemy import delete, select
+
+from db import FSMRecord, SessionLocal, SingleWriter, init_db
+from services.fsm_storage import DatabaseStorage
+
+
+KEY = StorageKey(bot_id=42, chat_id=1, user_id=1)
+
+
+async def reset():
+    await init_db()
+    async with SessionLocal() as session:
+        await session.execute(delete(FSMRecord))
+        await session.commit()
+
+
+async def stored_states():
+    async with SessionLocal() as session:
+        return (await session.execute(select(FSMRecord.state))).scalars().all()
+
+
+def make_storage(**kwargs):
+    # Фоновый сброс не мешает: тесты сбрасывают изменения сами
+    return DatabaseStorage(writer=SingleWriter(SessionLocal), flush_interval=60, **kwargs)
+
+
+def test_round_trip_through_db():
+    async def scenario():
+        await reset()
+        storage = make_storage()
+        await storage.set_state(KEY, 'quiz:answer')
+        await storage.set_data(KEY, {'topic': 'кино', 'ids': [1, 2]})
+        await storage.close()
+
+        fresh = make_storage()
+        loaded = await fresh.get_state(KEY), await fresh.get_data(KEY)
+        await fresh.set_state(KEY, None)
+        await fresh.set_data(KEY, {})
+        await fresh.close()
+        return loaded, await stored_states()
+
+    loaded, left = asyncio.run(scenario())
+    assert loaded == ('quiz:answer', {'topic': 'кино', 'ids': [1, 2]})
+    assert left == []  # пустое состояние удаляет строку
+
+
+def test_changes_reach_db_only_on_flush():
+    async def scenario():
+        await reset()
+        storage = make_storage()
+        await storage.set_state(KEY, 'first')
+        await storage.set_state(KEY, 'second')
+        before = await stored_states()
+        await storage.flush()
+        after = await stored_states()
+        await storage.close()
+        return before, after
+
+    before, after = asyncio.run(scenario())
+    assert before == []
+    assert after == ['second']
+
+
+def test_slow_read_does_not_overwrite_fresh_write():
+    class SlowSessions:
+        """Первое чтение ждёт, пока тест его не отпустит."""
+
+        def __init__(self):
+            self.reading = asyncio.Event()
+            self.release = asyncio.Event()
+            self.calls = 0
+
+        @asynccontextmanager
+        async def __call__(self):
+            self.calls += 1
+            if self.calls == 1:
+                self.reading.set()
+                await self.release.wait()
+            async with SessionLocal() as session:
+                yield session
+
+    async def scenario():
+        await reset()
+        storage = make_storage()
+        await storage.set_state(KEY, 'old')
+        await storage.close()
+
+        sessions = SlowSessions()
+        storage = make_storage(session_factory=sessions)
+        slow_read = asyncio.create_task(storage.get_state(KEY))
+        await sessions.reading.wait()
+        await storage.set_state(KEY, 'new')
+        sessions.release.set()
+        read = await slow_read
+        await storage.flush()
+        # Изменение уже в БД, дальше состояние читается из кэша
+        cached = await storage.get_state(KEY)
+        await storage.close()
+        return read, cached
+
+    read, cached = asyncio.run(scenario())
+    assert read == 'new'
+    assert cached == 'new'
@@ -0,0 +1,55 @@
+import asyncio
+from datetime import date
+
+from sqlalchemy import delete, insert, select
+
+from db import ScoreAggregate, SessionLocal, User, UserMedal, init_db
+from services.achievements import award_top_medals
+from services.leaderboard import period_key, top_scores
+
+
+DAY = date(2026, 10, 17)
+
+
+async def seed(scores):
+    await init_db()
+    async with SessionLocal() as session:
+        for model in (UserMedal, ScoreAggregate, User):
+            await session.execute(delete(model))
+        await session.execute(insert(User), [
+            {'id': user_id, 'tg_id': 1000 + user_id} for user_id in scores
+        ])
+        await session.execute(insert(ScoreAggregate), [
+            {'user_id': user_id, 'period_type': 'week', 'period_key': period_key('week', DAY), 'score': score}
+            for user_id, score in scores.items()
+        ])
+        await session.commit()
+
+
+def test_top_scores_ties_by_user_id():
+    async def scenario():
+        await seed({5: 3, 2: 3, 9: 4, 7: 1})
+        async with SessionLocal() as session:
+            return await top_scores(session, 'week', DAY, limit=3)
+
+    assert [tuple(row) for row in asyncio.run(scenario())] == [(9, 4), (2, 3), (5, 3)]
+
+
+def test_award_top_medals_by_range_and_once():
+    async def scenario():
+        await seed({1: 5, 2: 4, 3: 3, 4: 2})
+        async with SessionLocal() as session:
+            low = await award_top_medals(session, 'week', DAY, (1, 3))
+            high = await award_top_medals(session, 'week', DAY, (3, 5))
+            again = await award_top_medals(session, 'week', DAY)
+            await session.commit()
+            medals = (await session.execute(
+                select(UserMedal.user_id, UserMedal.medal).order_by(UserMedal.user_id)
+            )).all()
+        return low, high, again, medals
+
+    low, high, again, medals = asyncio.run(scenario())
+    assert sorted(low) == [1001, 1002]
+    assert high == [1003]
+    assert again == []
+    assert [tuple(m) for m in medals] == [(1, '🥇'), (2, '🥈'), (3, '🥉')]
@@ -0,0 +1,54 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile
+
+from db import init_db
+from services.media import MediaCache
+
+
+class FakeSend:
+    """send(photo) для MediaCache: file_id из rejected отклоняются с error."""
+
+    def __init__(self, error=None, rejected=()):
+        self.error = error
+        self.rejected = set(rejected)
+        self.calls = []
+
+    async def __call__(self, photo, **kwargs):
+        self.calls.append(photo)
+        if isinstance(photo, FSInputFile):
+            return SimpleNamespace(photo=[SimpleNamespace(file_id='fresh-id')])
+        if photo in self.rejected:
+            raise TelegramBadRequest(method=None, message=self.error)
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=photo)])
+
+
+@pytest.fixture
+def cache(tmp_path):
+    path = tmp_path / 'image.jpg'
+    path.write_bytes(b'jpeg')
+    cache = MediaCache()
+    asyncio.run(init_db())
+    asyncio.run(cache._remember(str(path), 'cached-id'))
+    return cache, str(path)
+
+
+def test_chat_error_keeps_file_id(cache):
+    cache, path = cache
+    send = FakeSend('Bad Request: chat not found', rejected={'cached-id'})
+    with pytest.raises(TelegramBadRequest):
+        asyncio.run(cache.send_photo(send, path))
+    assert send.calls == ['cached-id']
+    assert cache.get_file_id(path) == 'cached-id'
+
+
+def test_bad_file_id_reuploads(cache):
+    cache, path = cache
+    send = FakeSend('Bad Request: wrong file identifier/HTTP URL specified', rejected={'cached-id'})
+    message = asyncio.run(cache.send_photo(send, path))
+    assert message.photo[-1].file_id == 'fresh-id'
+    assert send.calls[0] == 'cached-id' and isinstance(send.calls[1], FSInputFile)
+    assert cache.get_file_id(path) == 'fresh-id'
@@ -0,0 +1,91 @@
+"""Миграции на базе со старыми данными: производные таблицы заполняются сами."""
+import asyncio
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, insert, select
+
+from db import Answer, SchemaVersion, ScoreAggregate, SessionLocal, User, UserDayActivity, UserMedal, init_db
+from services.leaderboard import PERIODS, top_scores
+from services.streaks import get_streaks
+
+
+ANSWERED_AT = datetime(2026, 10, 16, 12, 30)
+# Очищаются перед каждым сценарием, зависимые — раньше
+TABLES = [UserMedal, ScoreAggregate, UserDayActivity, Answer, User]
+
+
+async def upgrade(users, answers=()):
+    """Данные «старой» базы и повторный прогон всех миграций."""
+    await init_db()
+    async with SessionLocal() as session:
+        for model in TABLES:
+            await session.execute(delete(model))
+        await session.execute(insert(User), users)
+        if answers:
+            await session.execute(insert(Answer), list(answers))
+        await session.execute(delete(SchemaVersion))
+        await session.commit()
+    await init_db()
+
+
+def test_medals_moved_to_user_medals():
+    async def scenario():
+        await upgrade(
+            [{'id': 1, 'tg_id': 101, 'medals': '🥇 🧠 🥇 '}, {'id': 2, 'tg_id': 102, 'medals': ''}],
+            [{'user_id': 1, 'question_id': 1, 'topic': 'movies', 'is_correct': True,
+              'date': ANSWERED_AT, 'answer_day': ANSWERED_AT.date()}],
+        )
+        async with SessionLocal() as session:
+            medals = (await session.execute(
+                select(UserMedal.user_id, UserMedal.medal, UserMedal.awarded_at)
+            )).all()
+            users = (await session.execute(
+                select(User.id, User.medals_count, User.last_medal_at).order_by(User.id)
+            )).all()
+        return medals, users
+
+    medals, users = asyncio.run(scenario())
+    assert sorted(m[1] for m in medals) == ['🥇', '🧠']
+    assert {m[2] for m in medals} == {ANSWERED_AT}
+    assert users[0][1:] == (2, ANSWERED_AT)
+    assert users[1][1] in (0, None)
+
+
+def test_score_aggregates_filled_from_answers():
+    day = ANSWERED_AT.date()
+
+    async def scenario():
+        await upgrade(
+            [{'id': 1, 'tg_id': 101}, {'id': 2, 'tg_id': 102}],
+            [
+                {'user_id': user_id, 'question_id': q, 'topic': 'movies', 'is_correct': correct,
+                 'date': ANSWERED_AT, 'answer_day': day}
+                for user_id, q, correct in [(1, 1, True), (1, 2, True), (1, 3, False), (2, 1, True)]
+            ],
+        )
+        async with SessionLocal() as session:
+            return {
+                period: [tuple(row) for row in await top_scores(session, period, day)]
+                for period in PERIODS
+            }
+
+    ratings = asyncio.run(scenario())
+    assert ratings == {period: [(1, 2), (2, 1)] for period in PERIODS}
+
+
+def test_day_activity_filled_from_answers():
+    days = [ANSWERED_AT - timedelta(days=i) for i in range(3)]
+
+    async def scenario():
+        await upgrade(
+            [{'id': 1, 'tg_id': 101}],
+            [
+                {'user_id': 1, 'question_id': 1, 'topic': 'movies', 'is_correct': False,
+                 'date': when, 'answer_day': when.date()}
+                for when in days
+            ],
+        )
+        async with SessionLocal() as session:
+            return await get_streaks(session, 1, today=ANSWERED_AT.date())
+
+    assert asyncio.run(scenario()) == (3, 3)
@@ -0,0 +1,54 @@
+import asyncio
+import random
+
+from sqlalchemy import delete, insert, select
+
+from db import QuestionSent, SessionLocal, User, init_db
+from services import planner
+from services.planner import pick_unsent, plan_topic_broadcast, save_sent
+
+
+QUESTIONS = [{'id': i} for i in range(1, 6)]
+USERS = [User(id=800 + i, tg_id=8800 + i, lang='ru') for i in range(3)]
+
+
+def test_pick_unsent_skips_sent():
+    rng = random.Random(1)
+    for _ in range(50):
+        assert pick_unsent(QUESTIONS, {1, 2, 3}, rng)['id'] in (4, 5)
+    # Случайные попытки почти всегда мимо — остаток берётся перебором
+    assert pick_unsent(QUESTIONS, {1, 2, 3, 4}, rng)['id'] == 5
+    assert pick_unsent(QUESTIONS, {q['id'] for q in QUESTIONS}, rng) is None
+    assert pick_unsent([], set(), rng) is None
+
+
+def test_save_sent_and_plan(monkeypatch):
+    monkeypatch.setattr(planner.question_bank, 'get', lambda topic, lang: QUESTIONS[:2])
+
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(QuestionSent))
+            await session.execute(delete(User).where(User.id.in_([u.id for u in USERS])))
+            await session.execute(insert(User), [{'id': u.id, 'tg_id': u.tg_id} for u in USERS])
+            first = await save_sent(session, 'movies', [(USERS[0], QUESTIONS[0]), (USERS[1], QUESTIONS[0])])
+            # Повтор той же пары пропускается
+            second = await save_sent(session, 'movies', [(USERS[0], QUESTIONS[0]), (USERS[0], QUESTIONS[1])])
+            await save_sent(session, 'cities', [(USERS[2], QUESTIONS[0])])
+            await session.commit()
+            rows = (await session.execute(
+                select(QuestionSent.user_id, QuestionSent.topic, QuestionSent.question_id)
+            )).all()
+            plan = await plan_topic_broadcast(session, 'movies', USERS, random.Random(1))
+        return first, second, rows, plan
+
+    first, second, rows, plan = asyncio.run(scenario())
+    assert first == {(800, 1), (801, 1)}
+    assert second == {(800, 2)}
+    assert sorted(rows) == [
+        (800, 'movies', 1), (800, 'movies', 2), (801, 'movies', 1), (802, 'cities', 1),
+    ]
+    # Первому вопросы кончились, второму остался только второй,
+    # третьему тема cities не мешает
+    assert [(user.id, q['id']) for user, q in plan if user.id != 802] == [(801, 2)]
+    assert [user.id for user, _ in plan] == [801, 802]
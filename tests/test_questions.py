@@ -0,0 +1,57 @@
+import json
+import os
+
+from services.questions import QuestionBank
+
+
+QUESTIONS = [
+    {'id': 1, 'question': 'Q1', 'options': ['a', 'b'], 'answer': 'a'},
+    {'id': 2, 'question': 'Q2', 'options': ['b', 'c'], 'answer': 'c'},
+]
+
+
+def write(path, questions, mtime_ns):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(questions, f)
+    # Явный mtime: на быстрой ФС две записи подряд могут получить одинаковый
+    os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_indexes(tmp_path):
+    write(tmp_path / 'movies_ru.json', QUESTIONS, 10 ** 18)
+    bank = QuestionBank(str(tmp_path))
+    assert bank.get('movies', 'ru') == QUESTIONS
+    assert bank.by_id('movies', 'ru', 2)['question'] == 'Q2'
+    assert bank.by_id('movies', 'ru', 3) is None
+    # Вариант из нескольких вопросов ведёт к первому
+    assert bank.by_option('movies', 'ru', 'b')['id'] == 1
+    assert bank.by_option('movies', 'ru', 'c')['id'] == 2
+    assert bank.get('movies', 'en') == []
+    assert bank.by_id('movies', 'en', 1) is None
+
+
+def test_reload_on_mtime_change(tmp_path):
+    path = tmp_path / 'movies_ru.json'
+    write(path, QUESTIONS, 10 ** 18)
+    bank = QuestionBank(str(tmp_path), check_interval=0)
+    assert len(bank.get('movies', 'ru')) == 2
+    write(path, QUESTIONS[:1], 10 ** 18 + 1)
+    assert len(bank.get('movies', 'ru')) == 1
+    assert bank.by_id('movies', 'ru', 2) is None
+    # Битый файл не теряет прежнюю версию
+    path.write_text('{', encoding='utf-8')
+    os.utime(path, ns=(10 ** 18 + 2, 10 ** 18 + 2))
+    assert len(bank.get('movies', 'ru')) == 1
+    path.unlink()
+    assert bank.get('movies', 'ru') == []
+
+
+def test_mtime_checked_once_per_interval(tmp_path):
+    path = tmp_path / 'movies_ru.json'
+    write(path, QUESTIONS, 10 ** 18)
+    bank = QuestionBank(str(tmp_path), check_interval=3600)
+    bank.load_all(topics=['movies'], langs=['ru'])
+    write(path, QUESTIONS[:1], 10 ** 18 + 1)
+    assert len(bank.get('movies', 'ru')) == 2
+    bank.forget('movies', 'ru')
+    assert len(bank.get('movies', 'ru')) == 1
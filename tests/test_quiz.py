@@ -0,0 +1,65 @@
+import asyncio
+from types import SimpleNamespace
+
+from handlers import quiz
+from keyboards.quiz import TOPIC_CODES, QuizAnswer, get_quiz_keyboard
+
+
+class FakeCallback:
+    def __init__(self):
+        self.from_user = SimpleNamespace(id=1)
+        self.sent = []
+        self.answered = False
+        self.message = SimpleNamespace(answer=self._answer)
+
+    async def _answer(self, text, **kwargs):
+        self.sent.append(text)
+
+    async def answer(self, *args, **kwargs):
+        self.answered = True
+
+
+def test_answer_without_user_is_not_recorded(monkeypatch):
+    async def fail(*args):
+        raise AssertionError('ответ без пользователя не должен записываться')
+
+    monkeypatch.setattr(quiz.db_writer, 'run', fail)
+    callback = FakeCallback()
+    q = {'id': 1, 'answer': 'a', 'options': ['a', 'b']}
+    asyncio.run(quiz.process_answer(callback, None, 'movies', q, 'a'))
+    assert callback.sent == ['Сначала нажмите /start.']
+    assert callback.answered
+
+
+def test_start_quiz_without_user():
+    callback = FakeCallback()
+    asyncio.run(quiz.start_quiz(callback, session=None, user=None, lang='ru'))
+    assert callback.sent == ['Сначала нажмите /start.']
+    assert callback.answered
+
+
+def test_keyboard_callback_data_fits_limit():
+    q = {'id': 2 ** 31, 'options': ['вариант с длинным названием'] * 4}
+    for topic in TOPIC_CODES:
+        markup = get_quiz_keyboard(q, topic, 'ru')
+        buttons = [b for row in markup.inline_keyboard for b in row]
+        assert [QuizAnswer.unpack(b.callback_data).o for b in buttons] == [0, 1, 2, 3]
+        assert all(len(b.callback_data.encode()) <= 64 for b in buttons)
+    assert QuizAnswer.unpack(buttons[0].callback_data) == QuizAnswer(t='s', l='ru', q=2 ** 31, o=0)
+
+
+def test_answer_resolves_question_by_id(monkeypatch):
+    q = {'id': 7, 'answer': 'b', 'options': ['a', 'b']}
+    answered = []
+
+    async def process_answer(callback, user, topic, question, chosen):
+        answered.append((topic, question['id'], chosen))
+
+    monkeypatch.setattr(quiz, 'process_answer', process_answer)
+    monkeypatch.setattr(quiz.question_bank, 'by_id', lambda topic, lang, qid: q if qid == 7 else None)
+    for o in (1, 2):
+        asyncio.run(quiz.answer_quiz(FakeCallback(), QuizAnswer(t='m', l='ru', q=7, o=o), user=None))
+    callback = FakeCallback()
+    asyncio.run(quiz.answer_quiz(callback, QuizAnswer(t='x', l='ru', q=7, o=0), user=None))
+    assert answered == [('movies', 7, 'b')]
+    assert callback.sent == ['Вопрос не найден.']
@@ -0,0 +1,50 @@
+import asyncio
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from sqlalchemy import delete, insert, select
+
+from db import SessionLocal, SingleWriter, User, init_db
+from services.reachability import (
+    CHAT_NOT_FOUND, FORBIDDEN, RATE_LIMITED, TRANSIENT, UnreachableTracker, classify_error,
+)
+
+
+def test_classify_error():
+    cases = [
+        (TelegramForbiddenError(method=None, message='Forbidden: bot was blocked by the user'), FORBIDDEN),
+        (TelegramForbiddenError(method=None, message='Forbidden: user is deactivated'), FORBIDDEN),
+        (TelegramBadRequest(method=None, message='Bad Request: chat not found'), CHAT_NOT_FOUND),
+        (TelegramBadRequest(method=None, message='Bad Request: message is too long'), TRANSIENT),
+        (TelegramRetryAfter(method=None, message='Too Many Requests', retry_after=5), RATE_LIMITED),
+        (TelegramNetworkError(method=None, message='timeout'), TRANSIENT),
+        (RuntimeError('boom'), TRANSIENT),
+    ]
+    assert [classify_error(error) for error, _ in cases] == [reason for _, reason in cases]
+
+
+def test_tracker_marks_users_in_batches():
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(User))
+            await session.execute(insert(User), [{'id': i, 'tg_id': 5500 + i} for i in range(1, 5)])
+            await session.commit()
+        tracker = UnreachableTracker(every=2, writer=SingleWriter(SessionLocal))
+        await tracker.add(5501, FORBIDDEN)
+        await tracker.add(5502, CHAT_NOT_FOUND)  # пачка набралась — запись
+        await tracker.add(5503, FORBIDDEN)
+        await tracker.flush()
+        async with SessionLocal() as session:
+            rows = (await session.execute(
+                select(User.tg_id, User.is_reachable, User.last_delivery_error)
+            )).all()
+        return tracker.marked, sorted(rows)
+
+    marked, rows = asyncio.run(scenario())
+    assert marked == 3
+    assert rows == [
+        (5501, False, FORBIDDEN),
+        (5502, False, CHAT_NOT_FOUND),
+        (5503, False, FORBIDDEN),
+        (5504, True, None),
+    ]
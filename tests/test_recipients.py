@@ -0,0 +1,47 @@
+import asyncio
+
+from sqlalchemy import delete, insert
+
+from db import SessionLocal, User, init_db
+from services.recipients import iter_recipient_chunks
+
+
+async def seed(count=25):
+    await init_db()
+    async with SessionLocal() as session:
+        await session.execute(delete(User))
+        await session.execute(insert(User), [
+            {'id': i, 'tg_id': 6000 + i, 'lang': 'en' if i % 2 else 'ru', 'is_reachable': i % 7 != 0}
+            for i in range(1, count + 1)
+        ])
+        await session.commit()
+
+
+async def collect(**kwargs):
+    return [[r.id for r in chunk] async for chunk in iter_recipient_chunks(**kwargs)]
+
+
+def test_keyset_chunks_skip_unreachable():
+    async def scenario():
+        await seed()
+        return await collect(chunk=10), await collect(chunk=3, id_range=(5, 12))
+
+    full, ranged = asyncio.run(scenario())
+    reachable = [i for i in range(1, 26) if i % 7 != 0]
+    assert [len(c) for c in full] == [10, 10, 2]
+    assert sum(full, []) == reachable
+    # Диапазон — полуинтервал [начало, конец)
+    assert ranged == [[5, 6, 8], [9, 10, 11]]
+
+
+def test_where_and_exact_last_chunk():
+    async def scenario():
+        await seed(count=6)
+        chunks = await collect(chunk=3, where=User.lang == 'en')
+        # Ровно заполненная последняя пачка — ещё один пустой запрос и конец
+        exact = await collect(chunk=3, id_range=(1, 4))
+        return chunks, exact
+
+    chunks, exact = asyncio.run(scenario())
+    assert chunks == [[1, 3, 5]]
+    assert exact == [[1, 2, 3]]
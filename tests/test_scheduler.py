@@ -0,0 +1,23 @@
+import pytest
+
+from services.scheduler import split_job_key, sync_url
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('sqlite+aiosqlite:///guessshotbot.db', 'sqlite:///guessshotbot.db'),
+    ('postgresql+asyncpg://bot:pw@db/bot', 'postgresql+psycopg2://bot:pw@db/bot'),
+    ('postgresql://bot:pw@db/bot', 'postgresql+psycopg2://bot:pw@db/bot'),
+    ('postgres://bot:pw@db:5432/bot', 'postgresql+psycopg2://bot:pw@db:5432/bot'),
+])
+def test_sync_url(url, expected):
+    assert sync_url(url) == expected
+
+
+def test_sync_url_unknown_backend():
+    with pytest.raises(ValueError):
+        sync_url('mysql+aiomysql://bot@db/bot')
+
+
+def test_split_job_key():
+    assert split_job_key('send_movie_question') == ('send_movie_question', None)
+    assert split_job_key('send_movie_question/UTC-03:30') == ('send_movie_question', 'UTC-03:30')
@@ -0,0 +1,111 @@
+import asyncio
+import json
+import queue
+
+from aiogram import Bot
+from aiogram.types import Update
+from sqlalchemy import delete, insert
+
+import sharded
+from db import SessionLocal, User, init_db
+from sharded import Coordinator, ShardWorker, id_ranges
+
+
+def make_update(update_id, tg_id, message_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': message_id,
+            'date': 0,
+            'chat': {'id': tg_id, 'type': 'private'},
+            'from': {'id': tg_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': 'hi',
+        },
+    }
+
+
+class FakeDispatcher:
+    def __init__(self, worker):
+        self.worker = worker
+        self.handled = []  # (tg_id, номер сообщения)
+        self.active = {}
+        self.overlaps = 0
+        self.max_tasks = 0
+
+    async def feed_update(self, bot, update):
+        tg_id = update.message.from_user.id
+        self.active[tg_id] = self.active.get(tg_id, 0) + 1
+        self.overlaps += self.active[tg_id] > 1
+        self.max_tasks = max(self.max_tasks, len(self.worker.tasks))
+        await asyncio.sleep(0.002 * (tg_id % 3))
+        self.handled.append((tg_id, update.message.message_id))
+        self.active[tg_id] -= 1
+
+
+def test_route_by_user():
+    async def scenario():
+        bot = Bot('42:TEST')
+        coordinator = Coordinator(bot, workers=3)
+        for i, tg_id in enumerate([10, 11, 12, 13, 10]):
+            update = Update.model_validate(make_update(i, tg_id, i), context={'bot': bot})
+            await coordinator.route(update)
+        await bot.session.close()
+        routed = []
+        for index, q in enumerate(coordinator.queues):
+            while True:
+                try:
+                    kind, raw = q.get(timeout=0.5)
+                except queue.Empty:
+                    break
+                routed.append((index, json.loads(raw)['message']['chat']['id']))
+        return routed
+
+    routed = asyncio.run(scenario())
+    assert sorted(routed) == [(0, 12), (1, 10), (1, 10), (1, 13), (2, 11)]
+
+
+def test_id_ranges_cover_all_users():
+    async def scenario():
+        await init_db()
+        async with SessionLocal() as session:
+            await session.execute(delete(User))
+            await session.commit()
+        empty = await id_ranges(3)
+        async with SessionLocal() as session:
+            await session.execute(insert(User), [{'id': i, 'tg_id': 5000 + i} for i in range(5, 106)])
+            await session.commit()
+        return empty, await id_ranges(4)
+
+    empty, ranges = asyncio.run(scenario())
+    assert empty == [None, None, None]
+    assert ranges[0][0] == 5 and ranges[-1][1] > 105
+    assert all(a[1] == b[0] for a, b in zip(ranges, ranges[1:]))
+
+
+def test_worker_keeps_order_and_bounds_pending():
+    users, per_user, limit = 6, 15, 4
+    q = queue.Queue()
+    for n in range(per_user):
+        for tg_id in range(1, users + 1):
+            q.put(('update', json.dumps(make_update(n * users + tg_id, tg_id, n))))
+    q.put(None)
+
+    async def scenario():
+        bot = Bot('42:TEST')
+        worker = ShardWorker(0, 1, q, concurrency=limit)
+        dp = FakeDispatcher(worker)
+        await asyncio.wait_for(worker.serve(dp, bot), 10)
+        await bot.session.close()
+        return dp
+
+    dp = asyncio.run(scenario())
+    assert len(dp.handled) == users * per_user
+    assert dp.overlaps == 0
+    assert 1 < dp.max_tasks <= limit
+    for tg_id in range(1, users + 1):
+        assert [n for t, n in dp.handled if t == tg_id] == list(range(per_user))
+
+
+def test_concurrency_default_fits_pool():
+    if sharded.UPDATE_SESSIONS is not None:
+        assert sharded.SHARD_CONCURRENCY <= sharded.UPDATE_SESSIONS
@@ -0,0 +1,173 @@
+import asyncio
+import os
+import random
+import signal
+import socket
+
+from aiogram import Bot
+from aiogram.types import Update
+from aiohttp import ClientSession
+from aiohttp.test_utils import TestClient, TestServer
+
+import webhook
+from webhook import SECRET_HEADER, WebhookServer
+
+
+SECRET = 'test-secret'
+
+
+class FakeDispatcher:
+    """Записывает обработанные апдейты и следит, что один пользователь не
+    обрабатывается двумя задачами сразу."""
+
+    def __init__(self, delay=0.005):
+        self.delay = delay
+        self.handled = []  # (tg_id, номер сообщения)
+        self.active = {}  # tg_id -> задач в работе
+        self.overlaps = 0
+        self.max_parallel = 0
+        self.events = []
+        self._rng = random.Random(1)
+
+    async def feed_update(self, bot, update):
+        tg_id = update.message.from_user.id
+        self.active[tg_id] = self.active.get(tg_id, 0) + 1
+        if self.active[tg_id] > 1:
+            self.overlaps += 1
+        self.max_parallel = max(self.max_parallel, sum(self.active.values()))
+        try:
+            await asyncio.sleep(self._rng.random() * self.delay)
+            self.handled.append((tg_id, update.message.message_id))
+        finally:
+            self.active[tg_id] -= 1
+
+    async def emit_startup(self, **kwargs):
+        self.events.append('startup')
+
+    async def emit_shutdown(self, **kwargs):
+        self.events.append('shutdown')
+
+    def resolve_used_update_types(self):
+        return ['message']
+
+
+def make_update(update_id, tg_id, message_id):
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': message_id,
+            'date': 0,
+            'chat': {'id': tg_id, 'type': 'private'},
+            'from': {'id': tg_id, 'is_bot': False, 'first_name': 'Test'},
+            'text': 'hi',
+        },
+    }
+
+
+def make_updates(users=5, per_user=20):
+    updates = [(tg_id, n) for n in range(per_user) for tg_id in range(1, users + 1)]
+    return [make_update(i, tg_id, n) for i, (tg_id, n) in enumerate(updates)]
+
+
+def assert_ordered(dp, users, per_user):
+    for tg_id in range(1, users + 1):
+        assert [n for t, n in dp.handled if t == tg_id] == list(range(per_user))
+
+
+def test_handle_responses_and_drain():
+    async def scenario():
+        dp = FakeDispatcher()
+        bot = Bot('42:TEST')
+        server = WebhookServer(dp, bot, secret=SECRET, workers=4)
+        async with TestClient(TestServer(server.make_app())) as client:
+            # Пока воркеры не запущены, апдейты не принимаются
+            response = await client.post(server.path, json=make_update(1, 1, 0))
+            assert response.status == 503
+
+            server.start_workers()
+            response = await client.post(server.path, json=make_update(1, 1, 0))
+            assert response.status == 401
+            headers = {SECRET_HEADER: SECRET}
+            response = await client.post(server.path, data='not json', headers=headers)
+            assert response.status == 400
+
+            updates = make_updates(users=5, per_user=20)
+            responses = await asyncio.gather(*(
+                client.post(server.path, json=update, headers=headers) for update in updates
+            ))
+            assert [r.status for r in responses] == [200] * len(updates)
+
+            await server.drain()
+            response = await client.post(server.path, json=make_update(1, 1, 0), headers=headers)
+            assert response.status == 503
+        await bot.session.close()
+        return server, dp
+
+    server, dp = asyncio.run(scenario())
+    assert len(dp.handled) == 100
+    assert server.stats()['processed'] == 100
+    assert server.stats()['queued'] == 0
+
+
+def test_per_user_order():
+    async def scenario():
+        dp = FakeDispatcher(delay=0.01)
+        bot = Bot('42:TEST')
+        server = WebhookServer(dp, bot, secret=None, workers=8)
+        server.start_workers()
+        for update in make_updates(users=4, per_user=25):
+            server.queue.put_nowait((Update.model_validate(update, context={'bot': bot}), 0.0))
+        await server.drain()
+        await bot.session.close()
+        return server, dp
+
+    server, dp = asyncio.run(scenario())
+    assert dp.overlaps == 0
+    assert dp.max_parallel > 1  # разные пользователи всё же идут параллельно
+    assert_ordered(dp, users=4, per_user=25)
+    assert len(server.locks) == 0
+
+
+def test_workers_capped_by_update_sessions(monkeypatch):
+    monkeypatch.setattr(webhook, 'UPDATE_SESSIONS', 3)
+    server = WebhookServer(FakeDispatcher(), bot=None, workers=16)
+    assert server.workers == 3
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_run_webhook_drains_on_sigterm(monkeypatch):
+    monkeypatch.setattr(webhook, 'WEBHOOK_URL', None)
+    port = _free_port()
+
+    async def scenario():
+        dp = FakeDispatcher()
+        bot = Bot('42:TEST')
+        task = asyncio.create_task(webhook.run_webhook(dp, bot, '127.0.0.1', port))
+        url = f'http://127.0.0.1:{port}{webhook.WEBHOOK_PATH}'
+        headers = {SECRET_HEADER: webhook.WEBHOOK_SECRET} if webhook.WEBHOOK_SECRET else {}
+        async with ClientSession() as http:
+            for _ in range(100):
+                try:
+                    async with http.post(url, json=make_update(0, 1, 0), headers=headers) as response:
+                        if response.status == 200:
+                            break
+                except OSError:
+                    pass
+                await asyncio.sleep(0.02)
+            updates = make_updates(users=3, per_user=10)[1:]
+            for update in updates:
+                async with http.post(url, json=update, headers=headers) as response:
+                    assert response.status == 200
+        os.kill(os.getpid(), signal.SIGTERM)
+        await asyncio.wait_for(task, 10)
+        return dp
+
+    dp = asyncio.run(scenario())
+    assert dp.events == ['startup', 'shutdown']
+    assert len(dp.handled) == 30
+    assert_ordered(dp, users=3, per_user=10)
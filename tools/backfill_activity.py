@@ -0,0 +1,21 @@
+"""Пересборка дневной активности (серии 🐢 и 📆) из таблицы answers.
+
+Запуск из корня проекта: python -m tools.backfill_activity
+"""
+import asyncio
+import logging
+
+from db import init_db, SessionLocal
+from services.streaks import backfill_activity
+
+
+async def main():
+    await init_db()
+    async with SessionLocal() as session:
+        await backfill_activity(session)
+        await session.commit()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,21 @@
+"""Пересборка рейтингов из таблицы answers.
+
+Запуск из корня проекта: python -m tools.backfill_leaderboard
+"""
+import asyncio
+import logging
+
+from db import init_db, SessionLocal
+from services.leaderboard import backfill
+
+
+async def main():
+    await init_db()
+    async with SessionLocal() as session:
+        await backfill(session)
+        await session.commit()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
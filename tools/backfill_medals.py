@@ -0,0 +1,21 @@
+"""Перенос медалей из строки users.medals в таблицу user_medals.
+
+Запуск из корня проекта: python -m tools.backfill_medals
+"""
+import asyncio
+import logging
+
+from db import init_db, SessionLocal
+from services.achievements import backfill_medals
+
+
+async def main():
+    await init_db()
+    async with SessionLocal() as session:
+        await backfill_medals(session)
+        await session.commit()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -0,0 +1,240 @@
+"""Синтетические данные для бенчмарков на реальном объёме.
+
+Генерирует пользователей, их ответы и отправленные вопросы за --days
+дней и сразу — производные таблицы, которые в работе ведёт запись
+ответа (score_aggregates, user_day_activity, score/streak/games_played
+в users), так что рейтинги, серии и рассылки можно мерить без backfill.
+
+Распределения:
+  * язык и часовой пояс — веса вида ru=0.7,en=0.3;
+  * активность — доля игроков (--active-share); вероятность, что игрок
+    играет в конкретный день, у каждого своя ~ Beta(--activity);
+  * точность — у каждого игрока своя ~ Beta(--accuracy);
+  * ответов за игровой день — от 1 до --answers-per-day;
+  * отправленные вопросы — на каждый ответ плюс рассылки без ответа
+    (в день без игры с вероятностью --unanswered-share).
+
+Вопросы берутся с id 1..--questions в каждой теме; у пользователя они
+не повторяются, как и в рабочей базе.
+
+Результат зависит только от аргументов: одинаковые --seed и параметры
+на пустой базе дают одинаковые данные (даты — за --days дней до
+сегодняшнего). Новые пользователи добавляются после существующих.
+
+Пишет bulk insert'ами, пачками по --chunk пользователей, в базу из
+DATABASE_URL. Запуск из корня проекта:
+    python -m tools.seed --users 1000000 --days 30 --seed 1
+"""
+import argparse
+import asyncio
+import logging
+import random
+import time
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import func, insert, select
+
+from db import Answer, QuestionSent, ScoreAggregate, SessionLocal, User, UserDayActivity, init_db
+from services.leaderboard import PERIODS, period_key
+from services.questions import TOPICS
+
+
+# tg_id синтетических пользователей: SEED_TG_ID + users.id
+SEED_TG_ID = 9_000_000_000_000
+# Темы рассылок по расписанию: вопрос о фильме и о городе
+BROADCAST_TOPICS = ('movies', 'cities')
+
+
+def parse_weights(text):
+    """'ru=0.7,en=0.3' -> (['ru', 'en'], [0.7, 0.3])."""
+    names, weights = [], []
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        names.append(name.strip())
+        weights.append(float(weight or 1))
+    return names, weights
+
+
+def parse_beta(text):
+    """'2,5' -> (2.0, 5.0) — параметры Beta-распределения."""
+    a, b = (float(x) for x in text.split(','))
+    return a, b
+
+
+class UserGenerator:
+    """Строки всех таблиц для одного пользователя; весь случай — из rng."""
+
+    def __init__(self, args, rng):
+        self.args = args
+        self.rng = rng
+        self.langs = parse_weights(args.langs)
+        self.timezones = parse_weights(args.timezones)
+        self.activity = parse_beta(args.activity)
+        self.accuracy = parse_beta(args.accuracy)
+        self.first_day = date.today() - timedelta(days=args.days - 1)
+
+    def _questions(self):
+        """Функция «следующий неотправленный вопрос темы» для одного пользователя."""
+        rng, total = self.rng, self.args.questions
+        start = {topic: rng.randrange(total) for topic in TOPICS}
+        used = dict.fromkeys(TOPICS, 0)
+
+        def next_question(topic):
+            if used[topic] >= total:
+                return None
+            used[topic] += 1
+            return (start[topic] + used[topic] - 1) % total + 1
+        return next_question
+
+    def _moment(self, day):
+        return datetime.combine(day, datetime.min.time()) + timedelta(seconds=self.rng.randrange(86400))
+
+    def user(self, user_id):
+        rng = self.rng
+        return {
+            'id': user_id,
+            'tg_id': SEED_TG_ID + user_id,
+            'lang': rng.choices(*self.langs)[0],
+            'timezone': rng.choices(*self.timezones)[0],
+            'score': 0, 'streak': 0, 'games_played': 0,
+            'medals_count': 0, 'referrals_count': 0,
+        }
+
+    def history(self, user, rows):
+        """Дописывает в rows ответы и отправки пользователя и считает его счётчики."""
+        rng, args = self.rng, self.args
+        user_id = user['id']
+        player = rng.random() < args.active_share
+        activity = rng.betavariate(*self.activity) if player else 0.0
+        accuracy = rng.betavariate(*self.accuracy) if player else 0.0
+        next_question = self._questions()
+        scores = {}
+        for offset in range(args.days):
+            day = self.first_day + timedelta(days=offset)
+            if player and rng.random() < activity:
+                answered = correct = 0
+                for _ in range(rng.randint(1, args.answers_per_day)):
+                    topic = rng.choice(TOPICS)
+                    question_id = next_question(topic)
+                    if question_id is None:
+                        continue
+                    sent_at = self._moment(day)
+                    answered_at = min(sent_at + timedelta(seconds=rng.randrange(5, 600)),
+                                      datetime.combine(day, datetime.max.time()))
+                    is_correct = rng.random() < accuracy
+                    rows['questions_sent'].append({
+                        'user_id': user_id, 'question_id': question_id, 'topic': topic, 'sent_at': sent_at,
+                    })
+                    rows['answers'].append({
+                        'user_id': user_id, 'question_id': question_id, 'topic': topic,
+                        'is_correct': is_correct, 'date': answered_at, 'answer_day': day,
+                    })
+                    answered += 1
+                    user['games_played'] += 1
+                    if is_correct:
+                        correct += 1
+                        user['score'] += 1
+                        user['streak'] += 1
+                        for period_type in PERIODS:
+                            key = (period_type, period_key(period_type, day))
+                            scores[key] = scores.get(key, 0) + 1
+                    else:
+                        user['streak'] = 0
+                if answered:
+                    rows['user_day_activity'].append({
+                        'user_id': user_id, 'day': day, 'answers': answered, 'correct': correct,
+                    })
+            elif rng.random() < args.unanswered_share:
+                topic = BROADCAST_TOPICS[offset % len(BROADCAST_TOPICS)]
+                question_id = next_question(topic)
+                if question_id is not None:
+                    rows['questions_sent'].append({
+                        'user_id': user_id, 'question_id': question_id, 'topic': topic,
+                        'sent_at': self._moment(day),
+                    })
+        rows['score_aggregates'].extend(
+            {'user_id': user_id, 'period_type': t, 'period_key': k, 'score': score}
+            for (t, k), score in scores.items()
+        )
+
+
+TABLES = [
+    ('users', User),
+    ('questions_sent', QuestionSent),
+    ('answers', Answer),
+    ('user_day_activity', UserDayActivity),
+    ('score_aggregates', ScoreAggregate),
+]
+
+
+async def seed(args):
+    await init_db()
+    async with SessionLocal() as session:
+        first_id = (await session.execute(select(func.coalesce(func.max(User.id), 0)))).scalar_one() + 1
+    generator = UserGenerator(args, random.Random(args.seed))
+    totals = {name: 0 for name, _ in TABLES}
+    started = time.perf_counter()
+    for low in range(first_id, first_id + args.users, args.chunk):
+        high = min(low + args.chunk, first_id + args.users)
+        rows = {name: [] for name, _ in TABLES}
+        for user_id in range(low, high):
+            user = generator.user(user_id)
+            generator.history(user, rows)
+            rows['users'].append(user)
+        # Пачка пользователей — одна транзакция; пользователи раньше, чем ссылки на них
+        async with SessionLocal() as session:
+            for name, model in TABLES:
+                table_rows = rows[name]
+                for i in range(0, len(table_rows), args.batch):
+                    await session.execute(insert(model), table_rows[i:i + args.batch])
+                totals[name] += len(table_rows)
+            await session.commit()
+        elapsed = time.perf_counter() - started
+        logging.info(
+            f'Seed: {high - first_id}/{args.users} users, '
+            f"{totals['answers']} answers, {totals['questions_sent']} sent за {elapsed:.0f}с"
+        )
+    if args.users:
+        await fix_sequences()
+    return totals
+
+
+async def fix_sequences():
+    # id пользователей заданы явно — последовательность PostgreSQL об этом не знает
+    async with SessionLocal() as session:
+        if session.bind.dialect.name != 'postgresql':
+            return
+        await session.execute(select(func.setval(
+            func.pg_get_serial_sequence('users', 'id'), select(func.max(User.id)).scalar_subquery()
+        )))
+        await session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетические пользователи, ответы и отправки')
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--questions', type=int, default=500, help='вопросов в каждой теме')
+    parser.add_argument('--active-share', type=float, default=0.6, help='доля игроков')
+    parser.add_argument('--activity', default='1,4', help='Beta(a,b): вероятность игры в день')
+    parser.add_argument('--accuracy', default='4,3', help='Beta(a,b): доля верных ответов')
+    parser.add_argument('--answers-per-day', type=int, default=3)
+    parser.add_argument('--unanswered-share', type=float, default=0.3,
+                        help='вероятность рассылки без ответа в день без игры')
+    parser.add_argument('--langs', default='ru=0.7,en=0.3')
+    parser.add_argument(
+        '--timezones',
+        default='Europe/Moscow=0.55,Europe/Kaliningrad=0.05,Europe/Samara=0.1,'
+                'Asia/Yekaterinburg=0.12,Asia/Novosibirsk=0.1,Asia/Vladivostok=0.05,Europe/Berlin=0.03',
+    )
+    parser.add_argument('--chunk', type=int, default=2000, help='пользователей на транзакцию')
+    parser.add_argument('--batch', type=int, default=5000, help='строк на один insert')
+    args = parser.parse_args()
+    totals = asyncio.run(seed(args))
+    logging.info('Seed done: ' + ', '.join(f'{name}={count}' for name, count in totals.items()))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
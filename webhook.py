@@ -0,0 +1,162 @@
+"""Приём обновлений через вебхук вместо long polling.
+
+aiohttp-сервер принимает POST от Telegram, проверяет секретный токен и
+кладёт обновление в очередь; WEBHOOK_WORKERS задач разбирают очередь
+через dp.feed_update. Апдейты одного пользователя обрабатываются по
+одному и в порядке прихода (services.ordering.KeyLocks), разные
+пользователи — параллельно. Воркеров не больше db.UPDATE_SESSIONS:
+каждый держит сессию БД. Ответ Telegram отдаётся сразу после постановки
+в очередь, полная очередь притормаживает приём. При остановке сервер
+перестаёт принимать запросы и дожидается обработки уже принятых.
+
+Проверка на localhost:
+    curl -X POST localhost:8080/webhook \\
+        -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>' \\
+        -H 'Content-Type: application/json' -d '{"update_id": 1, ...}'
+"""
+import asyncio
+import hmac
+import logging
+import os
+import signal
+import time
+from collections import deque
+
+from aiogram.types import Update
+from aiohttp import web
+
+from db import UPDATE_SESSIONS
+from services.ordering import KeyLocks, update_key
+
+
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # публичный адрес, например https://bot.example.com
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', '16'))
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', '1000'))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv('WEBHOOK_DRAIN_TIMEOUT', '30'))
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+
+class WebhookServer:
+    def __init__(self, dp, bot, path=WEBHOOK_PATH, secret=WEBHOOK_SECRET,
+                 workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE):
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret = secret
+        if UPDATE_SESSIONS is not None and workers > UPDATE_SESSIONS:
+            logging.warning(f'WEBHOOK_WORKERS={workers} exceeds DB update sessions, using {UPDATE_SESSIONS}')
+            workers = UPDATE_SESSIONS
+        self.workers = workers
+        self.locks = KeyLocks()  # по tg_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.accepting = False
+        self.processed = 0
+        self.failed = 0
+        # Время от приёма запроса до конца обработки, последние 10000 апдейтов
+        self.latencies = deque(maxlen=10000)
+        self._tasks = []
+
+    def make_app(self):
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def handle(self, request):
+        if not self.accepting:
+            # Telegram повторит запрос — его заберёт другой воркер или мы после рестарта
+            return web.Response(status=503)
+        if self.secret and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ''), self.secret
+        ):
+            return web.Response(status=401)
+        received = time.perf_counter()
+        try:
+            update = Update.model_validate(await request.json(), context={'bot': self.bot})
+        except Exception:
+            return web.Response(status=400)
+        await self.queue.put((update, received))
+        return web.Response()
+
+    async def _worker(self):
+        while True:
+            update, received = await self.queue.get()
+            try:
+                # Замок берётся сразу после get, без переключения задач, —
+                # апдейты пользователя обрабатываются в порядке очереди
+                async with self.locks.hold(update_key(update)):
+                    await self.dp.feed_update(self.bot, update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logging.exception(f'Webhook update {update.update_id} failed')
+            finally:
+                self.latencies.append(time.perf_counter() - received)
+                self.queue.task_done()
+
+    def start_workers(self):
+        self.accepting = True
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def drain(self, timeout=WEBHOOK_DRAIN_TIMEOUT):
+        """Перестаёт принимать апдейты и ждёт обработки принятых."""
+        self.accepting = False
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logging.warning(f'Webhook drain timed out, {self.queue.qsize()} updates dropped')
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        pick = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))] if latencies else 0.0
+        return {
+            'processed': self.processed,
+            'failed': self.failed,
+            'queued': self.queue.qsize(),
+            'p50_ms': pick(0.5) * 1000,
+            'p99_ms': pick(0.99) * 1000,
+        }
+
+
+async def run_webhook(dp, bot, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+    """Запускает бота в режиме вебхука до SIGINT/SIGTERM."""
+    server = WebhookServer(dp, bot)
+    runner = web.AppRunner(server.make_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    await dp.emit_startup(bot=bot, dispatcher=dp)
+    server.start_workers()
+    await site.start()
+    if WEBHOOK_URL:
+        await bot.set_webhook(
+            WEBHOOK_URL.rstrip('/') + server.path,
+            secret_token=server.secret,
+            allowed_updates=dp.resolve_used_update_types(),
+        )
+    logging.info(f'Webhook listening on {host}:{port}{server.path}')
+    try:
+        await stop.wait()
+    finally:
+        logging.info('Webhook stopping, draining updates')
+        await server.drain()
+        await runner.cleanup()
+        await dp.emit_shutdown(bot=bot, dispatcher=dp)
+        logging.info(f'Webhook stopped: {server.stats()}')
+        await bot.session.close()